@@ -0,0 +1,122 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# ==========================================================
+#  Caché semántica de respuestas
+#
+#  Por documento se guardan las respuestas ya generadas junto con el
+#  embedding de su pregunta. Una pregunta nueva cuyo embedding se parezca
+#  lo suficiente (coseno >= threshold) a una guardada, con el mismo
+#  modelo, versión del prompt y top_k, recibe esa respuesta sin llamar al
+#  LLM. Las entradas vencen a los `ttl` segundos y, pasado el tope, se
+#  descartan las usadas hace más tiempo. Reindexar o borrar el documento
+#  descarta sus respuestas.
+# ==========================================================
+
+class AnswerCache:
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()     # id -> entrada, en orden de uso
+        self._by_doc = {}                 # doc_id -> {id: entrada}
+        self._epochs = {}                 # doc_id -> invalidaciones
+        self._generation = 0              # vaciados completos
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def epoch(self, doc_id: str) -> tuple:
+        """Se pasa a `put`: si el documento cambió entre medio, no se guarda."""
+        return self._generation, self._epochs.get(doc_id, 0)
+
+    def get(self, doc_id: str, key: tuple, q_emb: np.ndarray):
+        """Entrada más parecida por encima del umbral (dict con answer y sources), o None."""
+        q = _unit(q_emb)
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for entry_id, entry in list(self._by_doc.get(doc_id, {}).items()):
+                if now - entry["at"] > self.ttl:
+                    self._remove(entry_id)
+                    self.expired += 1
+                elif entry["key"] == key:
+                    candidates.append(entry)
+
+            if q is not None and candidates:
+                sims = np.stack([e["emb"] for e in candidates]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    entry = candidates[best]
+                    self._entries.move_to_end(entry["id"])
+                    self.hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, doc_id: str, key: tuple, q_emb: np.ndarray, answer: str, sources: list, epoch: tuple):
+        q = _unit(q_emb)
+        if q is None or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            if self.epoch(doc_id) != epoch:
+                return      # reindexado o borrado mientras se generaba
+
+            entry_id = next(self._ids)
+            entry = {
+                "id": entry_id, "doc_id": doc_id, "key": key, "emb": q,
+                "answer": answer, "sources": list(sources), "at": time.time(),
+            }
+            self._entries[entry_id] = entry
+            self._by_doc.setdefault(doc_id, {})[entry_id] = entry
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, doc_id: str):
+        with self._lock:
+            self._epochs[doc_id] = self._epochs.get(doc_id, 0) + 1
+            for entry_id in list(self._by_doc.get(doc_id, {})):
+                self._remove(entry_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_doc.clear()
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        by_doc = self._by_doc[entry["doc_id"]]
+        del by_doc[entry_id]
+        if not by_doc:
+            del self._by_doc[entry["doc_id"]]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "documents": len(self._by_doc),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+
+def _unit(v: np.ndarray):
+    v = np.asarray(v, dtype="float32")
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else None
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+
+from .config import (
+    BULK_DIR, BULK_MAX_ITEMS, BULK_UNPACKED_MAX_BYTES, JOBS_RETENTION, UPLOADS_DIR, UPLOAD_MAX_BYTES,
+    UPLOAD_CHUNK_SIZE,
+)
+from .ingest import ALLOWED_EXTENSIONS, PayloadTooLargeError, resolve_url
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+#  Ingesta masiva: un ZIP o una lista de URLs en una sola petición
+#
+#  Cada documento del lote es un trabajo de ingesta común (ver jobs.py)
+#  en la cola de lotes, que tiene sus propios workers, así que extracción
+#  y embeddings de varios documentos corren a la vez. Las URLs se bajan
+#  con el cliente HTTP compartido (con tope de descargas por host). El
+#  lote queda en BULK_DIR/<id>.json con el trabajo de cada elemento;
+#  su estado se arma con el de esos trabajos. Los lotes se borran pasados
+#  JOBS_RETENTION segundos, como los registros de sus trabajos.
+# ==========================================================
+
+class BulkError(ValueError):
+    """Lote inválido: ZIP ilegible, sin elementos o con demasiados."""
+
+
+def _path(bulk_id: str) -> str:
+    return os.path.join(BULK_DIR, f"{bulk_id}.json")
+
+
+def _check_count(n: int):
+    if n == 0:
+        raise BulkError("El lote no tiene documentos")
+    if n > BULK_MAX_ITEMS:
+        raise BulkError(f"Máximo {BULK_MAX_ITEMS} documentos por lote ({n} recibidos)")
+
+
+# ------------------------------------------------------
+#  Elementos: miembros de un ZIP o URLs
+# ------------------------------------------------------
+
+def _skipped(name: str) -> bool:
+    # metadatos que agregan macOS y compañía al comprimir
+    return name.startswith("__MACOSX/") or os.path.basename(name).startswith(".")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _unpacked_too_large() -> PayloadTooLargeError:
+    return PayloadTooLargeError(
+        f"El ZIP descomprimido supera el límite de {BULK_UNPACKED_MAX_BYTES / (1024 * 1024):.0f} MB"
+    )
+
+
+def _extract_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo, path: str, budget: int) -> int:
+    """
+    Copia el miembro a `path` por bloques y devuelve los bytes escritos;
+    el tamaño declarado puede mentir. Pasar de `budget` (lo que queda del
+    tope del lote) es PayloadTooLargeError.
+    """
+    written = 0
+    try:
+        with archive.open(member) as src, open(path, "wb") as out:
+            while block := src.read(UPLOAD_CHUNK_SIZE):
+                written += len(block)
+                if written > UPLOAD_MAX_BYTES:
+                    raise ValueError("Supera el límite de tamaño por documento")
+                if written > budget:
+                    raise _unpacked_too_large()
+                out.write(block)
+    except BaseException:
+        _remove(path)
+        raise
+    return written
+
+
+def unpack_archive(path: str) -> list[dict]:
+    """
+    Extrae los documentos del ZIP a UPLOADS_DIR (bloqueante: llamar en
+    un hilo). Devuelve un elemento por miembro; los que no se pueden
+    ingerir llevan `error` en vez de `path`. Si el contenido descomprimido
+    pasa de BULK_UNPACKED_MAX_BYTES (según los tamaños declarados, antes de
+    extraer nada, o según lo escrito) es PayloadTooLargeError.
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise BulkError(f"ZIP ilegible: {e}")
+
+    items = []
+    with archive:
+        members = [m for m in archive.infolist() if not m.is_dir() and not _skipped(m.filename)]
+        _check_count(len(members))
+
+        for member in members:
+            filename = os.path.basename(member.filename)
+            item = {"source": member.filename, "filename": filename}
+            if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+                item["error"] = "Formato no soportado (solo .txt, .pdf, .docx, .odt)"
+            elif member.file_size > UPLOAD_MAX_BYTES:
+                item["error"] = "Supera el límite de tamaño por documento"
+            items.append(item)
+
+        wanted = [(m, item) for m, item in zip(members, items) if "error" not in item]
+        if sum(m.file_size for m, _ in wanted) > BULK_UNPACKED_MAX_BYTES:
+            raise _unpacked_too_large()
+
+        budget = BULK_UNPACKED_MAX_BYTES
+        try:
+            for member, item in wanted:
+                document_id = str(uuid.uuid4())
+                ext = os.path.splitext(item["filename"])[1].lower()
+                target = os.path.join(UPLOADS_DIR, f"{document_id}{ext}")
+                try:
+                    budget -= _extract_member(archive, member, target, budget)
+                except PayloadTooLargeError:
+                    raise
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError, ValueError, OSError) as e:
+                    # CRC inválido, compresión no soportada, cifrado, demasiado grande
+                    item["error"] = f"No se pudo extraer: {e}"
+                else:
+                    item.update(document_id=document_id, path=target)
+        except PayloadTooLargeError:
+            # tamaños declarados falsos: no queda nada de lo ya extraído
+            for item in items:
+                if "path" in item:
+                    _remove(item["path"])
+            raise
+
+    return items
+
+
+def url_items(urls: list[str]) -> list[dict]:
+    """Un elemento por URL (con los enlaces de Google Docs/Drive ya convertidos)."""
+    urls = [u.strip() for u in urls if u.strip()]
+    _check_count(len(urls))
+
+    items = []
+    for original_url in urls:
+        item = {"source": original_url, "filename": "remote_file"}
+        try:
+            item["url"] = resolve_url(original_url)
+        except ValueError as e:
+            item["error"] = str(e)
+        else:
+            item.update(document_id=str(uuid.uuid4()), original_url=original_url)
+        items.append(item)
+    return items
+
+
+# ------------------------------------------------------
+#  Lote
+# ------------------------------------------------------
+
+def prune() -> int:
+    """Borra los lotes creados hace más de JOBS_RETENTION segundos."""
+    limit = time.time() - JOBS_RETENTION
+    removed = 0
+    for name in os.listdir(BULK_DIR):
+        path = os.path.join(BULK_DIR, name)
+        try:
+            if name.endswith(".json") and os.path.getmtime(path) < limit:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        log.info("🧹 %d lotes vencidos eliminados", removed)
+    return removed
+
+
+def submit(jobs, items: list[dict], kind: str) -> dict:
+    """Encola un trabajo por elemento válido y guarda el lote."""
+    prune()
+    bulk = {"id": str(uuid.uuid4()), "kind": kind, "created_at": time.time(), "items": []}
+
+    for index, item in enumerate(items):
+        entry = {"index": index, "source": item["source"]}
+        if "error" in item:
+            entry["error"] = item["error"]
+        else:
+            fields = {k: item[k] for k in ("document_id", "filename", "path", "url", "original_url") if k in item}
+            job = jobs.submit(bulk_id=bulk["id"], **fields)
+            entry.update(job_id=job["id"], document_id=item["document_id"])
+        bulk["items"].append(entry)
+
+    tmp = _path(bulk["id"]) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(bulk, f)
+    os.replace(tmp, _path(bulk["id"]))
+
+    queued = sum(1 for e in bulk["items"] if "job_id" in e)
+    log.info(
+        "📚 Lote %s: %d documentos encolados, %d descartados", bulk["id"], queued, len(items) - queued,
+        extra={"bulk_id": bulk["id"]},
+    )
+    return bulk
+
+
+def status(jobs, bulk_id: str):
+    """Estado del lote con el de cada elemento, o None si no existe."""
+    try:
+        with open(_path(bulk_id), "r", encoding="utf-8") as f:
+            bulk = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    items, counts = [], {}
+    for entry in bulk["items"]:
+        item = dict(entry, stage="skipped", progress=0.0)
+        if "job_id" in entry:
+            job = jobs.get(entry["job_id"]) or {"stage": "error", "error": "Trabajo no encontrado"}
+            item.update(
+                stage=job["stage"], progress=job.get("progress", 0.0),
+                n_chunks=job.get("n_chunks", 0), error=job.get("error"),
+            )
+        counts[item["stage"]] = counts.get(item["stage"], 0) + 1
+        items.append(item)
+
+    pending = sum(n for stage, n in counts.items() if stage not in ("done", "error", "skipped"))
+    return {
+        "id": bulk["id"],
+        "kind": bulk["kind"],
+        "created_at": bulk["created_at"],
+        "total": len(items),
+        "finished": pending == 0,
+        "counts": counts,
+        "items": items,
+    }
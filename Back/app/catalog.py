@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+#  Catálogo de documentos (SQLite en modo WAL)
+#
+#  Una fila por documento: metadatos y fechas. Las búsquedas por id usan
+#  la clave primaria y los listados paginan con índices sobre la fecha de
+#  alta y el nombre de archivo, sin cargar el catálogo entero en memoria.
+#  Reemplaza al docs.json, que se importa una sola vez al abrir.
+#
+#  Con varios workers cada proceso abre su propia conexión. Toda alta,
+#  actualización o baja deja una fila en `changes`; los demás procesos
+#  notan que hubo escrituras con PRAGMA data_version (sin leer tablas) y
+#  recién ahí leen qué documentos cambiaron para invalidar sus cachés.
+# ==========================================================
+
+COLUMNS = ("id", "filename", "size", "n_chunks")
+
+# filas de `changes` que se conservan; un proceso más atrasado que esto
+# invalida todo en vez de documento por documento
+CHANGES_KEEP = 10000
+
+ORDERS = {
+    "created": "created_at ASC, id ASC",
+    "recent": "created_at DESC, id DESC",
+    "filename": "filename COLLATE NOCASE ASC, id ASC",
+    "size": "size DESC, id ASC",
+}
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class Catalog:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER NOT NULL,"
+            " n_chunks INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_created ON documents(created_at, id)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS documents_filename ON documents(filename COLLATE NOCASE, id)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, doc_id: str):
+        """Fila del documento como dict, o None."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def version(self, doc_id: str):
+        """Fecha de la última alta o actualización (cambia al reindexar), o None."""
+        with self._lock:
+            row = self._db.execute("SELECT updated_at FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, doc: dict):
+        """Alta o actualización; una actualización conserva la fecha de alta."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO documents (id, filename, size, n_chunks, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET filename = excluded.filename,"
+                " size = excluded.size, n_chunks = excluded.n_chunks, updated_at = excluded.updated_at",
+                (doc["id"], doc["filename"], doc["size"], doc["n_chunks"], now, now),
+            )
+            self._log_change(doc["id"], now)
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock, self._db:
+            deleted = self._db.execute("DELETE FROM documents WHERE id = ?", (doc_id,)).rowcount > 0
+            self._log_change(doc_id, time.time())
+        return deleted
+
+    # ------------------------------------------------------
+    #  Cambios (invalidación entre procesos)
+    # ------------------------------------------------------
+
+    def _log_change(self, doc_id: str, now: float):
+        seq = self._db.execute("INSERT INTO changes (doc_id, at) VALUES (?, ?)", (doc_id, now)).lastrowid
+        if seq % 1000 == 0:
+            self._db.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGES_KEEP,))
+
+    def data_version(self) -> int:
+        """Cambia cuando otra conexión (otro proceso) escribió en la base."""
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def last_change(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changes_since(self, seq: int):
+        """
+        (doc_ids, último seq) cambiados después de `seq`. doc_ids es None
+        si ya se purgaron cambios de ese tramo: hay que invalidar todo.
+        """
+        with self._lock:
+            first = self._db.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            rows = self._db.execute(
+                "SELECT seq, doc_id FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        if not rows:
+            return set(), seq
+        last = rows[-1][0]
+        if first is not None and first > seq + 1:
+            return None, last
+        return {r[1] for r in rows}, last
+
+    def ids(self) -> list[str]:
+        with self._lock:
+            return [r[0] for r in self._db.execute("SELECT id FROM documents ORDER BY created_at, id")]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def page(self, limit: int, offset: int = 0, query: str | None = None,
+             order: str = "created") -> tuple[list[dict], int]:
+        """
+        (filas, total) de una página del listado. `query` filtra por
+        nombre de archivo (contiene, sin distinguir mayúsculas).
+        """
+        where, params = "", []
+        if query:
+            where, params = "WHERE filename LIKE ? ESCAPE '\\'", [_like_pattern(query)]
+
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM documents {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM documents {where}"
+                f" ORDER BY {ORDERS[order]} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(r) for r in rows], total
+
+    def import_json(self, path: str) -> int:
+        """
+        Migración única desde docs.json: se importa en una transacción y el
+        archivo se renombra a .imported. Si no se puede leer, queda donde
+        está (no se pierde nada) y se reintenta en el próximo arranque.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("❌ No se pudo importar %s al catálogo: %s", path, e)
+            return 0
+
+        # conserva el orden del docs.json como orden de alta
+        base = os.path.getmtime(path) - len(data) * 1e-3
+        rows = [
+            (doc_id, meta["filename"], int(meta["size"]), int(meta["n_chunks"]),
+             base + i * 1e-3, base + i * 1e-3)
+            for i, (doc_id, meta) in enumerate(data.items())
+        ]
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        os.replace(path, f"{path}.imported")
+        log.info("🔄 Catálogo: %d documentos importados desde %s", len(rows), path)
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
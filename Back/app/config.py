@@ -4,19 +4,158 @@ import os
 #  CONFIG GENERAL RAG
 # ==========================
 
+# Logging: nivel (debug, info, warning, error) y formato ("text" o "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
 # Ollama API URL
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
+# Planificador de llamadas a Ollama (por proceso): peticiones en vuelo
+# entre chat y embeddings, y preguntas interactivas que pueden esperar
+# cupo antes de responder 429
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "4"))
+OLLAMA_QUEUE_MAX = int(os.getenv("OLLAMA_QUEUE_MAX", "32"))
+
+# Cuánto mantiene Ollama los modelos en memoria después de cada llamada
+# (keep_alive: "30m", "1h"; -1 = siempre). Por defecto no se envía y
+# manda la configuración de Ollama (OLLAMA_KEEP_ALIVE del servidor): -1
+# dejaría los modelos fijos en la GPU aunque nadie pregunte.
+# Con WARMUP_ENABLED=1, al arrancar se cargan los dos modelos en segundo
+# plano para que la primera pregunta no pague la carga (ver warmup.py)
+_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "").strip()
+OLLAMA_KEEP_ALIVE = int(_keep_alive) if _keep_alive.lstrip("-").isdigit() else _keep_alive
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
 # Modelo PRINCIPAL (LLM) — el que responde
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3:instruct")
 
+# Ventana de contexto del LLM (se envía como num_ctx), tokens reservados
+# para la respuesta y tope opcional de tokens de contexto (0 = lo que
+# entre en la ventana). Sin el tokenizador del modelo, los tokens se
+# estiman como caracteres / CONTEXT_CHARS_PER_TOKEN
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+LLM_ANSWER_TOKENS = int(os.getenv("LLM_ANSWER_TOKENS", "512"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+
 # Modelo para embeddings — mxbai es el correcto y recomendado
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "mxbai-embed-large")
 
+# Embeddings en lote: textos por petición, peticiones en vuelo y reintentos
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "0.5"))
+
+# Caché persistente de embeddings (clave: modelo + hash del texto normalizado)
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "20000"))
+
+# Chunking al indexar: "fixed" (ventana fija de palabras, el comportamiento
+# original) o "content" (cortes definidos por el contenido, estables ante
+# ediciones: al reindexar se reutilizan más embeddings). "content" cambia
+# los límites de los chunks y con ellos qué recupera cada pregunta, así
+# que se activa a mano
+CHUNKER = os.getenv("CHUNKER", "fixed")
+
+# Almacenamiento de embeddings en índices nuevos: "float32", "float16" o
+# "int8" (escala por fila). Con EMBED_KEEP_FLOAT32=1 se guarda también la
+# float32 en disco y la lista corta de la pasada cuantizada (top_k x
+# RESCORE_FACTOR) se reordena con similitud exacta
+EMBED_STORAGE = os.getenv("EMBED_STORAGE", "float32")
+EMBED_KEEP_FLOAT32 = os.getenv("EMBED_KEEP_FLOAT32", "1") == "1"
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+
 # Directorios de almacenamiento
 DATA_DIR = "data"
 DOCS_DIR = os.path.join(DATA_DIR, "docs")
 INDEX_DIR = os.path.join(DATA_DIR, "indexes")
+EMBED_CACHE_PATH = os.path.join(DATA_DIR, "embedding_cache.sqlite")
+CATALOG_PATH = os.path.join(DATA_DIR, "catalog.sqlite")
+SESSIONS_PATH = os.path.join(DATA_DIR, "sessions.sqlite")
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
+BULK_DIR = os.path.join(JOBS_DIR, "bulk")
+UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")
+LOCKS_DIR = os.path.join(DATA_DIR, "locks")
 
 os.makedirs(DOCS_DIR, exist_ok=True)
 os.makedirs(INDEX_DIR, exist_ok=True)
+os.makedirs(JOBS_DIR, exist_ok=True)
+os.makedirs(BULK_DIR, exist_ok=True)
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+os.makedirs(LOCKS_DIR, exist_ok=True)
+
+# Ingesta asíncrona: trabajos procesándose a la vez y máximo en espera
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "32"))
+# segundos que se conserva el registro (data/jobs/<id>.json) de un trabajo terminado
+JOBS_RETENTION = float(os.getenv("JOBS_RETENTION", str(7 * 24 * 3600)))
+
+# Subidas y descargas: tamaño máximo por documento, tamaño de bloque al
+# copiar a disco, timeout de descarga (s) y conexiones del cliente HTTP
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "120"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "4"))
+
+# Ingesta masiva (POST /documents/bulk, un ZIP o una lista de URLs):
+# documentos por lote, tamaño máximo del ZIP y de su contenido ya
+# descomprimido, y trabajos de lotes procesándose a la vez, aparte de los
+# INGEST_WORKERS de las subidas sueltas (que nunca esperan detrás de un lote)
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+BULK_ARCHIVE_MAX_BYTES = int(os.getenv("BULK_ARCHIVE_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+BULK_UNPACKED_MAX_BYTES = int(os.getenv("BULK_UNPACKED_MAX_BYTES", str(8 * 1024 * 1024 * 1024)))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(max(4, os.cpu_count() or 1))))
+
+# Caché semántica de respuestas (/query): similitud coseno mínima entre
+# preguntas para reutilizar una respuesta, vigencia (s) y tope de entradas
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+# Sesiones de chat (/query con session_id): tope de sesiones guardadas
+# (se descartan las usadas hace más tiempo) y vigencia (s) sin uso
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(30 * 60)))
+
+# Caché LRU de índices cargados (bytes totales) y cuántos de los
+# documentos más consultados se precargan al iniciar (en segundo plano)
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+INDEX_CACHE_PRELOAD = int(os.getenv("INDEX_CACHE_PRELOAD", "0"))
+
+# Índice vectorial global (IVF): listas a recorrer por búsqueda, mínimo de
+# vectores para entrenar centroides y tope de chunks para buscar exacto
+# cuando la consulta filtra por documentos. ANN_DTYPE es el tipo de los
+# vectores en memoria ("float16" ocupa la mitad que "float32")
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_TRAIN_MIN = int(os.getenv("ANN_TRAIN_MIN", "4096"))
+ANN_EXACT_MAX = int(os.getenv("ANN_EXACT_MAX", "20000"))
+ANN_DTYPE = os.getenv("ANN_DTYPE", "float16")
+
+# Recuperación por documento: "dense" (solo embeddings), "hybrid" (BM25 +
+# embeddings fusionados con RRF) o "prefilter" (BM25 elige candidatos y
+# los embeddings solo puntúan esos). Candidatos por lista / del prefiltro.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+PREFILTER_CANDIDATES = int(os.getenv("PREFILTER_CANDIDATES", "200"))
+
+# GET /documents: documentos por página por defecto y máximo
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "100"))
+DOCUMENTS_PAGE_MAX = int(os.getenv("DOCUMENTS_PAGE_MAX", "1000"))
+
+# /query/batch: preguntas por petición, generaciones en vuelo y preguntas
+# por bloque al puntuar (acota la matriz preguntas x chunks en memoria)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "2000"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+BATCH_SCORE_BLOCK = int(os.getenv("BATCH_SCORE_BLOCK", "256"))
+
+# Extracción de texto en procesos aparte: procesos, páginas de PDF por tarea,
+# timeout por documento (s) y tope de memoria por proceso (MB, 0 = sin tope)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "25"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "300"))
+EXTRACT_MAX_MEMORY_MB = int(os.getenv("EXTRACT_MAX_MEMORY_MB", "2048"))
@@ -0,0 +1,121 @@
+import math
+
+from .config import CONTEXT_CHARS_PER_TOKEN
+
+
+# ==========================================================
+#  Armado del contexto para el LLM
+#
+#  Los chunks se indexan con solape (las últimas palabras de uno son las
+#  primeras del siguiente), así que cuando la recuperación elige chunks
+#  vecinos el texto repetido se pagaría dos veces en el prefill. Aquí los
+#  chunks contiguos se unen quitando el solape, se descartan los tramos
+#  repetidos y el resultado se recorta a un presupuesto en tokens, en
+#  orden de relevancia y cortando siempre entre palabras.
+# ==========================================================
+
+SEPARATOR = "\n\n"
+
+# un recorte más corto que esto no aporta: se descarta el tramo entero
+MIN_PIECE_TOKENS = 32
+
+# acumulados desde que arrancó el proceso (ver /health)
+totals = {"queries": 0, "tokens": 0, "tokens_saved": 0, "tokens_dropped": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados (sin el tokenizador del modelo a mano)."""
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+
+def _overlap(a: list[str], b: list[str]) -> int:
+    """Palabras del final de `a` que se repiten al principio de `b`."""
+    for k in range(min(len(a), len(b)), 0, -1):
+        if a[-k] == b[0] and a[-k:] == b[:k]:
+            return k
+    return 0
+
+
+def _adjacent(p, q) -> bool:
+    # posiciones: número de chunk, o (documento, número de chunk)
+    if isinstance(p, tuple):
+        return p[0] == q[0] and p[1] + 1 == q[1]
+    return p + 1 == q
+
+
+def _segments(chunks: list[str], positions=None) -> list[tuple[int, list[str]]]:
+    """(mejor rango, palabras) de cada tramo sin repeticiones."""
+    items, seen = [], set()
+    for rank, text in enumerate(chunks):
+        if text in seen:
+            continue
+        seen.add(text)
+        items.append((rank, positions[rank] if positions is not None else None, text.split()))
+
+    if positions is None:
+        segments = [(rank, words) for rank, _, words in items]
+    else:
+        # chunks contiguos del documento: uno solo, sin el solape
+        items.sort(key=lambda item: item[1])
+        segments = []
+        prev = None
+        for rank, pos, words in items:
+            if segments and _adjacent(prev, pos):
+                best, merged = segments[-1]
+                merged.extend(words[_overlap(merged, words):])
+                segments[-1] = (min(best, rank), merged)
+            else:
+                segments.append((rank, list(words)))
+            prev = pos
+
+    # tramos contenidos en otro (p. ej. un chunk final corto)
+    texts = [" ".join(words) for _, words in segments]
+    kept = [
+        seg for i, seg in enumerate(segments)
+        if not any(i != j and texts[i] in texts[j] and (len(texts[i]) < len(texts[j]) or i > j)
+                   for j in range(len(texts)))
+    ]
+    return sorted(kept, key=lambda seg: seg[0])
+
+
+def pack_context(chunks: list[str], budget: int, positions=None) -> tuple[str, dict]:
+    """
+    Contexto con los `chunks` elegidos (en orden de relevancia) que entra
+    en `budget` tokens. `positions[i]` es la posición del chunk i en su
+    documento; sin posiciones solo se quitan los chunks repetidos.
+    Devuelve (contexto, stats): tokens del contexto, tokens ahorrados
+    respecto de concatenar los chunks tal cual y tokens que no entraron.
+    """
+    raw = estimate_tokens(SEPARATOR.join(chunks))
+    parts, used, dropped = [], 0, 0
+
+    for _, words in _segments(chunks, positions):
+        text = " ".join(words)
+        cost = estimate_tokens(text) + (estimate_tokens(SEPARATOR) if parts else 0)
+        if used + cost <= budget:
+            parts.append(text)
+            used += cost
+            continue
+
+        # no entra entero: lo que quepa, cortado entre palabras
+        room = int((budget - used) * CONTEXT_CHARS_PER_TOKEN) - len(SEPARATOR)
+        cut = ""
+        if room >= MIN_PIECE_TOKENS * CONTEXT_CHARS_PER_TOKEN:
+            cut = text[:room].rsplit(" ", 1)[0]
+        if cut:
+            parts.append(cut)
+            used += estimate_tokens(cut) + (estimate_tokens(SEPARATOR) if len(parts) > 1 else 0)
+        dropped += estimate_tokens(text[len(cut):])
+
+    context = SEPARATOR.join(parts)
+    tokens = estimate_tokens(context)
+    stats = {
+        "segments": len(parts),
+        "tokens": tokens,
+        "tokens_saved": max(0, raw - tokens - dropped),
+        "tokens_dropped": dropped,
+    }
+    totals["queries"] += 1
+    for k in ("tokens", "tokens_saved", "tokens_dropped"):
+        totals[k] += stats[k]
+    return context, stats
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+#  Caché de embeddings direccionada por contenido
+#
+#  Clave = sha256(modelo + texto normalizado). Se guarda en SQLite como
+#  blob float32 (sin JSON), con una capa LRU en memoria delante. Como el
+#  modelo forma parte de la clave, cambiar EMBEDDING_MODEL nunca devuelve
+#  vectores del modelo anterior; además esas filas se purgan al iniciar.
+#
+#  La fecha de último uso (para la evicción) no se escribe en cada
+#  acierto: se junta en memoria y se vuelca cada TOUCH_FLUSH_ITEMS claves
+#  o TOUCH_FLUSH_SECONDS, junto con la próxima escritura o antes de
+#  evictar. Al cerrar el proceso se pierde a lo sumo ese tramo.
+# ==========================================================
+
+TOUCH_FLUSH_ITEMS = 1000
+TOUCH_FLUSH_SECONDS = 30.0
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model: str, max_bytes: int, memory_items: int = 20000):
+        self.path = path
+        self.model = model
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+        self._touched = {}                # clave -> último uso aún sin escribir
+        self._touched_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+
+        purged = self._db.execute("DELETE FROM embeddings WHERE model != ?", (model,)).rowcount
+        self._db.commit()
+        if purged:
+            log.info("🧹 Caché de embeddings: %d vectores de otro modelo eliminados", purged)
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: list[str]) -> dict:
+        """{texto: vector} para los textos (ya normalizados) que estén en caché."""
+        found = {}
+        missing = {}
+
+        now = time.time()
+        with self._lock:
+            for text in texts:
+                k = self.key(text)
+                vec = self._memory.get(k)
+                if vec is not None:
+                    self._memory.move_to_end(k)
+                    self._touched[k] = now
+                    found[text] = vec
+                else:
+                    missing[k] = text
+
+            if missing:
+                keys = list(missing)
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, dim, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                        part,
+                    ).fetchall()
+                    for k, dim, blob in rows:
+                        vec = np.frombuffer(blob, dtype="float32", count=dim)
+                        found[missing[k]] = vec
+                        self._remember(k, vec)
+                        self._touched[k] = now
+
+            if self._flush_touched():
+                self._db.commit()
+
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+
+        return found
+
+    def put_many(self, texts: list[str], vectors: np.ndarray):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                vec = np.ascontiguousarray(vec, dtype="float32")
+                k = self.key(text)
+                self._remember(k, vec)
+                rows.append((k, self.model, len(vec), vec.tobytes(), now))
+
+            self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._flush_touched(force=True)     # en la misma transacción
+            self._db.commit()
+
+            self._puts_since_trim += len(rows)
+            if self._puts_since_trim >= 1000:
+                self._puts_since_trim = 0
+                self._trim()
+
+    def _remember(self, k: bytes, vec: np.ndarray):
+        self._memory[k] = vec
+        self._memory.move_to_end(k)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self, force: bool = False) -> bool:
+        """Escribe las fechas de uso pendientes (sin commit); True si escribió."""
+        if not self._touched:
+            return False
+        due = len(self._touched) >= TOUCH_FLUSH_ITEMS or time.monotonic() - self._touched_at >= TOUCH_FLUSH_SECONDS
+        if not (force or due):
+            return False
+        self._db.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(at, k) for k, at in self._touched.items()],
+        )
+        self._touched.clear()
+        self._touched_at = time.monotonic()
+        return True
+
+    def _trim(self):
+        """Evicción por tamaño en disco: borra los menos usados hasta quedar al 90%."""
+        self._flush_touched(force=True)
+        count, total = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        if total <= self.max_bytes or count == 0:
+            return
+
+        target = int(count * (1 - (0.9 * self.max_bytes) / total)) + 1
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (target,),
+        )
+        self._db.commit()
+        log.info("🧹 Caché de embeddings: %d vectores antiguos eliminados", target)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory_items": len(self._memory)}
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import random
+
+import httpx
+import numpy as np
+
+from .config import (
+    OLLAMA_BASE_URL,
+    EMBEDDING_MODEL,
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    EMBED_MAX_RETRIES,
+    EMBED_RETRY_BACKOFF,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_PATH,
+    EMBED_CACHE_MAX_BYTES,
+    EMBED_CACHE_MEMORY_ITEMS,
+)
+from .embedding_cache import EmbeddingCache, normalize_text
+from .http_client import get_ollama_client, ollama_payload
+from .scheduler import scheduler
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+
+class RetryableEmbeddingError(RuntimeError):
+    """Fallo transitorio (red, 5xx, 429): el lote se puede reintentar."""
+
+
+# ==========================================================
+#  Motor de embeddings por lotes (Ollama /api/embed)
+# ==========================================================
+
+class EmbeddingEngine:
+    """
+    Envía los textos a Ollama en lotes usando /api/embed (multi-input),
+    con un máximo de peticiones en vuelo y reintentos con backoff.
+    Los vectores se devuelven en el mismo orden que los textos; los
+    textos vacíos reciben un vector en cero para no desalinear índices.
+    Con `cache`, solo se envían a Ollama los textos que no estén en caché
+    (y cada texto repetido, una sola vez). Cada lote ocupa un cupo del
+    planificador en el carril `lane` (ver scheduler.py).
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBED_BATCH_SIZE,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_retries: int = EMBED_MAX_RETRIES,
+        backoff: float = EMBED_RETRY_BACKOFF,
+        cache: EmbeddingCache = None,
+    ):
+        self.base_url = base_url
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.cache = cache
+
+        # Ollama anterior a /api/embed: se cae a /api/embeddings (1 texto por petición)
+        self.legacy = False
+
+    async def embed(self, texts: list[str], on_progress=None, lane: str = "interactive") -> np.ndarray:
+        """`on_progress(hechos, total)` se llama tras cada lote (en textos únicos)."""
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+
+        normalized = [normalize_text(t) for t in texts]
+        unique = list(dict.fromkeys(t for t in normalized if t))
+
+        empty = sum(1 for t in normalized if not t)
+        if empty:
+            log.warning("⚠ %d textos vacíos: se devuelven vectores en cero", empty)
+
+        if not unique:
+            return np.zeros((len(texts), 0), dtype="float32")
+
+        known = self.cache.get_many(unique) if self.cache is not None else {}
+        pending = [t for t in unique if t not in known]
+
+        if on_progress is not None:
+            on_progress(len(unique) - len(pending), len(unique))
+
+        if pending:
+            fresh = await self._embed_pending(
+                pending, on_progress, len(unique) - len(pending), len(unique), lane
+            )
+            if self.cache is not None:
+                self.cache.put_many(pending, fresh)
+            known.update(zip(pending, fresh))
+
+        dim = len(next(iter(known.values())))
+        out = np.zeros((len(texts), dim), dtype="float32")
+        for i, t in enumerate(normalized):
+            if t:
+                out[i] = known[t]
+
+        return out
+
+    async def _embed_pending(self, texts: list[str], on_progress=None, done=0, total=0,
+                             lane: str = "interactive") -> np.ndarray:
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        client = get_ollama_client()
+
+        async def run(batch):
+            nonlocal done
+            async with semaphore:
+                vectors = await self._embed_batch(client, batch, lane)
+            done += len(batch)
+            if on_progress is not None:
+                on_progress(done, total)
+            return vectors
+
+        tasks = [asyncio.create_task(run(b)) for b in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        for batch, vectors in zip(batches, results):
+            if len(vectors) != len(batch):
+                raise ValueError(
+                    f"Ollama devolvió {len(vectors)} embeddings para un lote de {len(batch)}"
+                )
+
+        return np.asarray([v for vectors in results for v in vectors], dtype="float32")
+
+    # ------------------------------------------------------
+    #  Un lote, con reintentos
+    # ------------------------------------------------------
+
+    async def _embed_batch(self, client, batch: list[str], lane: str = "interactive") -> list[list[float]]:
+        attempt = 0
+        while True:
+            try:
+                # el cupo se suelta durante la espera entre reintentos
+                async with scheduler.slot(lane):
+                    with metrics.timed("embed_batch"):
+                        if self.legacy:
+                            return await self._post_legacy(client, batch)
+                        return await self._post_batch(client, batch)
+            except RetryableEmbeddingError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise RuntimeError(f"Embeddings fallaron tras {attempt} intentos: {e}")
+
+                delay = self.backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+                log.warning(
+                    "🔁 Reintento %d/%d de lote de embeddings en %.2fs: %s", attempt, self.max_retries, delay, e
+                )
+                await asyncio.sleep(delay)
+
+    async def warm(self, client, timeout: float):
+        """
+        Embebe un texto para que Ollama cargue el modelo (ver warmup.py),
+        con la misma detección de /api/embed que un lote. Los fallos
+        transitorios salen como RetryableEmbeddingError.
+        """
+        if self.legacy:
+            await self._post_legacy(client, ["warmup"], timeout)
+        else:
+            await self._post_batch(client, ["warmup"], timeout)
+
+    async def _post(self, client, path: str, payload: dict, timeout=httpx.USE_CLIENT_DEFAULT) -> httpx.Response:
+        try:
+            res = await client.post(f"{self.base_url}{path}", json=payload, timeout=timeout)
+        except httpx.TransportError as e:
+            metrics.ollama_error("embed", "connection")
+            raise RetryableEmbeddingError(f"Error conectando con Ollama embeddings: {e}")
+
+        if res.status_code == 429 or res.status_code >= 500:
+            metrics.ollama_error("embed", "http")
+            raise RetryableEmbeddingError(f"HTTP {res.status_code} en embeddings: {res.text}")
+
+        return res
+
+    def _parse(self, res: httpx.Response) -> dict:
+        if res.status_code != 200:
+            metrics.ollama_error("embed", "http")
+            raise RuntimeError(f"HTTP {res.status_code} en embeddings: {res.text}")
+
+        try:
+            data = res.json()
+        except ValueError:
+            metrics.ollama_error("embed", "invalid")
+            raise ValueError(f"Ollama embeddings devolvió basura: {res.text[:200]}")
+
+        if "error" in data:
+            metrics.ollama_error("embed", "model")
+            raise RuntimeError(f"Error de Ollama en embeddings: {data['error']}")
+
+        return data
+
+    async def _post_batch(self, client, batch: list[str], timeout=httpx.USE_CLIENT_DEFAULT) -> list[list[float]]:
+        res = await self._post(client, "/api/embed", ollama_payload(model=self.model, input=batch), timeout)
+
+        # 404 sin mención al modelo => Ollama viejo, sin /api/embed
+        if res.status_code == 404 and "model" not in res.text.lower():
+            log.warning("⚠ Ollama sin /api/embed: usando /api/embeddings (un texto por petición)")
+            self.legacy = True
+            return await self._post_legacy(client, batch, timeout)
+
+        data = self._parse(res)
+        if "embeddings" not in data:
+            metrics.ollama_error("embed", "invalid")
+            raise ValueError(f"Formato inesperado en embeddings (claves: {sorted(data)})")
+
+        return data["embeddings"]
+
+    async def _post_legacy(self, client, batch: list[str], timeout=httpx.USE_CLIENT_DEFAULT) -> list[list[float]]:
+        vectors = []
+        for text in batch:
+            res = await self._post(
+                client, "/api/embeddings", ollama_payload(model=self.model, prompt=text), timeout
+            )
+            data = self._parse(res)
+
+            if "embedding" in data:
+                vectors.append(data["embedding"])
+            elif "embeddings" in data:
+                vectors.append(data["embeddings"][0])
+            else:
+                metrics.ollama_error("embed", "invalid")
+                raise ValueError(f"Formato inesperado en embeddings (claves: {sorted(data)})")
+
+        return vectors
+
+
+cache = None
+if EMBED_CACHE_ENABLED:
+    cache = EmbeddingCache(
+        EMBED_CACHE_PATH, EMBEDDING_MODEL, EMBED_CACHE_MAX_BYTES, EMBED_CACHE_MEMORY_ITEMS
+    )
+
+engine = EmbeddingEngine(cache=cache)
@@ -0,0 +1,244 @@
+import asyncio
+import codecs
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .config import EXTRACT_WORKERS, EXTRACT_PAGES_PER_TASK, EXTRACT_TIMEOUT, EXTRACT_MAX_MEMORY_MB
+from .text_extractor import clean_text, count_pdf_pages, extract_pdf_pages, extract_text_file
+from . import metrics
+
+
+# ==========================================================
+#  Extracción de texto en un pool de procesos
+#
+#  PyPDF2 / python-docx / odfpy son CPU puro: corriendo en el event loop
+#  congelan todas las demás peticiones. Acá se ejecutan en procesos
+#  aparte; los PDF se parten en rangos de páginas que se extraen en
+#  paralelo y se vuelven a unir en orden.
+# ==========================================================
+
+_pool = None
+
+
+def _limit_memory(max_mb: int):
+    """Tope de memoria por proceso (solo Unix): un PDF patológico da MemoryError."""
+    try:
+        import resource
+    except ImportError:
+        return
+    if max_mb > 0:
+        limit = max_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class _Pool:
+    """Pool de procesos y su trabajo en vuelo (futuro -> documento que lo pidió)."""
+
+    def __init__(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=EXTRACT_WORKERS,
+            initializer=_limit_memory,
+            initargs=(EXTRACT_MAX_MEMORY_MB,),
+        )
+        self.work = {}
+        self.killed = False    # matado por el timeout de un documento
+        self.closed = False    # cerrado al apagar: no se reenvía nada
+
+
+def get_pool() -> _Pool:
+    global _pool
+    if _pool is None:
+        _pool = _Pool()
+    return _pool
+
+
+def _kill(pool: _Pool, closed: bool = False):
+    """Mata los procesos del pool; el próximo pedido crea uno nuevo."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.killed, pool.closed = True, closed
+    processes = list((getattr(pool.executor, "_processes", None) or {}).values())
+    pool.executor.shutdown(wait=False, cancel_futures=True)
+    for p in processes:
+        p.terminate()
+
+
+def _abort(owner):
+    """
+    Timeout de un documento: se cancela lo suyo que no empezó y, si tiene
+    algo corriendo (un PDF patológico que no termina), se mata el pool.
+    El trabajo de los otros documentos en ese pool se reenvía al nuevo
+    (ver _submit) en vez de fallar con ellos.
+    """
+    pool = _pool
+    if pool is None:
+        return
+    mine = [cf for cf, o in list(pool.work.items()) if o is owner]
+    if any(not cf.cancel() for cf in mine):
+        _kill(pool)
+
+
+def _submit(owner, fn, *args) -> asyncio.Future:
+    """
+    Corre fn(*args) en el pool actual. Si el pool muere por el timeout de
+    otro documento antes de terminar, se vuelve a correr en el nuevo: las
+    funciones de extracción solo leen el archivo.
+    """
+    loop = asyncio.get_running_loop()
+    result = loop.create_future()
+    current = [None]
+
+    def run():
+        pool = get_pool()
+        cf = current[0] = pool.executor.submit(fn, *args)
+        pool.work[cf] = owner
+
+        def done(cf):
+            try:
+                loop.call_soon_threadsafe(settle, pool, cf)
+            except RuntimeError:
+                pass    # loop cerrado: ya no hay a quién avisar
+
+        cf.add_done_callback(done)
+
+    def settle(pool, cf):
+        pool.work.pop(cf, None)
+        if result.done():
+            return      # el documento ya no lo espera
+        if pool.closed:
+            result.set_exception(RuntimeError("El pool de extracción se cerró"))
+        elif cf.cancelled() or (pool.killed and isinstance(cf.exception(), BrokenProcessPool)):
+            try:
+                run()
+            except Exception as e:
+                result.set_exception(e)
+        elif cf.exception() is not None:
+            result.set_exception(cf.exception())
+        else:
+            result.set_result(cf.result())
+
+    run()
+    # el documento dejó de esperarlo: si todavía no empezó, no se corre
+    result.add_done_callback(lambda r: r.cancelled() and current[0].cancel())
+    return result
+
+
+def reset_pool():
+    """Descarta el pool actual (p. ej. roto) y deja que se cree uno nuevo."""
+    if _pool is not None:
+        _kill(_pool)
+
+
+def page_ranges(n_pages: int, per_task: int) -> list[tuple[int, int]]:
+    per_task = max(1, per_task)
+    return [(i, min(i + per_task, n_pages)) for i in range(0, n_pages, per_task)]
+
+
+TXT_BLOCK_SIZE = 1 << 20
+
+
+def _is_pdf(filename: str) -> bool:
+    return filename.lower().strip().endswith(".pdf")
+
+
+def _is_txt(filename: str) -> bool:
+    return filename.lower().strip().endswith(".txt")
+
+
+async def _iter_raw(filename: str, path: str, budget: list, owner):
+    """
+    Genera (texto, fracción) en orden. `budget[0]` son los segundos que
+    quedan para esperar al pool; el tiempo que el consumidor tarda entre
+    un trozo y el siguiente no cuenta. `owner` identifica al documento
+    en el pool (ver _abort).
+    """
+    loop = asyncio.get_running_loop()
+
+    async def wait(fut):
+        start = loop.time()
+        try:
+            return await asyncio.wait_for(fut, max(0.0, budget[0]))
+        finally:
+            budget[0] -= loop.time() - start
+
+    if _is_txt(filename):
+        # el .txt se decodifica por bloques: nunca entero en memoria
+        size = max(1, os.path.getsize(path))
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(TXT_BLOCK_SIZE)
+                text = decoder.decode(block, final=not block)
+                if text:
+                    yield text, min(1.0, f.tell() / size)
+                if not block:
+                    return
+
+    if not _is_pdf(filename):
+        # python-docx / odfpy cargan el documento entero de todos modos
+        text = await wait(_submit(owner, extract_text_file, filename, path))
+        yield text, 1.0
+        return
+
+    n_pages = await wait(_submit(owner, count_pdf_pages, path))
+    ranges = page_ranges(n_pages, EXTRACT_PAGES_PER_TASK)
+
+    # ventana acotada de rangos en vuelo: si el consumidor (embeddings)
+    # va más lento, los procesos esperan en vez de acumular páginas
+    window = max(2, 2 * EXTRACT_WORKERS)
+    pending = deque()
+    submitted = 0
+    try:
+        for done in range(1, len(ranges) + 1):
+            while submitted < len(ranges) and len(pending) < window:
+                start, end = ranges[submitted]
+                pending.append(_submit(owner, extract_pdf_pages, path, start, end))
+                submitted += 1
+            text = clean_text(await wait(pending.popleft()))
+            yield (text if done == 1 else "\n" + text), done / len(ranges)
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+async def iter_extract(filename: str, path: str, timeout: float = EXTRACT_TIMEOUT):
+    """
+    Extrae el texto de `path` fuera del event loop y lo va entregando por
+    trozos (rangos de páginas, bloques de texto) como pares (texto, fracción
+    completada); concatenados dan el texto completo. El timeout es por
+    documento. El tiempo de extracción (sin contar lo que tarda quien
+    consume los trozos) se registra por formato.
+    """
+    budget = [timeout]
+    owner = object()
+    spent = 0.0
+    try:
+        start = time.perf_counter()
+        async for item in _iter_raw(filename, path, budget, owner):
+            spent += time.perf_counter() - start
+            yield item
+            start = time.perf_counter()
+        spent += time.perf_counter() - start
+        metrics.observe("extract", spent, format=os.path.splitext(filename)[1].lower().lstrip("."))
+    except asyncio.TimeoutError:
+        _abort(owner)
+        raise ValueError(f"La extracción superó el límite de {timeout:g}s")
+    except MemoryError:
+        raise ValueError(f"La extracción superó el límite de memoria ({EXTRACT_MAX_MEMORY_MB} MB)")
+    except BrokenProcessPool:
+        reset_pool()
+        raise ValueError("El proceso de extracción terminó abruptamente (¿memoria agotada?)")
+
+
+async def extract_file(filename: str, path: str, timeout: float = EXTRACT_TIMEOUT) -> str:
+    """Extrae el texto completo de `path` fuera del event loop."""
+    return "".join([text async for text, _ in iter_extract(filename, path, timeout)])
+
+
+def shutdown():
+    if _pool is not None:
+        _kill(_pool, closed=True)
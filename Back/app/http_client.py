@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+
+from .config import DOWNLOAD_TIMEOUT, HTTP_MAX_CONNECTIONS, OLLAMA_CONCURRENCY, OLLAMA_KEEP_ALIVE
+
+
+# ==========================================================
+#  Clientes HTTP compartidos (descargas de URLs y Ollama)
+#
+#  Un AsyncClient por uso para todo el proceso: reutilizan conexiones y
+#  acotan cuántas hay abiertas a la vez. Se cierran en el lifespan.
+# ==========================================================
+
+_client = None
+_ollama = None
+_ollama_loop = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(DOWNLOAD_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS // 2,
+            ),
+        )
+    return _client
+
+
+def get_ollama_client() -> httpx.AsyncClient:
+    """
+    Cliente para Ollama (chat y embeddings). Las esperas por cupo las
+    maneja el planificador, así que el timeout de lectura solo cuenta el
+    tiempo de Ollama. Uno por event loop (los benchmarks usan varios).
+    """
+    global _ollama, _ollama_loop
+    loop = asyncio.get_running_loop()
+    if _ollama is None or _ollama.is_closed or _ollama_loop is not loop:
+        _ollama = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, read=60.0, write=30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=OLLAMA_CONCURRENCY * 2),
+        )
+        _ollama_loop = loop
+    return _ollama
+
+
+def ollama_payload(**fields) -> dict:
+    """Cuerpo de una petición a Ollama, con el keep_alive configurado."""
+    if OLLAMA_KEEP_ALIVE != "":
+        fields["keep_alive"] = OLLAMA_KEEP_ALIVE
+    return fields
+
+
+async def aclose():
+    global _client, _ollama
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _ollama is not None:
+        await _ollama.aclose()
+        _ollama = None
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+
+# ==========================================================
+#  Caché LRU de índices, acotada por bytes
+# ==========================================================
+
+class IndexCache:
+    """
+    Índices ya cargados en RAM, por doc_id. Cuando el total supera
+    `max_bytes` se descartan los usados hace más tiempo. Un índice más
+    grande que el límite no se cachea (se sigue sirviendo por memmap).
+    Cada entrada guarda el tamaño con que se contó al entrar: `nbytes`
+    crece si después se arma el índice léxico o los hashes al vuelo, y
+    restar el `nbytes` del momento dejaría el total por debajo del real.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()     # doc_id -> (índice, bytes contados)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, doc_id: str):
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(doc_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, doc_id: str, index) -> bool:
+        size = index.nbytes
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            old = self._entries.pop(doc_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[doc_id] = (index, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+        return True
+
+    def invalidate(self, doc_id: str):
+        with self._lock:
+            old = self._entries.pop(doc_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._entries
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,518 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import struct
+import time
+from array import array
+
+import numpy as np
+
+from .lexical import LexicalIndex, LexicalIndexBuilder
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+#  Formato de índice en disco (v2)
+#
+#  <INDEX_DIR>/<doc_id>/
+#      manifest.json            versión, generación, forma y archivos
+#      embeddings.<gen>.npy     float32 (n_chunks, dim), filas L2-normalizadas
+#      quantized.<gen>.npy      float16 / int8 (n_chunks, dim), si hay cuantización
+#      scales.<gen>.npy         float32 (n_chunks), escala por fila del int8
+#      chunks.<gen>.bin         textos de los chunks en UTF-8, concatenados
+#      offsets.<gen>.npy        int64 (n_chunks + 1), offsets en bytes del blob
+#      hashes.<gen>.npy         uint64 (n_chunks), hash del texto de cada chunk
+#      terms/postings/...       índice léxico BM25 (ver lexical.py)
+#
+#  Los archivos de datos llevan la generación en el nombre y el manifest se
+#  reemplaza con os.replace: quien lee ve el índice viejo o el nuevo entero.
+#  Al publicar se conserva la generación anterior (un lector de este u otro
+#  worker pudo haber leído su manifest y estar por abrir sus archivos); se
+#  borra en la publicación siguiente. Si aun así un lector llega tarde,
+#  open_index vuelve a leer el manifest una vez.
+# ==========================================================
+
+INDEX_FORMAT = "rag-index"
+INDEX_VERSION = 2
+MANIFEST = "manifest.json"
+
+
+def chunk_hash(text: str) -> int:
+    """Hash estable (64 bits) del texto de un chunk, para reutilizar embeddings."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def normalize_rows(m: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma L2 = 1 (las filas en cero quedan en cero)."""
+    m = np.asarray(m, dtype="float32")
+    if m.ndim != 2:
+        m = m.reshape(len(m), -1)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+QUANTIZATION_MODES = ("float32", "float16", "int8")
+SCAN_BLOCK = 256
+
+
+def quantize(m: np.ndarray, mode: str):
+    """
+    (matriz, escalas) para guardar filas ya normalizadas: float16 tal cual;
+    int8 con una escala por fila (max |x| / 127). Escalas None si no aplica.
+    """
+    if mode == "float16":
+        return m.astype("<f2"), None
+    if mode == "int8":
+        scales = np.abs(m).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.clip(np.rint(m / scales[:, None]), -127, 127).astype("i1")
+        return q, scales.astype("<f4")
+    return m.astype("<f4"), None
+
+
+class DocumentIndex:
+    """
+    Índice abierto en modo memmap. Los embeddings están normalizados, así
+    que la similitud coseno con una pregunta normalizada es un producto
+    punto. Los chunks se leen de a uno a partir de la tabla de offsets.
+
+    Con cuantización (float16 / int8) la primera pasada recorre la matriz
+    cuantizada (`quantized` y `scales`); `embeddings` es la float32 en disco
+    si se conservó, y solo se lee para reordenar una lista corta
+    (`rescore`). Sin cuantización `quantized` es None.
+    """
+
+    def __init__(self, path: str, manifest: dict, embeddings, offsets, blob,
+                 lexical=None, hashes=None, quantized=None, scales=None):
+        self.path = path
+        self.manifest = manifest
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self._blob = blob
+        self._lexical = lexical
+        self._hashes = hashes
+        self.quantized = quantized
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def generation(self) -> str:
+        return self.manifest["generation"]
+
+    @property
+    def quantization(self) -> str:
+        return (self.manifest.get("quantization") or {}).get("mode", "float32")
+
+    @property
+    def can_rescore(self) -> bool:
+        """¿Hay float32 exacta para reordenar lo que encontró la pasada cuantizada?"""
+        return self.quantized is not None and self.embeddings is not None
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        """Índice BM25; los índices escritos sin él lo arman en memoria al primer uso."""
+        if self._lexical is None:
+            self._lexical = LexicalIndex.from_chunks(self.chunks())
+        return self._lexical
+
+    @property
+    def hashes(self) -> np.ndarray:
+        """chunk_hash de cada chunk (calculado al vuelo en índices sin hashes.npy)."""
+        if self._hashes is None:
+            self._hashes = np.array([chunk_hash(c) for c in self.chunks()], dtype="uint64")
+        return self._hashes
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes que ocupa en RAM una vez cargado (la float32 de un índice cuantizado queda en disco)."""
+        if self.quantized is not None:
+            matrix = self.quantized.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        else:
+            matrix = self.embeddings.nbytes
+        lexical = self._lexical.nbytes if self._lexical is not None else 0
+        hashes = self._hashes.nbytes if self._hashes is not None else 0
+        return int(matrix + self.offsets.nbytes + len(self._blob) + lexical + hashes)
+
+    def load_into_memory(self) -> "DocumentIndex":
+        """Copia de este índice en RAM (sin memmaps), para la caché en proceso."""
+        quantized = self.quantized is not None
+        return DocumentIndex(
+            self.path,
+            self.manifest,
+            self.embeddings if quantized else np.array(self.embeddings),
+            np.array(self.offsets),
+            np.array(self._blob),
+            self._lexical.load_into_memory() if self._lexical is not None else None,
+            np.array(self._hashes) if self._hashes is not None else None,
+            np.array(self.quantized) if quantized else None,
+            np.array(self.scales) if self.scales is not None else None,
+        )
+
+    # ------------------------------------------------------
+    #  Similitud
+    # ------------------------------------------------------
+
+    def _dequantize(self, rows) -> np.ndarray:
+        block = np.asarray(self.quantized[rows], dtype="float32")
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows])[:, None]
+        return block
+
+    def vectors(self, rows=None) -> np.ndarray:
+        """Filas en float32: exactas si se guardó la float32, si no descuantizadas."""
+        rows = slice(None) if rows is None else rows
+        if self.embeddings is not None:
+            return np.asarray(self.embeddings[rows], dtype="float32")
+        return self._dequantize(rows)
+
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        """
+        Producto punto de cada fila con `q` (dim,) o con varias preguntas
+        (dim, m). Sobre la matriz cuantizada se convierte a float32 de a
+        SCAN_BLOCK filas en un mismo buffer que entra en caché, sin armar
+        nunca la float32 entera.
+        """
+        if self.quantized is None:
+            return self.embeddings @ q
+
+        n = len(self)
+        out = np.empty((n,) + q.shape[1:], dtype="float32")
+        buf = np.empty((min(SCAN_BLOCK, n), self.quantized.shape[1]), dtype="float32")
+        for start in range(0, n, SCAN_BLOCK):
+            end = min(start + SCAN_BLOCK, n)
+            block = buf[:end - start]
+            np.copyto(block, self.quantized[start:end], casting="unsafe")
+            np.dot(block, q, out=out[start:end])
+        if self.scales is not None:
+            out *= np.asarray(self.scales) if out.ndim == 1 else np.asarray(self.scales)[:, None]
+        return out
+
+    def scores_rows(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Como `scores`, solo para `rows` (en orden creciente: lectura secuencial)."""
+        if self.quantized is None:
+            return self.embeddings[rows] @ q
+        return self._dequantize(rows) @ q
+
+    def rescore(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Similitud exacta (float32) de `rows`; sin float32 guardada, la aproximada."""
+        if self.embeddings is None:
+            return self.scores_rows(q, rows)
+        order = np.argsort(rows)
+        exact = np.empty(len(rows), dtype="float32")
+        exact[order] = np.asarray(self.embeddings[rows[order]], dtype="float32") @ q
+        return exact
+
+    def chunk(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def chunks(self, idxs=None) -> list[str]:
+        if idxs is None:
+            idxs = range(len(self))
+        return [self.chunk(int(i)) for i in idxs]
+
+
+# ==========================================================
+#  Escritura
+# ==========================================================
+
+def _write_json_atomic(path: str, data: dict):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _remove_stale_files(index_dir: str, manifest: dict, previous: dict | None = None):
+    """Borra lo que no sea de `manifest` ni de la generación anterior (`previous`)."""
+    keep = set(manifest["files"].values()) | {MANIFEST}
+    if previous is not None:
+        keep |= set(previous["files"].values())
+    for name in os.listdir(index_dir):
+        if name in keep:
+            continue
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except OSError:
+            # en Windows un memmap abierto bloquea el archivo: se limpia en la próxima escritura
+            pass
+
+
+NPY_HEADER_LEN = 128
+
+
+def _npy_header(shape: tuple, descr: str = "<f4") -> bytes:
+    """Cabecera .npy v1.0 de largo fijo, para poder reescribirla al final."""
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (descr, tuple(shape))
+    header = header.ljust(NPY_HEADER_LEN - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class _NpyAppender:
+    """Archivo .npy 2D que crece por filas; la cabecera se escribe al cerrar."""
+
+    def __init__(self, path: str, descr: str):
+        self.descr = descr
+        self.rows = 0
+        self._f = open(path, "wb")
+        self._f.write(b"\0" * NPY_HEADER_LEN)
+
+    def write(self, m: np.ndarray):
+        self._f.write(np.ascontiguousarray(m, dtype=self.descr).tobytes())
+        self.rows += len(m)
+
+    def close(self, width: int | None = None):
+        """Con `width` completa la cabecera; sin ella solo cierra (abort)."""
+        if width is not None:
+            self._f.seek(0)
+            self._f.write(_npy_header((self.rows, width), self.descr))
+        self._f.close()
+
+
+class IndexWriter:
+    """
+    Escribe un índice de a partes: cada `append` agrega chunks y sus
+    embeddings al final de los archivos de la nueva generación, sin tener
+    el documento entero en memoria. `finish` completa las cabeceras .npy y
+    publica el manifest; hasta entonces los lectores siguen viendo la
+    generación anterior.
+
+    `quantization` elige cómo se guarda la matriz que se recorre al buscar
+    (float32, float16 o int8 con escala por fila); con `keep_float32` se
+    guarda además la float32 para reordenar con exactitud. Si se pasa un
+    `lock` (algo con release()), se suelta al publicar o al abortar.
+    """
+
+    def __init__(self, index_dir: str, meta: dict | None = None,
+                 quantization: str = "float32", keep_float32: bool = True, lock=None):
+        """`meta` se agrega tal cual al manifest (p. ej. el modelo de embeddings)."""
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Cuantización desconocida: {quantization}")
+
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.meta = meta or {}
+        self.lock = lock
+        self.quantization = quantization
+        self.keep_float32 = keep_float32 or quantization == "float32"
+        self.generation = f"{time.time_ns():x}"
+        self.files = {
+            "chunks": f"chunks.{self.generation}.bin",
+            "offsets": f"offsets.{self.generation}.npy",
+            "hashes": f"hashes.{self.generation}.npy",
+        }
+        self.n_chunks = 0
+        self.dim = None
+        self._hashes = array("Q")
+        self._scales = array("f")
+        self._lexical = LexicalIndexBuilder()
+        self._offsets = array("q", [0])
+
+        self._matrices = {}
+        if self.keep_float32:
+            self.files["embeddings"] = f"embeddings.{self.generation}.npy"
+            self._matrices["embeddings"] = _NpyAppender(self._path("embeddings"), "<f4")
+        if quantization != "float32":
+            self.files["quantized"] = f"quantized.{self.generation}.npy"
+            descr = "<f2" if quantization == "float16" else "|i1"
+            self._matrices["quantized"] = _NpyAppender(self._path("quantized"), descr)
+            if quantization == "int8":
+                self.files["scales"] = f"scales.{self.generation}.npy"
+
+        self._blob = open(self._path("chunks"), "wb")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, self.files[name])
+
+    def append(self, chunks: list[str], embeddings: np.ndarray):
+        if len(chunks) != len(embeddings):
+            raise ValueError(
+                f"{len(chunks)} chunks y {len(embeddings)} embeddings: no coinciden"
+            )
+        if not chunks:
+            return
+
+        embeddings = normalize_rows(embeddings)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Dimensión de embeddings cambió: {self.dim} -> {embeddings.shape[1]}")
+
+        if "embeddings" in self._matrices:
+            self._matrices["embeddings"].write(embeddings)
+        if "quantized" in self._matrices:
+            quantized, scales = quantize(embeddings, self.quantization)
+            self._matrices["quantized"].write(quantized)
+            if scales is not None:
+                self._scales.extend(scales.tolist())
+
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            self._blob.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            self._hashes.append(chunk_hash(chunk))
+        self._lexical.add(chunks)
+        self.n_chunks += len(chunks)
+
+    def finish(self) -> dict:
+        for m in self._matrices.values():
+            m.close(self.dim or 0)
+        self._blob.close()
+        np.save(self._path("offsets"), np.frombuffer(self._offsets, dtype="int64"))
+        np.save(self._path("hashes"), np.frombuffer(self._hashes, dtype="uint64"))
+        if "scales" in self.files:
+            np.save(self._path("scales"), np.frombuffer(self._scales, dtype="float32"))
+        lexical_files, lexical_meta = self._lexical.write(self.index_dir, self.generation)
+        self.files.update(lexical_files)
+
+        manifest = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "generation": self.generation,
+            "n_chunks": self.n_chunks,
+            "dim": self.dim or 0,
+            "dtype": "float32",
+            "normalized": True,
+            "quantization": {"mode": self.quantization, "float32": self.keep_float32},
+            "lexical": lexical_meta,
+            **self.meta,
+            "files": self.files,
+        }
+        try:
+            previous = read_manifest(self.index_dir)
+        except (OSError, ValueError):
+            previous = None
+        _write_json_atomic(os.path.join(self.index_dir, MANIFEST), manifest)
+        _remove_stale_files(self.index_dir, manifest, previous)
+        self._release()
+        return manifest
+
+    def abort(self):
+        for m in self._matrices.values():
+            m.close()
+        self._blob.close()
+        for name in self.files:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        self._release()
+
+    def _release(self):
+        if self.lock is not None:
+            self.lock.release()
+
+
+def write_index(index_dir: str, chunks: list[str], embeddings: np.ndarray,
+                quantization: str = "float32", keep_float32: bool = True) -> dict:
+    writer = IndexWriter(index_dir, quantization=quantization, keep_float32=keep_float32)
+    try:
+        writer.append(chunks, embeddings)
+        return writer.finish()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+# ==========================================================
+#  Lectura
+# ==========================================================
+
+def read_manifest(index_dir: str):
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("format") != INDEX_FORMAT:
+        raise ValueError(f"Índice con formato desconocido: {path}")
+    if manifest.get("version", 0) > INDEX_VERSION:
+        raise ValueError(
+            f"Índice versión {manifest.get('version')} no soportada (máx {INDEX_VERSION}): {path}"
+        )
+    return manifest
+
+
+def open_index(index_dir: str):
+    try:
+        return _open_index(index_dir)
+    except FileNotFoundError:
+        # se publicaron dos generaciones entre leer el manifest y abrir sus
+        # archivos: el manifest actual apunta a otros
+        return _open_index(index_dir)
+
+
+def _open_index(index_dir: str):
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        return None
+
+    files = manifest["files"]
+
+    def load(name):
+        if name not in files:
+            return None
+        return np.load(os.path.join(index_dir, files[name]), mmap_mode="r")
+
+    offsets = load("offsets")
+
+    blob_path = os.path.join(index_dir, files["chunks"])
+    if os.path.getsize(blob_path) > 0:
+        blob = np.memmap(blob_path, dtype="uint8", mode="r")
+    else:
+        blob = np.zeros(0, dtype="uint8")
+
+    lexical = LexicalIndex.open(index_dir, manifest)
+    return DocumentIndex(
+        index_dir, manifest, load("embeddings"), offsets, blob, lexical,
+        load("hashes"), load("quantized"), load("scales"),
+    )
+
+
+# ==========================================================
+#  Migración desde los .pkl anteriores
+# ==========================================================
+
+class _LegacyIndexUnpickler(pickle.Unpickler):
+    """
+    Solo permite lo que contenía un .pkl de índice (dict, list, str y un
+    ndarray): cualquier otra clase se rechaza en vez de ejecutarse.
+    """
+
+    ALLOWED = {
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "_reconstruct"),
+        ("numpy.core.multiarray", "scalar"),
+        ("numpy._core.multiarray", "scalar"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f"Clase no permitida en índice legado: {module}.{name}")
+        return super().find_class(module, name)
+
+
+def migrate_pickle(pkl_path: str, index_dir: str) -> dict:
+    with open(pkl_path, "rb") as f:
+        data = _LegacyIndexUnpickler(io.BytesIO(f.read())).load()
+
+    chunks = list(data.get("chunks", []))
+    embeddings = np.asarray(data.get("embeddings", []), dtype="float32")
+
+    manifest = write_index(index_dir, chunks, embeddings)
+    os.remove(pkl_path)
+    log.info("🔄 Índice migrado a formato v%d: %s", INDEX_VERSION, pkl_path)
+    return manifest
@@ -0,0 +1,233 @@
+import asyncio
+import os
+from mimetypes import guess_extension
+
+import httpx
+
+from .config import DOCS_DIR, UPLOADS_DIR, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_SIZE, DOWNLOAD_PER_HOST
+from .http_client import get_client
+from .rag import build_index_stream
+from .schemas import DocumentMetadata
+from .extraction import iter_extract
+
+ALLOWED_EXTENSIONS = [".txt", ".pdf", ".docx", ".odt"]
+
+
+# ==========================================================
+#  URLs: Google Docs / Drive y descarga
+# ==========================================================
+
+def resolve_url(original_url: str) -> str:
+    """Convierte enlaces de Google Docs/Drive a su URL de descarga directa."""
+    url = original_url
+
+    # -------------------------------
+    #   AUTO-GOOGLE DOCS
+    # -------------------------------
+    if "docs.google.com/document" in original_url and "export" not in original_url:
+        try:
+            doc_id = original_url.split("/d/")[1].split("/")[0]
+            url = f"https://docs.google.com/document/d/{doc_id}/export?format=docx"
+        except IndexError:
+            raise ValueError("URL de Google Docs inválida")
+
+    # -------------------------------
+    #   AUTO-GOOGLE DRIVE
+    # -------------------------------
+    if "drive.google.com" in original_url and "uc?export=download" not in original_url:
+        try:
+            if "id=" in original_url:
+                file_id = original_url.split("id=")[1].split("&")[0]
+            else:
+                # Enlace tipo /file/d/<id>/
+                file_id = original_url.split("/d/")[1].split("/")[0]
+            url = f"https://drive.google.com/uc?id={file_id}&export=download"
+        except IndexError:
+            raise ValueError("URL de Google Drive inválida")
+
+    return url
+
+
+def guess_remote_extension(content_type: str, original_url: str) -> str:
+    ext = guess_extension(content_type.split(";")[0])
+
+    if ext is None:
+        if "pdf" in content_type:
+            ext = ".pdf"
+        elif "word" in content_type or "docx" in content_type:
+            ext = ".docx"
+        elif "opendocument" in content_type or "odt" in original_url:
+            ext = ".odt"
+        elif "text" in content_type:
+            ext = ".txt"
+        else:
+            ext = ".txt"
+
+    return ext
+
+
+class PayloadTooLargeError(ValueError):
+    """El archivo supera UPLOAD_MAX_BYTES."""
+
+
+def _too_large(max_bytes: int = UPLOAD_MAX_BYTES) -> PayloadTooLargeError:
+    return PayloadTooLargeError(
+        f"El archivo supera el límite de {max_bytes / (1024 * 1024):.0f} MB"
+    )
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def save_upload(file, path: str, max_bytes: int = UPLOAD_MAX_BYTES) -> int:
+    """
+    Copia un UploadFile (ya en un archivo temporal de Starlette) a `path`
+    por bloques, sin tenerlo entero en memoria. Devuelve los bytes escritos.
+    """
+    written = 0
+    try:
+        with open(path, "wb") as out:
+            while block := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(block)
+                if written > max_bytes:
+                    raise _too_large(max_bytes)
+                out.write(block)
+    except BaseException:
+        _remove(path)
+        raise
+    return written
+
+
+# descargas en curso por host: un lote de URLs del mismo servidor no abre
+# todas las conexiones del cliente contra él
+_host_slots = {}
+
+
+def _host_slot(url: str) -> asyncio.Semaphore:
+    try:
+        host = httpx.URL(url).host
+    except httpx.InvalidURL:
+        host = ""
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(max(1, DOWNLOAD_PER_HOST))
+    return slot
+
+
+async def download(url: str, original_url: str, job_id: str) -> tuple[str, str]:
+    """
+    Descarga `url` a UPLOADS_DIR en streaming, con el cliente compartido y
+    a lo sumo DOWNLOAD_PER_HOST descargas a la vez por host.
+    Devuelve (ruta, nombre de archivo).
+    """
+    async with _host_slot(url):
+        return await _download(url, original_url, job_id)
+
+
+async def _download(url: str, original_url: str, job_id: str) -> tuple[str, str]:
+    client = get_client()
+    try:
+        async with client.stream("GET", url) as r:
+            if r.status_code != 200:
+                raise ValueError(f"Error HTTP al descargar: {r.status_code}")
+
+            length = r.headers.get("content-length")
+            if length is not None and length.isdigit() and int(length) > UPLOAD_MAX_BYTES:
+                raise _too_large()
+
+            ext = guess_remote_extension(r.headers.get("content-type", ""), original_url)
+            path = os.path.join(UPLOADS_DIR, f"{job_id}{ext}")
+            written = 0
+            try:
+                with open(path, "wb") as f:
+                    async for block in r.aiter_bytes(UPLOAD_CHUNK_SIZE):
+                        written += len(block)
+                        if written > UPLOAD_MAX_BYTES:
+                            raise _too_large()
+                        f.write(block)
+            except BaseException:
+                _remove(path)
+                raise
+    except httpx.HTTPError as e:
+        raise ValueError(f"No se pudo descargar la URL: {e}")
+
+    return path, f"remote_file{ext}"
+
+
+# ==========================================================
+#  Trabajo de ingesta: descarga -> extracción -> chunks -> embeddings
+#  (en streaming: las etapas corren solapadas, ver build_index_stream)
+# ==========================================================
+
+def cleanup_job(job: dict):
+    """Al terminar el trabajo (bien o mal) el archivo subido ya no hace falta."""
+    if job.get("path"):
+        _remove(job["path"])
+
+
+async def run_ingestion(job: dict, jobs, store):
+    if job.get("url") and not (job.get("path") and os.path.exists(job["path"])):
+        jobs.update(job, stage="downloading")
+        path, filename = await download(job["url"], job["original_url"], job["id"])
+        jobs.update(job, path=path, filename=filename)
+
+    jobs.update(job, stage="extracting")
+    doc_id = job["document_id"]
+    txt_path = os.path.join(DOCS_DIR, f"{doc_id}.txt")
+    tmp_path = f"{txt_path}.{job['id']}.tmp"
+    state = {"size": 0, "extracted": 0.0, "complete": False, "usable": False}
+
+    # al actualizar, los chunks que no cambiaron reutilizan su embedding
+    previous = store.load_index(doc_id) if job.get("update") else None
+    stats = {}
+
+    async def pieces():
+        # el txt interno se escribe a medida que llega el texto (y reemplaza
+        # al anterior solo si todo sale bien)
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            try:
+                async for text, fraction in iter_extract(job["filename"], job["path"]):
+                    out.write(text)
+                    state["size"] += len(text)
+                    state["extracted"] = fraction
+                    state["usable"] = state["usable"] or bool(text.strip())
+                    yield text
+                state["complete"] = True
+            except ValueError as e:
+                raise ValueError(f"Error extrayendo texto: {e}")
+
+    def progress(done, seen):
+        # el total de chunks no se conoce hasta terminar de extraer
+        jobs.update(
+            job,
+            stage="embedding",
+            n_embedded=done,
+            n_chunks=seen,
+            progress=round(100.0 * state["extracted"] * done / seen, 1),
+        )
+
+    try:
+        n_chunks = await build_index_stream(
+            doc_id, pieces(), store, on_progress=progress, previous=previous, stats=stats
+        )
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if state["complete"] and not state["usable"]:
+            raise ValueError("El documento contiene 0 texto utilizable.")
+        raise
+    os.replace(tmp_path, txt_path)
+
+    store.add(DocumentMetadata(
+        id=doc_id,
+        filename=job["filename"],
+        size=state["size"],
+        n_chunks=n_chunks,
+    ))
+
+    jobs.update(job, stage="done", progress=100.0, size=state["size"],
+                n_chunks=n_chunks, n_embedded=stats["embedded"], n_reused=stats["reused"])
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+from .locks import FileLock, LockBusyError
+
+log = logging.getLogger(__name__)
+
+# ==========================================================
+#  Cola de trabajos de ingesta
+#
+#  Cada trabajo es un JSON en JOBS_DIR/<job_id>.json que se reescribe
+#  (atómicamente) en cada cambio de etapa o de progreso. Al reiniciar,
+#  los trabajos sin terminar se vuelven a encolar.
+#
+#  Con varios workers, el proceso dueño de un trabajo tiene tomado
+#  JOBS_DIR/<job_id>.lock mientras esté sin terminar: al arrancar, otro
+#  worker solo reanuda los trabajos cuyo dueño ya no existe.
+#
+#  Al terminar (bien o mal) un trabajo se llama a `on_done(job)`, que
+#  libera lo que haya dejado (el archivo subido). El registro de un
+#  trabajo terminado se borra pasados `retention` segundos: al arrancar
+#  y cada PRUNE_EVERY trabajos terminados.
+#
+#  Los trabajos de una ingesta masiva (con `bulk_id`) van a una cola
+#  aparte, sin tope y con sus propios workers: una subida suelta nunca
+#  espera detrás de los mil documentos de un lote. Todos los trabajos de
+#  un lote comparten el lock del lote (un archivo abierto, no mil).
+# ==========================================================
+
+STAGES_DONE = ("done", "error")
+PRUNE_EVERY = 100
+
+
+class QueueFullError(RuntimeError):
+    """La cola de ingesta llegó a su límite."""
+
+
+def _lock_key(job: dict) -> str:
+    return job.get("bulk_id") or job["id"]
+
+
+class JobQueue:
+    def __init__(self, jobs_dir: str, handler, workers: int = 2, max_queue: int = 32, bulk_workers: int = 4,
+                 on_done=None, retention: float = 7 * 24 * 3600):
+        """
+        `handler(job, queue)` es la corrutina que procesa un trabajo; usa
+        `queue.update(job, ...)` para reportar etapa y progreso.
+        """
+        self.jobs_dir = jobs_dir
+        self.handler = handler
+        self.on_done = on_done
+        self.retention = retention
+        self.workers = max(1, workers)
+        self.bulk_workers = max(1, bulk_workers)
+        self.max_queue = max_queue
+
+        self._queue = asyncio.Queue()
+        self._bulk_queue = asyncio.Queue()
+        self._jobs = {}
+        self._claims = {}
+        self._tasks = []
+        self._finished = 0
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    # ------------------------------------------------------
+    #  Persistencia
+    # ------------------------------------------------------
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _claim(self, job: dict) -> bool:
+        """Marca el trabajo como de este proceso; False si ya tiene dueño."""
+        key = _lock_key(job)
+        if key in self._claims:
+            self._claims[key][1] += 1
+            return True
+
+        lock = FileLock(os.path.join(self.jobs_dir, f"{key}.lock"))
+        try:
+            lock.acquire(blocking=False)
+        except LockBusyError:
+            return False
+        self._claims[key] = [lock, 1]
+        return True
+
+    def _release(self, job: dict):
+        key = _lock_key(job)
+        claim = self._claims.get(key)
+        if claim is None:
+            return
+        claim[1] -= 1
+        if claim[1] == 0:
+            del self._claims[key]
+            try:
+                os.remove(claim[0].path)
+            except OSError:
+                pass
+            claim[0].release()
+
+    def _save(self, job: dict):
+        tmp = self._path(job["id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp, self._path(job["id"]))
+
+    def get(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        path = self._path(job_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def update(self, job: dict, **fields):
+        job.update(fields)
+        job["updated_at"] = time.time()
+        self._save(job)
+
+    def prune(self) -> int:
+        """Borra los registros de trabajos terminados hace más de `retention` segundos."""
+        limit = time.time() - self.retention
+        removed = 0
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            if not name.endswith(".json") or name[:-5] in self._jobs:
+                continue
+            try:
+                # el registro se reescribe en cada cambio: si es reciente no hace falta leerlo
+                if os.path.getmtime(path) >= limit:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                if job.get("stage") in STAGES_DONE:
+                    os.remove(path)
+                    removed += 1
+            except (OSError, ValueError):
+                continue
+        if removed:
+            log.info("🧹 %d registros de trabajos terminados eliminados", removed)
+        return removed
+
+    # ------------------------------------------------------
+    #  Encolar / procesar
+    # ------------------------------------------------------
+
+    def active_for(self, document_id: str) -> bool:
+        """¿Hay un trabajo sin terminar para este documento?"""
+        return any(
+            job.get("document_id") == document_id and job["stage"] not in STAGES_DONE
+            for job in self._jobs.values()
+        )
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def bulk_depth(self) -> int:
+        return self._bulk_queue.qsize()
+
+    def submit(self, bulk_id: str = None, **fields) -> dict:
+        """Encola un trabajo; con `bulk_id`, en la cola de lotes (sin tope)."""
+        if bulk_id is None and self._queue.qsize() >= self.max_queue:
+            raise QueueFullError(f"Cola de ingesta llena ({self.max_queue} trabajos en espera)")
+
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "stage": "queued",
+            "progress": 0.0,
+            "n_chunks": 0,
+            "n_embedded": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        job.update(fields)
+        if bulk_id is not None:
+            job["bulk_id"] = bulk_id
+
+        self._claim(job)
+        self._save(job)
+        self._jobs[job["id"]] = job
+        self._queue_for(job).put_nowait(job["id"])
+        return job
+
+    def _queue_for(self, job: dict) -> asyncio.Queue:
+        return self._bulk_queue if job.get("bulk_id") else self._queue
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job_id = await queue.get()
+            job = self._jobs[job_id]
+            try:
+                await self.handler(job, self)
+                if job["stage"] != "done":
+                    self.update(job, stage="done", progress=100.0)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise   # stop(): el trabajo se reanuda al reiniciar
+                # un futuro cancelado por otro (no este worker): falla el
+                # trabajo, el worker sigue atendiendo la cola
+                self._fail(job, "operación cancelada")
+            except Exception as e:
+                self._fail(job, e)
+            finally:
+                queue.task_done()
+                if job["stage"] in STAGES_DONE:
+                    self._jobs.pop(job_id, None)
+                    self._release(job)
+                    self._finish(job)
+
+    def _finish(self, job: dict):
+        if self.on_done is not None:
+            try:
+                self.on_done(job)
+            except Exception as e:
+                log.warning("⚠️ Limpieza del trabajo %s falló: %s", job["id"], e)
+        self._finished += 1
+        if self._finished % PRUNE_EVERY == 0:
+            self.prune()
+
+    def _fail(self, job: dict, error):
+        log.error(
+            "❌ Trabajo %s falló en etapa '%s': %s", job["id"], job["stage"], error,
+            extra={"job_id": job["id"], "document_id": job["document_id"]},
+        )
+        self.update(job, stage="error", error=f"{job['stage']}: {error}")
+
+    def start(self):
+        self.prune()
+
+        # trabajos que quedaron a medias antes de un reinicio
+        pending = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                job = json.load(f)
+            if job.get("stage") in STAGES_DONE or job["id"] in self._jobs or not self._claim(job):
+                continue
+            # releído con el lock tomado: el dueño anterior pudo terminarlo recién
+            job = self.get(job["id"])
+            if job.get("stage") in STAGES_DONE:
+                self._release(job)
+                continue
+            pending.append(job)
+
+        for job in sorted(pending, key=lambda j: j["created_at"]):
+            self._jobs[job["id"]] = job
+            self.update(job, stage="queued", resumed=True)
+            self._queue_for(job).put_nowait(job["id"])
+
+        if pending:
+            log.info("🔁 Reanudando %d trabajos de ingesta", len(pending))
+
+        self._tasks = (
+            [asyncio.create_task(self._worker(self._queue)) for _ in range(self.workers)]
+            + [asyncio.create_task(self._worker(self._bulk_queue)) for _ in range(self.bulk_workers)]
+        )
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # los que quedaron sin terminar los reanuda el próximo que arranque
+        for lock, _ in self._claims.values():
+            lock.release()
+        self._claims.clear()
@@ -0,0 +1,224 @@
+import math
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+
+
+# ==========================================================
+#  Índice léxico (BM25) por documento
+#
+#  Se guarda junto a los embeddings, con la misma generación:
+#      terms.<gen>.txt          vocabulario ordenado, un término por línea
+#      term_offsets.<gen>.npy   int64 (n_terms + 1), rango de cada término
+#      postings.<gen>.npy       int32, ids de chunk de cada término
+#      tfs.<gen>.npy            uint16, frecuencia del término en ese chunk
+#      chunk_lens.<gen>.npy     int32 (n_chunks), tokens por chunk
+#
+#  Sirve para lo que los embeddings pierden: números de pieza, artículos,
+#  siglas y cualquier coincidencia exacta.
+# ==========================================================
+
+TOKENIZER_VERSION = 1
+RRF_K = 60
+
+STOPWORDS = frozenset("""
+    a al algo ante como con cual cuando de del desde donde e el ella ellos en
+    entre era es esa ese eso esta este esto fue ha hay la las le les lo los mas
+    me mi muy ni no nos o para pero por que se ser si sin sobre son su sus tambien
+    te tiene tu un una uno unos unas y ya
+""".split())
+
+_COMBINING = re.compile(r"[\u0300-\u036f]")
+# palabras y códigos: "ab-1234", "art.15", "3.2.1", "iso/iec" quedan enteros
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-./_][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-./_]")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Minúsculas, sin acentos y sin stopwords. Los códigos compuestos se
+    indexan enteros y también por partes ("ab-1234" -> ab-1234, ab, 1234).
+    """
+    text = _COMBINING.sub("", unicodedata.normalize("NFKD", text.lower()))
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(p for p in _SEPARATORS.split(token) if p and p not in STOPWORDS)
+    return tokens
+
+
+def code_terms(tokens: list[str]) -> list[str]:
+    """Términos con pinta de código: números de pieza, artículos, versiones..."""
+    return [
+        t for t in tokens
+        if any(c.isdigit() for c in t) and (not t.isdigit() or len(t) >= 3)
+    ]
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K) -> np.ndarray:
+    """Ids ordenados por sum(1 / (k + rango)) sobre todas las listas."""
+    fused = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            i = int(i)
+            fused[i] = fused.get(i, 0.0) + 1.0 / (k + rank + 1)
+    return np.array(sorted(fused, key=fused.get, reverse=True), dtype="int64")
+
+
+def top_ids(scores: np.ndarray, k: int) -> np.ndarray:
+    """Posiciones de los k mayores puntajes, de mayor a menor."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype="int64")
+    if k < len(scores):
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+class LexicalIndexBuilder:
+    """Acumula postings a medida que llegan los chunks (ver IndexWriter)."""
+
+    def __init__(self):
+        self._postings = {}
+        self._lengths = array("i")
+
+    def add(self, chunks: list[str]):
+        for chunk in chunks:
+            chunk_id = len(self._lengths)
+            tokens = tokenize(chunk)
+            self._lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                entry = self._postings.get(term)
+                if entry is None:
+                    entry = self._postings[term] = (array("i"), array("i"))
+                entry[0].append(chunk_id)
+                entry[1].append(tf)
+
+    def _arrays(self):
+        terms = sorted(self._postings)
+        sizes = [len(self._postings[t][0]) for t in terms]
+        term_offsets = np.zeros(len(terms) + 1, dtype="int64")
+        np.cumsum(sizes, out=term_offsets[1:])
+
+        postings = np.empty(int(term_offsets[-1]), dtype="int32")
+        tfs = np.empty(int(term_offsets[-1]), dtype="uint16")
+        for t, start, end in zip(terms, term_offsets[:-1], term_offsets[1:]):
+            ids, counts = self._postings[t]
+            postings[start:end] = np.frombuffer(ids, dtype="int32")
+            tfs[start:end] = np.minimum(np.frombuffer(counts, dtype="int32"), 65535)
+
+        chunk_lens = np.frombuffer(self._lengths, dtype="int32").copy()
+        return terms, term_offsets, postings, tfs, chunk_lens
+
+    def build(self) -> "LexicalIndex":
+        return LexicalIndex(*self._arrays())
+
+    def write(self, index_dir: str, generation: str) -> tuple[dict, dict]:
+        """Escribe los archivos; devuelve (archivos, metadatos) para el manifest."""
+        terms, term_offsets, postings, tfs, chunk_lens = self._arrays()
+        files = {name: f"{name}.{generation}.npy" for name in LexicalIndex.ARRAYS}
+        files["terms"] = f"terms.{generation}.txt"
+
+        with open(os.path.join(index_dir, files["terms"]), "w", encoding="utf-8") as f:
+            f.write("\n".join(terms))
+        for name, data in zip(LexicalIndex.ARRAYS, (term_offsets, postings, tfs, chunk_lens)):
+            np.save(os.path.join(index_dir, files[name]), data)
+
+        meta = {"tokenizer": TOKENIZER_VERSION, "n_terms": len(terms), "n_postings": len(postings)}
+        return files, meta
+
+
+class LexicalIndex:
+    K1 = 1.2
+    B = 0.75
+    ARRAYS = ("term_offsets", "postings", "tfs", "chunk_lens")
+
+    def __init__(self, terms, term_offsets, postings, tfs, chunk_lens):
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.chunk_lens = chunk_lens
+        self._vocab = None
+        self._norm = None
+
+    @classmethod
+    def from_chunks(cls, chunks: list[str]) -> "LexicalIndex":
+        """Para índices escritos antes de existir el índice léxico: se arma en memoria."""
+        builder = LexicalIndexBuilder()
+        builder.add(chunks)
+        return builder.build()
+
+    @classmethod
+    def open(cls, index_dir: str, manifest: dict):
+        lexical = manifest.get("lexical") or {}
+        if lexical.get("tokenizer") != TOKENIZER_VERSION:
+            return None
+
+        files = manifest["files"]
+        with open(os.path.join(index_dir, files["terms"]), "r", encoding="utf-8") as f:
+            text = f.read()
+        terms = text.split("\n") if text else []
+        arrays = [np.load(os.path.join(index_dir, files[name]), mmap_mode="r") for name in cls.ARRAYS]
+        return cls(terms, *arrays)
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            sum(getattr(self, name).nbytes for name in self.ARRAYS)
+            + sum(len(t) + 1 for t in self.terms)
+        )
+
+    def load_into_memory(self) -> "LexicalIndex":
+        return LexicalIndex(self.terms, *(np.array(getattr(self, name)) for name in self.ARRAYS))
+
+    def _term_id(self, term: str):
+        if self._vocab is None:
+            self._vocab = {t: i for i, t in enumerate(self.terms)}
+        return self._vocab.get(term)
+
+    def matching(self, term: str) -> np.ndarray:
+        """Chunks que contienen `term` tal cual."""
+        t = self._term_id(term)
+        if t is None:
+            return np.zeros(0, dtype="int32")
+        return np.asarray(self.postings[int(self.term_offsets[t]):int(self.term_offsets[t + 1])])
+
+    def scores(self, tokens: list[str]) -> np.ndarray:
+        """Puntaje BM25 de cada chunk para los términos de la consulta."""
+        n = len(self.chunk_lens)
+        scores = np.zeros(n, dtype="float32")
+        if n == 0:
+            return scores
+
+        if self._norm is None:
+            lens = np.asarray(self.chunk_lens, dtype="float32")
+            avg = float(lens.mean()) or 1.0
+            self._norm = self.K1 * (1.0 - self.B + self.B * lens / avg)
+
+        for term in set(tokens):
+            t = self._term_id(term)
+            if t is None:
+                continue
+            start, end = int(self.term_offsets[t]), int(self.term_offsets[t + 1])
+            ids = np.asarray(self.postings[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype="float32")
+            df = end - start
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (self.K1 + 1.0) / (tf + self._norm[ids])
+        return scores
+
+    def top(self, tokens: list[str], k: int) -> np.ndarray:
+        """Hasta k chunks con puntaje > 0, de mayor a menor."""
+        scores = self.scores(tokens)
+        ids = top_ids(scores, k)
+        return ids[scores[ids] > 0]
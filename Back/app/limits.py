@@ -0,0 +1,59 @@
+from fastapi import HTTPException
+from starlette.responses import PlainTextResponse
+
+
+# ==========================================================
+#  Límite de tamaño del cuerpo de las peticiones
+#
+#  Middleware ASGI puro: rechaza con 413 antes de leer nada si el
+#  Content-Length declarado ya supera el límite, y si no lo hay (o miente)
+#  corta en cuanto los bytes recibidos lo superan.
+# ==========================================================
+
+def _under(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix + "/")
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app, max_bytes: int, paths: tuple[str, ...] = (), exclude: tuple[str, ...] = ()):
+        """`paths`: prefijos a los que aplica (vacío = todos); `exclude`: prefijos a los que no."""
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+        self.exclude = exclude
+
+    def _applies(self, scope) -> bool:
+        return (
+            scope["type"] == "http"
+            and scope["method"] in ("POST", "PUT")
+            and (not self.paths or any(_under(scope["path"], p) for p in self.paths))
+            and not any(_under(scope["path"], p) for p in self.exclude)
+        )
+
+    def _detail(self) -> str:
+        return f"El archivo supera el límite de {self.max_bytes / (1024 * 1024):.0f} MB"
+
+    async def __call__(self, scope, receive, send):
+        if not self._applies(scope):
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = PlainTextResponse(self._detail(), status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # HTTPException atraviesa el parseo del formulario de
+                    # FastAPI y termina como respuesta 413
+                    raise HTTPException(413, self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
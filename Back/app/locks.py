@@ -0,0 +1,78 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+
+# ==========================================================
+#  Locks entre procesos (uvicorn --workers N)
+#
+#  Un archivo por recurso, bloqueado con flock (msvcrt en Windows). El
+#  sistema libera el lock si el proceso muere, así que un trabajo o una
+#  escritura a medias de un worker caído no queda bloqueada para siempre.
+# ==========================================================
+
+class LockBusyError(RuntimeError):
+    """Otro proceso tiene el lock."""
+
+
+class FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> "FileLock":
+        """Toma el lock; sin `blocking`, LockBusyError si otro proceso lo tiene."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            raise LockBusyError(f"Recurso en uso por otro proceso: {self.path}")
+        self._fd = fd
+        return self
+
+    def release(self):
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def is_held_elsewhere(self) -> bool:
+        """¿Lo tiene otro proceso? (prueba tomarlo y lo suelta)."""
+        if self.locked:
+            return False
+        try:
+            self.acquire(blocking=False)
+        except LockBusyError:
+            return True
+        self.release()
+        return False
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    lock = FileLock(path).acquire(blocking)
+    try:
+        yield lock
+    finally:
+        lock.release()
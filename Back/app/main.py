@@ -1,17 +1,82 @@
 import uuid
 import os
-import httpx
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from .logs import setup_logging
+
+# antes de los demás imports: algunos módulos ya registran eventos al cargarse
+setup_logging()
 
 from .storage import DocumentStore, delete_document   # <-- FALTABA ESTO
-from .schemas import DocumentMetadata, DocumentListResponse, QueryRequest, QueryResponse
-from .rag import build_index, answer
-from .config import DOCS_DIR
+from .schemas import (
+    DocumentListResponse, QueryRequest, QueryResponse,
+    LibraryQueryRequest, LibraryQueryResponse, JobStatus,
+    BatchQueryRequest, BatchQueryResult, BulkStatus, SessionStatus,
+)
+from .rag import answer, answer_batch, answer_library, answer_stream, answer_turn
+from .config import (
+    INDEX_CACHE_PRELOAD, WARMUP_ENABLED, JOBS_DIR, UPLOADS_DIR, INGEST_WORKERS, INGEST_QUEUE_MAX, JOBS_RETENTION,
+    UPLOAD_MAX_BYTES, BATCH_MAX_QUESTIONS, BATCH_LLM_CONCURRENCY,
+    DOCUMENTS_PAGE_SIZE, DOCUMENTS_PAGE_MAX, BULK_WORKERS, BULK_ARCHIVE_MAX_BYTES,
+)
+from .embeddings import cache as embedding_cache
+from .jobs import JobQueue, QueueFullError
+from . import bulk
+from . import extraction
+from . import http_client
+from .ingest import (
+    ALLOWED_EXTENSIONS, PayloadTooLargeError, cleanup_job, resolve_url, run_ingestion, save_upload,
+)
+from .limits import BodySizeLimitMiddleware
+from .locks import LockBusyError
+from .scheduler import OverloadedError, generations, scheduler
+from .sessions import SessionError, sessions
+from .warmup import warmup
+from . import context
+from . import metrics
+
+log = logging.getLogger(__name__)
 
-from mimetypes import guess_extension
-from .text_extractor import extract_text
-app = FastAPI(title="RAG PoC Backend")
+store = DocumentStore()
+jobs = JobQueue(
+    JOBS_DIR,
+    lambda job, queue: run_ingestion(job, queue, store),
+    workers=INGEST_WORKERS,
+    max_queue=INGEST_QUEUE_MAX,
+    bulk_workers=BULK_WORKERS,
+    on_done=cleanup_job,
+    retention=JOBS_RETENTION,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # modelos e índices se cargan en segundo plano: el servidor atiende
+    # desde ya y /health informa cuándo terminó (`ready`)
+    warmup.start(
+        models=WARMUP_ENABLED,
+        load_indexes=(lambda: store.preload(INDEX_CACHE_PRELOAD)) if INDEX_CACHE_PRELOAD > 0 else None,
+    )
+    jobs.start()
+    bulk.prune()
+    yield
+    await warmup.stop()
+    await jobs.stop()
+    await http_client.aclose()
+    extraction.shutdown()
+    store.save_usage()
+
+
+app = FastAPI(title="RAG PoC Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,161 +85,342 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-store = DocumentStore()
+# subidas: 413 por Content-Length o por bytes recibidos, antes de parsear todo
+# (margen para las cabeceras y delimitadores del multipart)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=UPLOAD_MAX_BYTES + 64 * 1024,
+    paths=("/documents",),
+    exclude=("/documents/bulk",),
+)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=BULK_ARCHIVE_MAX_BYTES + 64 * 1024,
+    paths=("/documents/bulk",),
+)
+
+# cola de llamadas a Ollama llena: 429 con el tiempo estimado de espera
+@app.exception_handler(OverloadedError)
+async def overloaded(request: Request, exc: OverloadedError):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    """
+    Vivo si responde (`status`); `ready` indica además que terminó el
+    arranque en caliente (modelos cargados en Ollama, índices precargados).
+    """
+    return {
+        "status": "ok",
+        "ready": warmup.ready,
+        "warmup": warmup.stats(),
+        "index_cache": store.index_cache.stats(),
+        "answer_cache": store.answer_cache.stats() if store.answer_cache else None,
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "ingest_queue": jobs.depth,
+        "bulk_queue": jobs.bulk_depth,
+        "scheduler": scheduler.stats(),
+        "generations": generations.stats(),
+        "sessions": sessions.stats(),
+    }
+
+@app.get("/health/ready")
+def readiness():
+    """
+    Para balanceadores y orquestadores: 503 hasta terminar el arranque en
+    caliente, o si no se pudo cargar un modelo (`warmup.errors`).
+    """
+    if not warmup.ready:
+        return JSONResponse(status_code=503, content={"ready": False, "warmup": warmup.stats()})
+    return {"ready": True}
+
+def cache_metrics():
+    caches = {"index": store.index_cache, "embedding": embedding_cache, "answer": store.answer_cache}
+    caches = {name: c for name, c in caches.items() if c is not None}
+    return [
+        ("rag_cache_hits_total", "counter", "Aciertos de caché",
+         [({"cache": name}, c.hits) for name, c in caches.items()]),
+        ("rag_cache_misses_total", "counter", "Fallos de caché",
+         [({"cache": name}, c.misses) for name, c in caches.items()]),
+        ("rag_context_tokens_saved_total", "counter", "Tokens de prompt ahorrados al unir chunks",
+         [({}, context.totals["tokens_saved"])]),
+        ("rag_ollama_active", "gauge", "Llamadas a Ollama en vuelo", [({}, scheduler.active)]),
+        ("rag_ollama_waiting", "gauge", "Llamadas a Ollama esperando cupo",
+         [({"lane": lane}, n) for lane, n in scheduler.stats()["waiting"].items()]),
+        ("rag_ollama_rejected_total", "counter", "Llamadas rechazadas por cola llena (429)",
+         [({"lane": lane}, n) for lane, n in scheduler.rejected.items()]),
+        ("rag_ingest_queue", "gauge", "Trabajos de ingesta en cola",
+         [({"queue": "single"}, jobs.depth), ({"queue": "bulk"}, jobs.bulk_depth)]),
+        ("rag_ready", "gauge", "1 cuando terminó el arranque en caliente", [({}, int(warmup.ready))]),
+        ("rag_sessions", "gauge", "Sesiones de chat en memoria", [({}, len(sessions))]),
+        ("rag_session_prefix_tokens_total", "counter",
+         "Tokens de prompt repetidos del turno anterior (reutilizables por Ollama)",
+         [({}, sessions.prefix_tokens)]),
+    ]
+
+metrics.register_collector(cache_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Métricas de este proceso en formato de texto de Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def submit_job(**fields):
+    try:
+        return jobs.submit(**fields)
+    except QueueFullError as e:
+        raise HTTPException(429, str(e))
 
-@app.post("/documents", response_model=DocumentMetadata)
+@app.post("/documents", response_model=JobStatus, status_code=202)
 async def upload(file: UploadFile = File(...)):
-    allowed = [".txt", ".pdf", ".docx", ".odt"]
-    if not any(file.filename.lower().endswith(ext) for ext in allowed):
+    if not any(file.filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS):
         raise HTTPException(400, "Solo .txt, .pdf, .docx, .odt")
 
-    file_bytes = await file.read()
+    if jobs.depth >= jobs.max_queue:
+        raise HTTPException(429, "Cola de ingesta llena, reintente más tarde")
 
-    # extraer texto
-    from .text_extractor import extract_text
+    doc_id = str(uuid.uuid4())
+    ext = os.path.splitext(file.filename)[1].lower()
+    path = os.path.join(UPLOADS_DIR, f"{doc_id}{ext}")
     try:
-        content = extract_text(file.filename, file_bytes)
-    except Exception as e:
-        raise HTTPException(400, f"Error extrayendo texto: {e}")
-
-    if not content.strip():
-        raise HTTPException(400, "El documento contiene 0 texto utilizable.")
+        await save_upload(file, path)
+    except PayloadTooLargeError as e:
+        raise HTTPException(413, str(e))
+
+    return submit_job(document_id=doc_id, filename=file.filename, path=path)
+
+@app.put("/documents/{doc_id}", response_model=JobStatus, status_code=202)
+async def update_document(doc_id: str, file: UploadFile = File(...)):
+    """
+    Reemplaza el contenido de un documento existente. Los chunks que no
+    cambiaron reutilizan su embedding; el índice nuevo se publica de una
+    vez al terminar, y mientras tanto las consultas usan el anterior.
+    """
+    if not store.get(doc_id):
+        raise HTTPException(404, "Documento no encontrado")
 
-    doc_id = str(uuid.uuid4())
-    path = os.path.join(DOCS_DIR, f"{doc_id}.txt")
+    if not any(file.filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS):
+        raise HTTPException(400, "Solo .txt, .pdf, .docx, .odt")
 
-    # guardamos como txt interno
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    if jobs.active_for(doc_id) or store.index_busy(doc_id):
+        raise HTTPException(409, "El documento ya se está procesando")
 
-    n_chunks = await build_index(doc_id, content, store)
+    if jobs.depth >= jobs.max_queue:
+        raise HTTPException(429, "Cola de ingesta llena, reintente más tarde")
 
-    meta = DocumentMetadata(
-        id=doc_id,
-        filename=file.filename,
-        size=len(content),
-        n_chunks=n_chunks
-    )
-    store.add(meta)
+    ext = os.path.splitext(file.filename)[1].lower()
+    path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4()}{ext}")
+    try:
+        await save_upload(file, path)
+    except PayloadTooLargeError as e:
+        raise HTTPException(413, str(e))
 
-    return meta
+    return submit_job(document_id=doc_id, filename=file.filename, path=path, update=True)
 
-@app.post("/documents/byurl", response_model=DocumentMetadata)
+@app.post("/documents/byurl", response_model=JobStatus, status_code=202)
 async def upload_by_url(url: str = Form(...)):
     original_url = url.strip()
-
-    # -------------------------------
-    #   AUTO-GOOGLE DOCS
-    # -------------------------------
-    if "docs.google.com/document" in original_url and "export" not in original_url:
-        try:
-            doc_id = original_url.split("/d/")[1].split("/")[0]
-            url = f"https://docs.google.com/document/d/{doc_id}/export?format=docx"
-        except:
-            raise HTTPException(400, "URL de Google Docs inválida")
-
-    # -------------------------------
-    #   AUTO-GOOGLE DRIVE
-    # -------------------------------
-    if "drive.google.com" in original_url and "uc?export=download" not in original_url:
-        try:
-            if "id=" in original_url:
-                file_id = original_url.split("id=")[1].split("&")[0]
-            else:
-                # Enlace tipo /file/d/<id>/
-                file_id = original_url.split("/d/")[1].split("/")[0]
-            url = f"https://drive.google.com/uc?id={file_id}&export=download"
-        except:
-            raise HTTPException(400, "URL de Google Drive inválida")
-
-    # -------------------------------
-    #   DESCARGA
-    # -------------------------------
-    async with httpx.AsyncClient() as client:
-        try:
-            r = await client.get(url)
-        except Exception as e:
-            raise HTTPException(400, f"No se pudo descargar la URL: {e}")
-
-    if r.status_code != 200:
-        raise HTTPException(400, f"Error HTTP al descargar: {r.status_code}")
-
-    content_bytes = r.content
-
-    # -------------------------------
-    #   DETECTAR EXTENSIÓN/MIME
-    # -------------------------------
-    content_type = r.headers.get("content-type", "")
-    ext = guess_extension(content_type.split(";")[0])
-
-    if ext is None:
-        if "pdf" in content_type:
-            ext = ".pdf"
-        elif "word" in content_type or "docx" in content_type:
-            ext = ".docx"
-        elif "opendocument" in content_type or "odt" in original_url:
-            ext = ".odt"
-        elif "text" in content_type:
-            ext = ".txt"
-        else:
-            ext = ".txt"
-
-    filename = f"remote_file{ext}"
-
-    # -------------------------------
-    #   EXTRAER TEXTO
-    # -------------------------------
     try:
-        text = extract_text(filename, content_bytes)
-    except Exception as e:
-        raise HTTPException(400, f"Error extrayendo texto: {e}")
+        url = resolve_url(original_url)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    return submit_job(
+        document_id=str(uuid.uuid4()),
+        filename="remote_file",
+        url=url,
+        original_url=original_url,
+    )
 
-    if not text.strip():
-        raise HTTPException(400, "El documento descargado no contiene texto útil.")
+@app.post("/documents/bulk", response_model=BulkStatus, status_code=202)
+async def upload_bulk(archive: Optional[UploadFile] = File(None), urls: Optional[str] = Form(None)):
+    """
+    Ingesta masiva: un ZIP (`archive`) o una lista de URLs (`urls`, una
+    por línea; los enlaces de Google Docs/Drive se convierten como en
+    /documents/byurl). Cada documento es un trabajo aparte en la cola de
+    lotes; el estado de cada uno se consulta en GET /documents/bulk/{id}.
+    """
+    if (archive is None) == (urls is None):
+        raise HTTPException(400, "Enviar un ZIP (archive) o una lista de URLs (urls)")
 
-    # -------------------------------
-    #   GUARDAR COMO TXT INTERNO
-    # -------------------------------
-    doc_id = str(uuid.uuid4())
-    path = os.path.join(DOCS_DIR, f"{doc_id}.txt")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(text)
-
-    # -------------------------------
-    #   INDEXAR
-    # -------------------------------
-    n_chunks = await build_index(doc_id, text, store)
-
-    meta = DocumentMetadata(
-        id=doc_id,
-        filename=filename,
-        size=len(text),
-        n_chunks=n_chunks
-    )
-    store.add(meta)
-    return meta
+    try:
+        if archive is not None:
+            if not archive.filename.lower().endswith(".zip"):
+                raise HTTPException(400, "El archivo debe ser un .zip")
+            path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4()}.zip")
+            try:
+                await save_upload(archive, path, BULK_ARCHIVE_MAX_BYTES)
+            except PayloadTooLargeError as e:
+                raise HTTPException(413, str(e))
+            try:
+                items = await asyncio.to_thread(bulk.unpack_archive, path)
+            except PayloadTooLargeError as e:
+                raise HTTPException(413, str(e))
+            finally:
+                os.remove(path)
+            kind = "archive"
+        else:
+            items = bulk.url_items(urls.splitlines())
+            kind = "urls"
+    except bulk.BulkError as e:
+        raise HTTPException(400, str(e))
+
+    created = bulk.submit(jobs, items, kind)
+    return bulk.status(jobs, created["id"])
+
+@app.get("/documents/bulk/{bulk_id}", response_model=BulkStatus)
+def bulk_status(bulk_id: str):
+    status = bulk.status(jobs, bulk_id)
+    if status is None:
+        raise HTTPException(404, "Lote no encontrado")
+    return status
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Trabajo no encontrado")
+    return job
 
 @app.get("/documents", response_model=DocumentListResponse)
-async def list_docs():
-    return DocumentListResponse(documents=store.list())
+def list_docs(
+    limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=DOCUMENTS_PAGE_MAX),
+    offset: int = Query(0, ge=0),
+    q: Optional[str] = Query(None, max_length=200, description="Filtra por nombre de archivo"),
+    order: Literal["created", "recent", "filename", "size"] = "created",
+):
+    documents, total = store.list(limit, offset, q, order)
+    return DocumentListResponse(documents=documents, total=total, limit=limit, offset=offset)
+
+def open_session(req: QueryRequest):
+    """Sesión de la consulta (None si no trae session_id)."""
+    if req.session_id is None:
+        return None
+    if not 0 < len(req.session_id) <= 64:
+        raise HTTPException(400, "session_id debe tener entre 1 y 64 caracteres")
+
+    # la fecha de actualización cambia al reindexar: la sesión empieza de nuevo
+    try:
+        return sessions.get(req.session_id, req.document_id, store.catalog.version(req.document_id))
+    except SessionError as e:
+        raise HTTPException(409, str(e))
 
 @app.post("/query", response_model=QueryResponse)
 async def query(req: QueryRequest):
+    """
+    Con `session_id` la pregunta es un turno de esa conversación: el LLM
+    ve las preguntas y respuestas anteriores, y `session` informa cuánto
+    del prompt se reutilizó del turno anterior.
+    """
+    if not store.get(req.document_id):
+        raise HTTPException(404, "Documento no encontrado")
+    session = open_session(req)
+
+    start = time.perf_counter()
+    with metrics.track() as timings:
+        if session is None:
+            ans, sources, cached = await answer(store, req.document_id, req.question, req.top_k)
+            turn = None
+        else:
+            ans, sources, turn = await answer_turn(store, session, req.question, req.top_k)
+            cached = False
+    timings["total"] = (time.perf_counter() - start) * 1000
+
+    return QueryResponse(
+        answer=ans, sources=sources, cached=cached, session=turn,
+        timings={k: round(v, 1) for k, v in timings.items()} if req.timings else None,
+    )
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest, request: Request):
+    """
+    Igual que /query pero en Server-Sent Events: `sources` apenas termina
+    la recuperación, un `token` por fragmento generado y `done` al final.
+    """
     if not store.get(req.document_id):
         raise HTTPException(404, "Documento no encontrado")
+    session = open_session(req)
+
+    # rechazar antes de abrir el stream, mientras todavía se puede responder 429
+    scheduler.check("interactive")
+
+    async def events():
+        stream = answer_stream(store, req.document_id, req.question, req.top_k, session)
+        try:
+            async for event, data in stream:
+                if await request.is_disconnected():
+                    log.info("✂ Cliente desconectado: se cancela la generación (%s)", req.document_id)
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            # cierra la conexión con Ollama si el cliente se fue a mitad de camino
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/query/batch")
+async def query_batch(req: BatchQueryRequest):
+    """
+    Muchas preguntas (document_id, question) en una petición. Responde en
+    NDJSON: una línea BatchQueryResult por pregunta, a medida que se
+    completan (el campo `index` indica a qué pregunta corresponde).
+    """
+    if len(req.queries) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(413, f"Máximo {BATCH_MAX_QUESTIONS} preguntas por lote")
+
+    async def lines():
+        async for result in answer_batch(
+            store, req.queries, req.generate, BATCH_LLM_CONCURRENCY
+        ):
+            yield BatchQueryResult(**result).model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/query/library", response_model=LibraryQueryResponse)
+async def query_library(req: LibraryQueryRequest):
+    if req.document_ids is not None:
+        missing = [d for d in req.document_ids if not store.get(d)]
+        if missing:
+            raise HTTPException(404, f"Documentos no encontrados: {', '.join(missing)}")
+
+    ans, sources = await answer_library(
+        store, req.question, req.top_k, req.document_ids, req.nprobe
+    )
+    return LibraryQueryResponse(answer=ans, sources=sources)
 
-    ans, sources = await answer(store, req.document_id, req.question, req.top_k)
-    return QueryResponse(answer=ans, sources=sources)
+@app.get("/sessions/{session_id}", response_model=SessionStatus)
+def get_session(session_id: str):
+    session = sessions.find(session_id)
+    if session is None:
+        raise HTTPException(404, "Sesión no encontrada")
+    return session.describe()
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not sessions.drop(session_id):
+        raise HTTPException(404, "Sesión no encontrada")
+    return {"status": "deleted", "id": session_id}
 
 @app.delete("/documents/{doc_id}")
 def delete_document_endpoint(doc_id: str):
-    deleted = delete_document(doc_id)
+    if jobs.active_for(doc_id):
+        raise HTTPException(409, "El documento se está procesando")
+
+    try:
+        deleted = delete_document(doc_id, store)
+    except LockBusyError:
+        raise HTTPException(409, "El documento se está procesando")
 
     if not deleted:
         raise HTTPException(status_code=404, detail="Documento no encontrado")
+    sessions.drop_document(doc_id)
 
     return {"status": "deleted", "id": doc_id}
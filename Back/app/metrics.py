@@ -0,0 +1,155 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ==========================================================
+#  Métricas (formato de texto de Prometheus) y tiempos por petición
+#
+#  Histogramas de duración por etapa (extracción por formato, chunking,
+#  lotes de embeddings, carga de índice, búsqueda, LLM) y contadores de
+#  errores de Ollama. Lo que ya cuentan otros módulos (cachés,
+#  planificador) se lee al exportar con `register_collector`, sin
+#  duplicar contadores. Con `uvicorn --workers N` cada proceso expone
+#  las suyas.
+#
+#  `track()` junta además, para la petición en curso, los milisegundos
+#  de cada etapa (se hereda en las tareas que la petición crea).
+# ==========================================================
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_metrics = []
+_lock = threading.Lock()     # también se observa desde hilos (asyncio.to_thread)
+_collectors = []
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    # un valor vacío equivale a no tener la etiqueta
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values) if v != ""]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(v) -> str:
+    return "+Inf" if v == float("inf") else repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = {}      # labels -> [cuentas por bucket, suma, total]
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for key, (counts, total, n) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {n}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Duración de cada etapa del pipeline (segundos)", ("stage", "format")
+)
+OLLAMA_ERRORS = Counter(
+    "rag_ollama_errors_total", "Errores en llamadas a Ollama", ("endpoint", "kind")
+)
+
+
+def register_collector(collect):
+    """
+    `collect()` devuelve [(nombre, tipo, ayuda, [(labels, valor)])] con
+    valores que ya lleva otro módulo (p. ej. los aciertos de una caché).
+    """
+    _collectors.append(collect)
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------------
+#  Etapas
+# ------------------------------------------------------
+
+def observe(stage: str, seconds: float, format: str = ""):
+    STAGE_SECONDS.observe(seconds, stage=stage, format=format)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def timed(stage: str, format: str = ""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, format)
+
+
+@contextmanager
+def track():
+    """Milisegundos por etapa de lo que se ejecute dentro (dict que se va llenando)."""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def ollama_error(endpoint: str, kind: str):
+    OLLAMA_ERRORS.inc(endpoint=endpoint, kind=kind)
@@ -1,217 +1,996 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import zlib
+
 import httpx
 import numpy as np
 
-from .config import OLLAMA_BASE_URL, EMBEDDING_MODEL, LLM_MODEL
+from .config import (
+    OLLAMA_BASE_URL, LLM_MODEL, ANN_EXACT_MAX, EMBED_BATCH_SIZE, EMBED_CONCURRENCY,
+    RETRIEVAL_MODE, RETRIEVAL_CANDIDATES, PREFILTER_CANDIDATES, BATCH_SCORE_BLOCK,
+    CHUNKER, EMBEDDING_MODEL, RESCORE_FACTOR, LLM_NUM_CTX, LLM_ANSWER_TOKENS, CONTEXT_MAX_TOKENS,
+)
+from .context import SEPARATOR, estimate_tokens, pack_context
+from . import metrics
+from .embeddings import engine as embedding_engine
+from .http_client import get_ollama_client, ollama_payload
+from .scheduler import OverloadedError, scheduler, generations
+from .sessions import sessions
+from .index_format import chunk_hash, normalize_rows
+from .lexical import tokenize, top_ids, code_terms, reciprocal_rank_fusion
+
+log = logging.getLogger(__name__)
 
 
 # ==========================================================
 #  Chunking de texto
 # ==========================================================
 
+class ChunkWindow:
+    """
+    Chunker incremental: recibe el texto por trozos (`feed`) y devuelve los
+    chunks que ya se pueden cerrar, conservando en memoria solo la ventana
+    de palabras que todavía puede aparecer en un chunk futuro (el solape).
+    Produce exactamente los mismos chunks que partir el texto entero.
+    """
+
+    def __init__(self, chunk_size: int = 220, overlap: int = 40):
+        self.chunk_size = chunk_size
+        self.step = max(1, chunk_size - overlap)
+        self.words = []
+        self.tail = ""   # palabra cortada al final del trozo anterior
+
+    def _emit(self, final: bool) -> list[str]:
+        # un chunk se cierra cuando tiene todas sus palabras; al final, los
+        # que quedan (más cortos) salen igual, como en el chunker original
+        chunks = []
+        need = 1 if final else self.chunk_size
+        while len(self.words) >= need:
+            chunks.append(" ".join(self.words[:self.chunk_size]))
+            del self.words[:self.step]
+        return chunks
+
+    def feed(self, text: str) -> list[str]:
+        if not text:
+            return []
+        text = self.tail + text
+        words = text.split()
+        self.tail = ""
+        if words and not text[-1].isspace():
+            self.tail = words.pop()
+        self.words.extend(words)
+        return self._emit(final=False)
+
+    def finish(self) -> list[str]:
+        if self.tail:
+            self.words.append(self.tail)
+            self.tail = ""
+        return self._emit(final=True)
+
+
+class ContentChunkWindow(ChunkWindow):
+    """
+    Chunker definido por contenido: el corte lo decide un hash de las
+    últimas palabras, no la posición en el documento. Insertar o borrar un
+    párrafo mueve solo los cortes de alrededor; el resto de los chunks
+    queda idéntico y puede reutilizar su embedding (ver build_index_stream).
+
+    Cada chunk son las últimas `overlap` palabras del anterior más un cuerpo
+    nuevo de entre (chunk_size - overlap) / 2 y chunk_size palabras, en
+    promedio unas chunk_size - overlap.
+    """
+
+    HASH_WORDS = 3
+
+    def __init__(self, chunk_size: int = 220, overlap: int = 40):
+        super().__init__(chunk_size, overlap)
+        self.overlap = max(0, overlap)
+        self.min_body = max(1, self.step // 2)
+        self.max_body = max(self.min_body, chunk_size)
+        self.divisor = max(1, self.step - self.min_body)
+        self.prev_tail = []
+        self._scanned = 0
+
+    def _is_cut(self, i: int) -> bool:
+        key = " ".join(self.words[max(0, i - self.HASH_WORDS + 1):i + 1])
+        return zlib.crc32(key.encode("utf-8")) % self.divisor == 0
+
+    def _emit(self, final: bool) -> list[str]:
+        chunks = []
+        while self.words:
+            cut = None
+            i = max(self._scanned, self.min_body - 1)
+            limit = min(len(self.words), self.max_body)
+            while i < limit:
+                if self._is_cut(i):
+                    cut = i + 1
+                    break
+                i += 1
+
+            if cut is None:
+                if len(self.words) >= self.max_body:
+                    cut = self.max_body
+                elif final:
+                    cut = len(self.words)
+                else:
+                    # el hash en i solo depende de palabras <= i: se sigue desde acá
+                    self._scanned = i
+                    break
+
+            body = self.words[:cut]
+            chunks.append(" ".join(self.prev_tail + body))
+            self.prev_tail = (self.prev_tail + body)[-self.overlap:] if self.overlap else []
+            del self.words[:cut]
+            self._scanned = 0
+        return chunks
+
+
+def make_chunker(chunk_size: int = 220, overlap: int = 40) -> ChunkWindow:
+    """Chunker para indexar según CHUNKER ("content" o "fixed")."""
+    if CHUNKER == "fixed":
+        return ChunkWindow(chunk_size, overlap)
+    return ContentChunkWindow(chunk_size, overlap)
+
+
+def iter_chunks(pieces, chunk_size: int = 220, overlap: int = 40):
+    """Genera los chunks de un texto que llega en trozos (iterable de str)."""
+    window = ChunkWindow(chunk_size, overlap)
+    for piece in pieces:
+        yield from window.feed(piece)
+    yield from window.finish()
+
+
 def chunk_text(text: str, chunk_size: int = 220, overlap: int = 40) -> list[str]:
     if not text:
-        print("❌ chunk_text recibió texto vacío")
+        log.warning("❌ chunk_text recibió texto vacío")
         return []
 
-    words = text.split()
-    if not words:
-        print("❌ chunk_text: text.split() devolvió vacío")
-        return []
+    chunks = list(iter_chunks([text], chunk_size, overlap))
+    if not chunks:
+        log.warning("❌ chunk_text: text.split() devolvió vacío")
+    return chunks
 
-    chunks = []
-    i = 0
 
- 
+# ==========================================================
+#  Embeddings (Ollama)
+# ==========================================================
 
-    while i < len(words):
-        chunk_words = words[i:i + chunk_size]
-        if not chunk_words:
-            break
+async def embed_texts(texts: list[str], on_progress=None, lane: str = "interactive") -> np.ndarray:
+    """
+    Embeddings en el orden de `texts` (lotes concurrentes, ver embeddings.py).
+    Los textos vacíos quedan como filas en cero. `lane` es el carril del
+    planificador: "ingest" al indexar documentos.
+    """
+    with metrics.timed("embed_ingest" if lane == "ingest" else "embed"):
+        return await embedding_engine.embed(texts, on_progress, lane)
 
-        chunk = " ".join(chunk_words)
-        chunks.append(chunk)
 
-        i += max(1, chunk_size - overlap)
+# ==========================================================
+#  Similitud coseno
+# ==========================================================
 
-    return chunks
+def cosine_sim(q, m, normalized=False):
+    """
+    Similitud coseno de `q` contra cada fila de `m`. Con normalized=True
+    se asume que las filas de `m` ya tienen norma 1 (índices v2) y no se
+    vuelve a recorrer la matriz.
+    """
+    if m.size == 0:
+        log.warning("❌ cosine_sim recibió matriz vacía")
+        return np.array([])
 
+    if normalized:
+        q = np.asarray(q, dtype="float32")
+        return m @ (q / (np.linalg.norm(q) or 1.0))
 
-# ==========================================================
-#  Embeddings (Ollama)
-# ==========================================================
+    # filas en cero (chunks vacíos) => similitud 0 en vez de NaN
+    q = q / (np.linalg.norm(q) or 1.0)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    m = m / norms
+    return np.dot(m, q)
 
-async def embed_texts(texts: list[str]) -> np.ndarray:
-    if not texts:
-        return np.zeros((0, 0), dtype="float32")
 
-    vectors = []
-    timeout = httpx.Timeout(60.0, read=60.0, write=30.0, connect=10.0)
+# ==========================================================
+#  Construcción de índice
+# ==========================================================
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        for idx, t in enumerate(texts):
-            trimmed = t.strip()
-            if not trimmed:
-                print(f"⚠ Texto vacío en embedding idx={idx}")
-                continue
+async def build_index(doc_id, text, store, chunk_size=220, overlap=40, on_progress=None):
+    """`on_progress(chunks_embebidos, chunks_generados)` para reportar avance."""
+    if not text or len(text.strip()) < 20:
+        raise ValueError("❌ Texto extraído demasiado corto")
 
-            print(f"🟦 Embedding chunk {idx} (len={len(trimmed)})...")
+    async def pieces():
+        yield text
+
+    return await build_index_stream(doc_id, pieces(), store, chunk_size, overlap, on_progress)
+
+
+async def build_index_stream(doc_id, pieces, store, chunk_size=220, overlap=40,
+                             on_progress=None, previous=None, stats=None):
+    """
+    Pipeline extracción -> chunks -> embeddings -> índice para documentos
+    de cualquier tamaño. `pieces` es un iterador asíncrono de trozos de
+    texto; mientras se embebe una ventana de chunks se sigue extrayendo la
+    siguiente, y cada ventana se agrega al índice en disco apenas está
+    lista. La memoria queda acotada por el tamaño de ventana, no por el
+    documento. El índice anterior (si lo hay) sigue vigente hasta el final.
+
+    Con `previous` (el índice actual del documento, al reindexar) los
+    chunks cuyo hash ya estaba reutilizan su embedding y solo se embeben
+    los nuevos. `stats`, si se pasa, recibe {"reused": n, "embedded": n}.
+    """
+    window_size = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+    windows = asyncio.Queue(maxsize=2)
+    seen = 0
+    done = 0
+    stats = stats if stats is not None else {}
+    stats.update(reused=0, embedded=0)
+
+    known = {}
+    if previous is not None and previous.manifest.get("embedding_model") == EMBEDDING_MODEL:
+        known = {int(h): i for i, h in enumerate(previous.hashes)}
+
+    async def embed_window(batch, progress):
+        rows = [known.get(chunk_hash(c)) for c in batch]
+        pending = [c for c, row in zip(batch, rows) if row is None]
+        stats["reused"] += len(batch) - len(pending)
+        stats["embedded"] += len(pending)
+        if not pending:
+            progress(1, 1)
+            return previous.vectors(rows)
+
+        fresh = await embed_texts(pending, progress, lane="ingest")
+        if len(pending) == len(batch):
+            return fresh
+
+        embeddings = np.empty((len(batch), fresh.shape[1]), dtype="float32")
+        new = [i for i, row in enumerate(rows) if row is None]
+        old = [i for i, row in enumerate(rows) if row is not None]
+        embeddings[new] = fresh
+        embeddings[old] = previous.vectors([rows[i] for i in old])
+        return embeddings
+
+    async def produce():
+        nonlocal seen
+        chunker = make_chunker(chunk_size, overlap)
+        batch = []
+        chunking = 0.0
+        async for piece in pieces:
+            start = time.perf_counter()
+            chunks = chunker.feed(piece)
+            chunking += time.perf_counter() - start
+            for chunk in chunks:
+                batch.append(chunk)
+                seen += 1
+                if len(batch) >= window_size:
+                    await windows.put(batch)
+                    batch = []
+        start = time.perf_counter()
+        rest = chunker.finish()
+        metrics.observe("chunking", chunking + time.perf_counter() - start)
+        seen += len(rest)
+        batch.extend(rest)
+        if batch:
+            await windows.put(batch)
+        await windows.put(None)
+
+    async def next_window():
+        # si la extracción falla, no quedarse esperando una ventana que no llega
+        get = asyncio.ensure_future(windows.get())
+        await asyncio.wait({get, producer}, return_when=asyncio.FIRST_COMPLETED)
+        if get.done():
+            return get.result()
+        get.cancel()
+        await producer
+        return windows.get_nowait()
+
+    writer = store.begin_index(doc_id)
+    producer = asyncio.create_task(produce())
+    try:
+        while (batch := await next_window()) is not None:
+            base = done
+
+            def progress(n, total):
+                if on_progress is not None and total:
+                    on_progress(base + len(batch) * n // total, max(seen, base + len(batch)))
+
+            embeddings = await embed_window(batch, progress)
+            writer.append(batch, embeddings)
+            done += len(batch)
+    except BaseException:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        writer.abort()
+        raise
+
+    if done == 0:
+        writer.abort()
+        raise ValueError("❌ No se generaron chunks en build_index")
 
-            try:
-                res = await client.post(
-                    f"{OLLAMA_BASE_URL}/api/embeddings",
-                    json={"model": EMBEDDING_MODEL, "prompt": trimmed},
-                )
-            except Exception as e:
-                raise RuntimeError(f"Error conectando con Ollama embeddings: {e}")
+    # publicar puede reentrenar el índice global (k-means): fuera del event loop
+    await asyncio.to_thread(store.commit_index, doc_id, writer)
+    log.info(
+        "✅ Índice guardado para %s (%d chunks, %d reutilizados)", doc_id, done, stats["reused"],
+        extra={"document_id": doc_id, "n_chunks": done, "reused": stats["reused"]},
+    )
+    return done
 
-            if res.status_code != 200:
-                raise RuntimeError(f"HTTP {res.status_code} en embeddings: {res.text}")
 
-            try:
-                data = res.json()
-            except:
-                raise ValueError(f"Ollama embeddings devolvió basura: {res.text}")
+# ==========================================================
+#  Prompt y generación (Ollama /api/chat)
+# ==========================================================
 
-            print(f"🟪 RAW EMBEDDING RESPONSE idx={idx}:", data)
+# subir al cambiar SYSTEM_PROMPT o build_messages: las respuestas
+# cacheadas con otra versión dejan de usarse
+PROMPT_VERSION = 2
 
-            if "error" in data:
-                raise RuntimeError(f"Error de Ollama en embeddings: {data['error']}")
+SYSTEM_PROMPT = (
+    "Eres un asistente que responde SIEMPRE en español, "
+    "y SOLO usando la información del contexto del documento. "
+    "Si la respuesta no está en el contexto, responde exactamente: "
+    "\"No hay suficiente información en el documento para responder con precisión.\""
+)
 
-            if "embedding" in data:
-                vec = data["embedding"]
-            elif "embeddings" in data:
-                vec = data["embeddings"][0]
-            else:
-                raise ValueError(f"Formato inesperado en embeddings: {data}")
 
-            vectors.append(vec)
+def user_prompt(context, question):
+    return (
+        f"Contexto:\n{context}\n\n"
+        f"Pregunta: {question}\n\n"
+        "Respuesta:"
+    )
 
 
-    return np.array(vectors, dtype="float32")
+def context_budget(question) -> int:
+    """Tokens de contexto que entran en la ventana junto al prompt, la pregunta y la respuesta."""
+    fixed = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_prompt("", question))
+    budget = LLM_NUM_CTX - LLM_ANSWER_TOKENS - fixed
+    if CONTEXT_MAX_TOKENS > 0:
+        budget = min(budget, CONTEXT_MAX_TOKENS)
+    return max(0, budget)
+
+
+def build_messages(question, selected_chunks, positions=None):
+    """
+    Mensajes para /api/chat y stats del contexto (ver context.pack_context).
+    `positions` son las posiciones de los chunks en el documento, para
+    unir los contiguos sin repetir el solape.
+    """
+    context, stats = pack_context(selected_chunks, context_budget(question), positions)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt(context, question)},
+    ]
+    return messages, stats
+
+
+def log_context(stats):
+    log.info(
+        "🧩 Contexto: %d tramos, %d tokens (%d ahorrados, %d fuera del presupuesto)",
+        stats["segments"], stats["tokens"], stats["tokens_saved"], stats["tokens_dropped"],
+        extra={f"context_{k}": v for k, v in stats.items()},
+    )
 
 
-# ==========================================================
-#  Similitud coseno
-# ==========================================================
+async def generate(question, selected_chunks, lane: str = "interactive", positions=None):
+    """
+    Pide la respuesta al LLM. Devuelve (texto, ok); con ok=False el texto
+    describe el error HTTP de Ollama. `positions`: ver build_messages.
+    """
+    messages, stats = build_messages(question, selected_chunks, positions)
+    log_context(stats)
+    answer, ok, _ = await complete(messages, lane)
+    return answer, ok
+
+
+async def complete(messages, lane: str = "interactive"):
+    """
+    Respuesta del LLM a `messages`: (texto, ok, uso), con uso los tokens
+    de prompt evaluados y generados según Ollama.
+
+    Espera cupo en el planificador (OverloadedError si la cola de `lane`
+    está llena) y, si ya hay en vuelo una generación con el mismo modelo
+    y los mismos mensajes (misma pregunta sobre los mismos chunks), espera
+    esa en vez de pedir otra.
+    """
+    payload = ollama_payload(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=False,
+        options={"num_ctx": LLM_NUM_CTX},
+    )
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).digest()
 
-def cosine_sim(q, m):
-    if m.size == 0:
-        print("❌ cosine_sim recibió matriz vacía")
-        return np.array([])
+    async def call():
+        async with scheduler.slot(lane):
+            return await _chat(payload)
 
-    q = q / np.linalg.norm(q)
-    m = m / np.linalg.norm(m, axis=1, keepdims=True)
-    return np.dot(m, q)
+    return await generations.run(key, call)
 
 
-# ==========================================================
-#  Construcción de índice
-# ==========================================================
+async def _chat(payload):
+    start = time.perf_counter()
+    try:
+        res = await get_ollama_client().post(f"{OLLAMA_BASE_URL}/api/chat", json=payload)
+    except Exception as e:
+        metrics.ollama_error("chat", "connection")
+        raise RuntimeError(f"Error conectando con Ollama (chat): {e}")
+    metrics.observe("llm_total", time.perf_counter() - start)
 
-async def build_index(doc_id, text, store, chunk_size=220, overlap=40):
+    try:
+        data = res.json()
+    except:
+        metrics.ollama_error("chat", "invalid")
+        raise ValueError(f"Ollama devolvió basura:\n{res.text}")
 
+    if res.status_code != 200:
+        metrics.ollama_error("chat", "http")
+        return f"Error HTTP {res.status_code}: {data}", False, {}
 
-    if not text or len(text.strip()) < 20:
-        raise ValueError("❌ Texto extraído demasiado corto")
+    # sin streaming no se ve el primer token: carga del modelo + prefill
+    # según Ollama (en nanosegundos)
+    prefill_ns = (data.get("load_duration") or 0) + (data.get("prompt_eval_duration") or 0)
+    if prefill_ns:
+        metrics.observe("llm_first_token", prefill_ns / 1e9)
 
-    chunks = chunk_text(text, chunk_size, overlap)
-    if not chunks:
-        raise ValueError("❌ No se generaron chunks en build_index")
+    msg = data.get("message", {})
+    answer = msg.get("content", "").strip()
 
-    embeddings = await embed_texts(chunks)
-    if embeddings.size == 0:
-        raise RuntimeError("❌ No se generaron embeddings")
+    if not answer:
+        answer = "⚠ El modelo no pudo generar una respuesta válida."
 
-    store.save_index(doc_id, chunks, embeddings)
-    print(f"✅ Índice guardado para {doc_id} ({len(chunks)} chunks)")
-    return len(chunks)
+    usage = {"prompt_tokens": data.get("prompt_eval_count"), "completion_tokens": data.get("eval_count")}
+    return answer, True, usage
 
 
 # ==========================================================
 #  Responder
 # ==========================================================
 
-async def answer(store, doc_id, question, top_k=3):
-
-
+def rank_chunks(index, q_emb, question, top_k, mode=None, sims=None):
+    """
+    Ids de los `top_k` chunks más relevantes de `index`, según el modo:
+      dense     -> similitud coseno contra toda la matriz
+      hybrid    -> listas de coseno y de BM25 fusionadas con RRF
+      prefilter -> BM25 elige candidatos y el coseno solo puntúa esos
+                   (luego se fusionan igual); si BM25 no encuentra
+                   suficientes, se cae a dense
+    En los modos con BM25, si la pregunta trae un código poco frecuente
+    (pieza, artículo, versión) los chunks que lo contienen van primero: los
+    embeddings casi no distinguen un código de otro y, con RRF, un chunk
+    que solo encuentra BM25 pierde contra los que aparecen en ambas listas.
+
+    En índices cuantizados con float32 guardada, la lista densa sale de
+    los top_k x RESCORE_FACTOR de la pasada cuantizada reordenados con la
+    similitud exacta.
+
+    `sims` son las similitudes contra toda la matriz si ya se calcularon
+    (ver rank_chunks_batch).
+    """
+    mode = mode or RETRIEVAL_MODE
+    q = np.asarray(q_emb, dtype="float32")
+    q = q / (np.linalg.norm(q) or 1.0)
+
+    def dense(k):
+        scores = sims if sims is not None else index.scores(q)
+        if not index.can_rescore or RESCORE_FACTOR <= 1:
+            return top_ids(scores, k)
+        shortlist = top_ids(scores, k * RESCORE_FACTOR)
+        return shortlist[top_ids(index.rescore(q, shortlist), k)]
+
+    if mode == "dense":
+        return dense(top_k)
+
+    tokens = tokenize(question)
+    lexical = index.lexical
+
+    if mode == "prefilter":
+        lexical_ids = lexical.top(tokens, PREFILTER_CANDIDATES)
+        if len(lexical_ids) < top_k:
+            return dense(top_k)
+        # pocos candidatos: se puntúan directo con la similitud exacta
+        candidates = np.sort(lexical_ids)
+        dense_ids = candidates[top_ids(index.rescore(q, candidates), RETRIEVAL_CANDIDATES)]
+    else:
+        lexical_ids = lexical.top(tokens, RETRIEVAL_CANDIDATES)
+        dense_ids = dense(max(top_k, RETRIEVAL_CANDIDATES))
+
+    exact = set()
+    for term in code_terms(tokens):
+        ids = lexical.matching(term)
+        if len(ids) <= top_k:
+            exact.update(int(i) for i in ids)
+    pinned = [int(i) for i in lexical_ids if int(i) in exact]
+
+    fused = reciprocal_rank_fusion([dense_ids, lexical_ids[:RETRIEVAL_CANDIDATES]])
+    ranked = pinned + [int(i) for i in fused if int(i) not in exact]
+    return np.array(ranked[:top_k], dtype="int64")
+
+
+def rank_chunks_batch(index, q_embs, questions, top_ks, mode=None):
+    """
+    rank_chunks para muchas preguntas sobre el mismo índice: las
+    similitudes densas salen de un solo producto matriz-matriz por bloque
+    de BATCH_SCORE_BLOCK preguntas, en vez de un recorrido por pregunta.
+    """
+    mode = mode or RETRIEVAL_MODE
+    q_embs = normalize_rows(q_embs)
+    results = []
+    for start in range(0, len(questions), BATCH_SCORE_BLOCK):
+        block = slice(start, start + BATCH_SCORE_BLOCK)
+        # en prefilter solo se puntúan los candidatos de BM25
+        block_sims = None if mode == "prefilter" else index.scores(q_embs[block].T).T
+        for j, i in enumerate(range(start, min(start + BATCH_SCORE_BLOCK, len(questions)))):
+            sims = block_sims[j] if block_sims is not None else None
+            results.append(rank_chunks(index, q_embs[i], questions[i], top_ks[i], mode, sims))
+    return results
+
+
+async def retrieve(store, doc_id, question, top_k=3, q_emb=None):
+    """
+    Chunks más similares a la pregunta. Devuelve (chunks, posiciones,
+    error). `q_emb` es el embedding de la pregunta si ya se calculó.
+    """
     index = store.load_index(doc_id)
     if not index:
-        return "No hay índice para este documento.", []
+        return [], [], "No hay índice para este documento."
+    store.record_query(doc_id)
 
-    chunks = index.get("chunks", [])
-    embs = np.array(index.get("embeddings", []), dtype="float32")
+    if q_emb is None:
+        q_emb = await embed_texts([question])
+    if q_emb.size == 0:
+        return [], [], "Falla en embedding de pregunta"
+
+    if len(index) == 0:
+        return [], [], "No hay similitud"
 
+    with metrics.timed("search"):
+        idxs = rank_chunks(index, q_emb[0], question, top_k)
+    return index.chunks(idxs), [int(i) for i in idxs], None
 
+
+async def answer(store, doc_id, question, top_k=3):
+    """
+    Devuelve (respuesta, fuentes, cached). Con la caché de respuestas
+    activa, una pregunta parecida a otra ya respondida sobre el mismo
+    documento (mismo modelo, prompt y top_k) se responde sin llamar al LLM.
+    """
+    cache = store.answer_cache
     q_emb = await embed_texts([question])
-    if q_emb.size == 0:
-        return "Falla en embedding de pregunta", []
+    key = (LLM_MODEL, PROMPT_VERSION, top_k)
+    if cache is not None and q_emb.size:
+        store.sync()    # otro worker pudo haber reindexado el documento
+        hit = cache.get(doc_id, key, q_emb[0])
+        if hit is not None:
+            return hit["answer"], hit["sources"], True
 
-    q_emb = q_emb[0]
+    epoch = cache.epoch(doc_id) if cache is not None else None
+    selected_chunks, positions, error = await retrieve(store, doc_id, question, top_k, q_emb)
+    if error:
+        return error, [], False
 
-    sims = cosine_sim(q_emb, embs)
-    if sims.size == 0:
-        return "No hay similitud", []
+    answer, ok = await generate(question, selected_chunks, positions=positions)
+    if not ok:
+        return answer, [], False
 
-    idxs = np.argsort(-sims)[:top_k]
-    selected_chunks = [chunks[i] for i in idxs]
+    if cache is not None:
+        cache.put(doc_id, key, q_emb[0], answer, selected_chunks, epoch)
+    return answer, selected_chunks, False
 
- 
 
-    MAX_CONTEXT = 1800
-    context = ""
-    for c in selected_chunks:
-        if len(context) + len(c) > MAX_CONTEXT:
-            context += c[:MAX_CONTEXT - len(context)]
-            break
-        context += "\n\n" + c
+# ==========================================================
+#  Conversaciones (sesiones de chat, ver sessions.py)
+#
+#  Los mensajes de una sesión solo crecen al final: el de sistema con el
+#  contexto del primer turno y después cada turno (la pregunta con los
+#  chunks recuperados que todavía no estaban en la conversación, y su
+#  respuesta). Así el prompt de un turno empieza con el prompt entero del
+#  anterior y Ollama, que conserva lo ya evaluado, solo hace prefill de lo
+#  nuevo. Cuando la conversación no entra en la ventana se descartan de
+#  una vez los turnos más viejos hasta liberar la mitad del lugar: el
+#  prefijo se rompe una vez cada varios turnos y no en todos, y el de
+#  sistema (con el contexto del primer turno) se conserva siempre.
+# ==========================================================
 
-   
+# plantilla de chat del modelo alrededor de cada par de mensajes (aprox.)
+TURN_OVERHEAD_TOKENS = 8
+
+
+def session_system(context):
+    return f"{SYSTEM_PROMPT}\n\nContexto:\n{context}"
+
+
+def turn_prompt(context, question):
+    if not context:
+        return f"Pregunta: {question}"
+    return f"Contexto adicional:\n{context}\n\nPregunta: {question}"
+
+
+def _included(chunks, positions, context):
+    # al unir chunks contiguos se quita el solape del principio; si el
+    # final no está, el chunk quedó afuera o recortado por el presupuesto
+    return [p for c, p in zip(chunks, positions) if c[-200:] in context]
+
+
+async def prepare_turn(store, session, question, top_k=3):
+    """
+    Recupera los chunks de la pregunta y arma los mensajes del próximo
+    turno de `session`, sin modificarla hasta tener la respuesta (ver
+    Session.commit). Devuelve (plan, error).
+    """
+    chunks, positions, error = await retrieve(store, session.doc_id, question, top_k)
+    if error:
+        return None, error
+
+    window = LLM_NUM_CTX - LLM_ANSWER_TOKENS
+    share = min(context_budget(question), window // 2)
+
+    if session.context is None:
+        # primer turno: el contexto va al mensaje de sistema y queda fijo
+        context, stats = pack_context(chunks, share, positions)
+        system = {"context": context, "positions": _included(chunks, positions, context)}
+        turns, dropped, reused, prefix = [], 0, 0, 0
+        new_context, new_positions = "", []
+    else:
+        system = None
+        fixed = estimate_tokens(session_system(session.context))
+        ask = estimate_tokens(turn_prompt("-", question)) + TURN_OVERHEAD_TOKENS
+        history = session.history_tokens()
+
+        # peor caso: todo lo recuperado que no está en el sistema es nuevo
+        pending = [c for c, p in zip(chunks, positions) if p not in session.context_positions]
+        need = ask + min(share, estimate_tokens(SEPARATOR.join(pending)))
+        dropped = 0
+        if fixed + history + need > window:
+            target = max(0, window - fixed - need) // 2
+            while dropped < len(session.turns) and history > target:
+                history -= session.turns[dropped]["tokens"]
+                dropped += 1
+        turns = session.turns[dropped:]
+
+        known = set(session.context_positions).union(*(t["positions"] for t in turns))
+        new = [i for i, p in enumerate(positions) if p not in known]
+        reused = len(chunks) - len(new)
+        new_chunks = [chunks[i] for i in new]
+        budget = max(0, min(share, window - fixed - history - ask))
+        new_context, stats = pack_context(new_chunks, budget, [positions[i] for i in new])
+        new_positions = _included(new_chunks, [positions[i] for i in new], new_context)
+        # sin descartes, todo el prompt anterior (y su respuesta) es prefijo
+        prefix = fixed + (history if dropped == 0 else 0)
+
+    log_context(stats)
+    prompt = turn_prompt(new_context, question)
+    messages = [{"role": "system", "content": session_system(system["context"] if system else session.context)}]
+    for turn in turns:
+        messages.append({"role": "user", "content": turn["prompt"]})
+        messages.append({"role": "assistant", "content": turn["answer"]})
+    messages.append({"role": "user", "content": prompt})
+
+    return {
+        "messages": messages,
+        "sources": chunks,
+        "stats": stats,
+        "system": system,
+        "dropped": dropped,
+        "turn": {"question": question, "prompt": prompt, "positions": new_positions},
+        "history_turns": len(turns),
+        "reused_chunks": reused,
+        "prefix_tokens": prefix,
+    }, None
+
+
+def finish_turn(session, plan, answer, usage, start):
+    """Guarda el turno respondido en la sesión y devuelve sus datos (SessionInfo)."""
+    tokens = estimate_tokens(plan["turn"]["prompt"]) + estimate_tokens(answer) + TURN_OVERHEAD_TOKENS
+    session.commit(plan, answer, tokens)
+    sessions.save(session)
+    sessions.record(plan["prefix_tokens"], usage.get("prompt_tokens"))
+    latency_ms = (time.perf_counter() - start) * 1000
+    metrics.observe("session_turn", latency_ms / 1000)
+    log.info(
+        "💬 Sesión %s turno %d: %d tokens de prefijo reutilizables, %d chunks ya en la conversación",
+        session.id, session.n_turns, plan["prefix_tokens"], plan["reused_chunks"],
+        extra={"session_id": session.id},
+    )
+    return {
+        "id": session.id,
+        "turn": session.n_turns,
+        "history_turns": plan["history_turns"],
+        "reused_chunks": plan["reused_chunks"],
+        "context_tokens": plan["stats"]["tokens"],
+        "prefix_tokens": plan["prefix_tokens"],
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "latency_ms": round(latency_ms, 1),
+    }
 
-    system_prompt = (
-    "Eres un asistente que responde SIEMPRE en español, "
-    "y SOLO usando la información del contexto del documento. "
-    "Si la respuesta no está en el contexto, responde exactamente: "
-    "\"No hay suficiente información en el documento para responder con precisión.\""
-)
 
-    user_prompt = (
-        f"Contexto:\n{context}\n\n"
-        f"Pregunta: {question}\n\n"
-        "Respuesta:"
+async def answer_turn(store, session, question, top_k=3):
+    """
+    Responde la pregunta como un turno más de `session`. Devuelve
+    (respuesta, fuentes, datos del turno); las fuentes son todos los
+    chunks recuperados, estuvieran o no ya en la conversación. Los turnos
+    de una sesión no usan la caché de respuestas: dependen del historial.
+    """
+    start = time.perf_counter()
+    async with session.lock:
+        plan, error = await prepare_turn(store, session, question, top_k)
+        if error:
+            return error, [], None
+
+        answer, ok, usage = await complete(plan["messages"])
+        if not ok:
+            return answer, [], None
+        return answer, plan["sources"], finish_turn(session, plan, answer, usage, start)
+
+
+# ==========================================================
+#  Responder en streaming
+# ==========================================================
+
+async def answer_stream(store, doc_id, question, top_k=3, session=None):
+    """
+    Generador asíncrono de eventos (nombre, datos):
+      sources -> apenas termina la recuperación
+      token   -> cada fragmento que produce Ollama
+      done    -> tiempos y cantidad de tokens (y el turno, con `session`)
+      error   -> si algo falla (y se corta el stream)
+    Si quien consume deja de iterar (cliente desconectado), al cerrarse el
+    generador se cierra la conexión con Ollama y la generación se aborta.
+    El cupo del planificador se ocupa mientras dura la generación; si la
+    cola está llena se emite `error` con `retry_after`.
+
+    Con `session` la pregunta es un turno más de la sesión (ver
+    answer_turn); un turno cortado a mitad de camino no queda en ella.
+    """
+    if session is None:
+        async for event in _answer_stream(store, doc_id, question, top_k):
+            yield event
+        return
+
+    async with session.lock:
+        async for event in _answer_stream(store, doc_id, question, top_k, session):
+            yield event
+
+
+async def _answer_stream(store, doc_id, question, top_k, session=None):
+    start = time.perf_counter()
+
+    try:
+        if session is None:
+            selected_chunks, positions, error = await retrieve(store, doc_id, question, top_k)
+        else:
+            plan, error = await prepare_turn(store, session, question, top_k)
+            selected_chunks = plan["sources"] if plan else []
+    except OverloadedError as e:
+        yield "error", {"detail": str(e), "retry_after": e.retry_after}
+        return
+    if error:
+        yield "error", {"detail": error}
+        return
+
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    yield "sources", {"sources": selected_chunks, "retrieval_ms": round(retrieval_ms, 1)}
+
+    if session is None:
+        messages, context = build_messages(question, selected_chunks, positions)
+        log_context(context)
+    else:
+        messages, context = plan["messages"], plan["stats"]
+    payload = ollama_payload(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True,
+        options={"num_ctx": LLM_NUM_CTX},
     )
 
-    payload = {
-        "model": LLM_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        "stream": False,
-    }
+    first_token_ms = None
+    final = {}
+    parts = []
 
-    timeout = httpx.Timeout(60.0, read=60.0, write=30.0, connect=10.0)
+    try:
+        await scheduler.acquire("interactive")
+    except OverloadedError as e:
+        yield "error", {"detail": str(e), "retry_after": e.retry_after}
+        return
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    llm_start = time.perf_counter()
+    try:
         try:
-            res = await client.post(f"{OLLAMA_BASE_URL}/api/chat", json=payload)
-        except Exception as e:
-            raise RuntimeError(f"Error conectando con Ollama (chat): {e}")
+            async with get_ollama_client().stream("POST", f"{OLLAMA_BASE_URL}/api/chat", json=payload) as res:
+                if res.status_code != 200:
+                    metrics.ollama_error("chat", "http")
+                    body = (await res.aread()).decode("utf-8", errors="ignore")
+                    yield "error", {"detail": f"Error HTTP {res.status_code}: {body}"}
+                    return
+
+                async for line in res.aiter_lines():
+                    if not line.strip():
+                        continue
+
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        metrics.ollama_error("chat", "invalid")
+                        yield "error", {"detail": f"Ollama devolvió basura: {line}"}
+                        return
+
+                    if "error" in data:
+                        metrics.ollama_error("chat", "model")
+                        yield "error", {"detail": f"Error de Ollama (chat): {data['error']}"}
+                        return
+
+                    token = data.get("message", {}).get("content", "")
+                    if token:
+                        if first_token_ms is None:
+                            first_token_ms = (time.perf_counter() - start) * 1000
+                            metrics.observe("llm_first_token", time.perf_counter() - llm_start)
+                        parts.append(token)
+                        yield "token", {"content": token}
+
+                    if data.get("done"):
+                        final = data
+                        break
+        except httpx.HTTPError as e:
+            metrics.ollama_error("chat", "connection")
+            yield "error", {"detail": f"Error conectando con Ollama (chat): {e}"}
+            return
+    finally:
+        scheduler.release()
+    metrics.observe("llm_total", time.perf_counter() - llm_start)
+
+    total_ms = (time.perf_counter() - start) * 1000
+    done = {
+        "retrieval_ms": round(retrieval_ms, 1),
+        "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+        "total_ms": round(total_ms, 1),
+        "prompt_tokens": final.get("prompt_eval_count"),
+        "completion_tokens": final.get("eval_count"),
+        "context_tokens": context["tokens"],
+        "context_tokens_saved": context["tokens_saved"],
+    }
+    if session is not None:
+        usage = {"prompt_tokens": final.get("prompt_eval_count")}
+        done["session"] = finish_turn(session, plan, "".join(parts).strip(), usage, start)
+    yield "done", done
 
-    try:
-        data = res.json()
-    except:
-        raise ValueError(f"Ollama devolvió basura:\n{res.text}")
 
-   
+# ==========================================================
+#  Responder en lote (/query/batch)
+# ==========================================================
 
-    if res.status_code != 200:
-        return f"Error HTTP {res.status_code}: {data}", []
+async def answer_batch(store, items, generate_answers=True, concurrency=4):
+    """
+    Generador asíncrono de resultados para una lista de preguntas
+    (BatchQueryItem): todas las preguntas se embeben en una sola llamada,
+    se puntúan agrupadas por documento (ver rank_chunks_batch) y las
+    respuestas se generan con a lo sumo `concurrency` en vuelo. Cada
+    resultado es un dict que sale apenas está listo, no en orden.
+    """
+    def result(i, **fields):
+        item = items[i]
+        return {"index": i, "id": item.id, "document_id": item.document_id,
+                "question": item.question, **fields}
+
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item.document_id, []).append(i)
+
+    q_embs = await embed_texts([item.question for item in items], lane="batch")
+
+    sources, positions = {}, {}
+    for doc_id, idxs in groups.items():
+        if not store.get(doc_id):
+            for i in idxs:
+                yield result(i, error="Documento no encontrado")
+            continue
+
+        index = store.load_index(doc_id)
+        if not index or len(index) == 0:
+            for i in idxs:
+                yield result(i, error="No hay índice para este documento.")
+            continue
+        store.record_query(doc_id, len(idxs))
+
+        with metrics.timed("search"):
+            ranked = await asyncio.to_thread(
+                rank_chunks_batch, index, q_embs[idxs],
+                [items[i].question for i in idxs], [items[i].top_k for i in idxs],
+            )
+        for i, chunk_ids in zip(idxs, ranked):
+            sources[i] = index.chunks(chunk_ids)
+            positions[i] = [int(c) for c in chunk_ids]
+            if not generate_answers:
+                yield result(i, sources=sources[i])
+
+    if not generate_answers:
+        return
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(i):
+        async with semaphore:
+            try:
+                text, ok = await generate(items[i].question, sources[i], "batch", positions[i])
+            except Exception as e:
+                return result(i, sources=sources[i], error=str(e))
+        if not ok:
+            return result(i, sources=[], error=text)
+        return result(i, answer=text, sources=sources[i])
 
-    msg = data.get("message", {})
-    answer = msg.get("content", "").strip()
+    tasks = [asyncio.create_task(run(i)) for i in sources]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # cliente desconectado: no seguir generando respuestas que nadie lee
+        for t in tasks:
+            t.cancel()
 
-    if not answer:
-        answer = "⚠ El modelo no pudo generar una respuesta válida."
 
+# ==========================================================
+#  Responder sobre toda la biblioteca (índice global)
+# ==========================================================
 
-    return answer, selected_chunks
+def search_library(store, q_emb, top_k, document_ids=None, nprobe=None):
+    """
+    [(doc_id, chunk_id, score)] sobre todos los documentos o sobre
+    `document_ids`. Con un filtro chico se recorre exacto cada documento;
+    si no, se usa el índice IVF global.
+    """
+    if document_ids is not None:
+        docs = [d for d in document_ids if store.get(d)]
+        n_filtered = sum(store.get(d).n_chunks for d in docs)
+
+        if n_filtered <= ANN_EXACT_MAX:
+            hits = []
+            for doc_id in docs:
+                index = store.load_index(doc_id)
+                if index is None or len(index) == 0:
+                    continue
+                q = np.asarray(q_emb, dtype="float32")
+                q = q / (np.linalg.norm(q) or 1.0)
+                sims = index.scores(q)
+                best = top_ids(sims, top_k * RESCORE_FACTOR if index.can_rescore else top_k)
+                scores = index.rescore(q, best) if index.can_rescore else sims[best]
+                hits.extend((doc_id, int(i), float(s)) for i, s in zip(best, scores))
+
+            hits.sort(key=lambda h: -h[2])
+            return hits[:top_k]
+
+    vector_index = store.ensure_vector_index()
+    return vector_index.search(q_emb, top_k, nprobe=nprobe, doc_ids=document_ids)
+
+
+async def answer_library(store, question, top_k=4, document_ids=None, nprobe=None):
+    q_emb = await embed_texts([question])
+    if q_emb.size == 0:
+        return "Falla en embedding de pregunta", []
+
+    with metrics.timed("search"):
+        hits = await asyncio.to_thread(search_library, store, q_emb[0], top_k, document_ids, nprobe)
+    if not hits:
+        return "No hay similitud", []
+
+    for doc_id in {doc_id for doc_id, _, _ in hits}:
+        store.record_query(doc_id)
+
+    sources = []
+    for doc_id, chunk_id, score in hits:
+        index = store.load_index(doc_id)
+        if index is None:
+            continue
+        sources.append({
+            "document_id": doc_id,
+            "chunk": chunk_id,
+            "text": index.chunk(chunk_id),
+            "score": score,
+        })
+
+    answer, ok = await generate(
+        question, [s["text"] for s in sources],
+        positions=[(s["document_id"], s["chunk"]) for s in sources],
+    )
+    return answer, (sources if ok else [])
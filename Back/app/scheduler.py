@@ -0,0 +1,153 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from .config import OLLAMA_CONCURRENCY, OLLAMA_QUEUE_MAX
+
+
+# ==========================================================
+#  Planificador de llamadas a Ollama
+#
+#  Un tope de peticiones en vuelo (chat + embeddings) por proceso y una
+#  cola de espera por carril, atendidos en orden de prioridad:
+#      interactive  -> preguntas de usuarios (/query, stream, biblioteca)
+#      batch        -> respuestas de /query/batch
+#      ingest       -> embeddings de documentos en indexación
+#  Solo la cola interactiva es acotada: llena, la petición se rechaza con
+#  OverloadedError (429 + Retry-After) en vez de esperar hasta el timeout.
+#  Los carriles batch e ingest ya limitan lo que encolan y solo esperan.
+# ==========================================================
+
+LANES = ("interactive", "batch", "ingest")
+
+
+class OverloadedError(RuntimeError):
+    """Cola llena: reintentar después de `retry_after` segundos."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Scheduler:
+    def __init__(self, concurrency: int, max_waiting: dict):
+        """`max_waiting[carril]` = esperas admitidas (None = sin tope)."""
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._waiters = {lane: deque() for lane in LANES}
+        self._hold = 1.0          # duración típica de un cupo (s), EWMA
+
+        self.admitted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+
+    def waiting(self, lane: str = None) -> int:
+        if lane is not None:
+            return len(self._waiters[lane])
+        return sum(len(w) for w in self._waiters.values())
+
+    def retry_after(self, lane: str) -> int:
+        """Segundos estimados hasta que haya cupo para una petición nueva de `lane`."""
+        ahead = sum(len(self._waiters[l]) for l in LANES[:LANES.index(lane) + 1])
+        return max(1, min(60, math.ceil(self._hold * (ahead + 1) / self.concurrency)))
+
+    def check(self, lane: str):
+        """OverloadedError si una petición nueva de `lane` no entraría en la cola."""
+        limit = self.max_waiting.get(lane)
+        if limit is not None and self.active >= self.concurrency and self.waiting(lane) >= limit:
+            self.rejected[lane] += 1
+            raise OverloadedError(
+                f"Servidor ocupado: {self.waiting(lane)} peticiones en espera", self.retry_after(lane)
+            )
+
+    async def acquire(self, lane: str):
+        if self.active < self.concurrency and not self.waiting():
+            self.active += 1
+            self.admitted[lane] += 1
+            return
+
+        self.check(lane)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()      # el cupo ya era nuestro: pasa al siguiente
+            elif future in self._waiters[lane]:
+                # release() pudo haberlo sacado (y salteado) antes de que
+                # esta tarea viera la cancelación
+                self._waiters[lane].remove(future)
+            raise
+        self.admitted[lane] += 1
+
+    def release(self):
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_result(None)     # el cupo pasa directo, active no cambia
+                    return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "interactive"):
+        await self.acquire(lane)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold = 0.8 * self._hold + 0.2 * (time.perf_counter() - start)
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": {lane: len(w) for lane, w in self._waiters.items()},
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "hold_s": round(self._hold, 3),
+        }
+
+
+class SharedCalls:
+    """
+    Llamadas idénticas en vuelo comparten un solo resultado: la primera
+    lanza la tarea y las que llegan mientras tanto la esperan. La tarea se
+    cancela solo si ya no la espera nadie.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.shared = 0
+
+    async def run(self, key, factory):
+        entry = self._calls.get(key)
+        if entry is None:
+            entry = self._calls[key] = {"task": asyncio.ensure_future(factory()), "waiters": 0}
+            entry["task"].add_done_callback(
+                lambda _: self._calls.pop(key) if self._calls.get(key) is entry else None
+            )
+            self.started += 1
+        else:
+            self.shared += 1
+
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared}
+
+
+scheduler = Scheduler(OLLAMA_CONCURRENCY, {"interactive": OLLAMA_QUEUE_MAX})
+generations = SharedCalls()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
 
 class DocumentMetadata(BaseModel):
     id: str
@@ -9,12 +9,112 @@ class DocumentMetadata(BaseModel):
 
 class DocumentListResponse(BaseModel):
     documents: List[DocumentMetadata]
+    total: int
+    limit: int
+    offset: int = 0
 
 class QueryRequest(BaseModel):
     document_id: str
     question: str
     top_k: int = 4
+    timings: bool = False
+    session_id: Optional[str] = None   # conversación con historial (la crea si no existe)
+
+class SessionInfo(BaseModel):
+    id: str
+    turn: int                          # turnos respondidos en la sesión, incluido este
+    history_turns: int                 # turnos anteriores que entraron en el prompt
+    reused_chunks: int                 # chunks recuperados que ya estaban en la conversación
+    context_tokens: int                # tokens de contexto nuevos en este turno
+    prefix_tokens: int                 # tokens del prompt anterior que Ollama puede reutilizar
+    prompt_tokens: Optional[int] = None   # tokens de prompt que evaluó Ollama
+    latency_ms: float
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[str]
+    cached: bool = False
+    timings: Optional[Dict[str, float]] = None   # ms por etapa, si se pidió
+    session: Optional[SessionInfo] = None
+
+class LibraryQueryRequest(BaseModel):
+    question: str
+    document_ids: Optional[List[str]] = None
+    top_k: int = 4
+    nprobe: Optional[int] = None
+
+class SourceChunk(BaseModel):
+    document_id: str
+    chunk: int
+    text: str
+    score: float
+
+class LibraryQueryResponse(BaseModel):
+    answer: str
+    sources: List[SourceChunk]
+
+class BatchQueryItem(BaseModel):
+    document_id: str
+    question: str
+    top_k: int = 4
+    id: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem]
+    generate: bool = True
+
+class BatchQueryResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    document_id: str
+    question: str
+    answer: Optional[str] = None
+    sources: List[str] = []
+    error: Optional[str] = None
+
+class JobStatus(BaseModel):
+    id: str
+    document_id: str
+    filename: str
+    stage: str
+    progress: float
+    n_chunks: int = 0
+    n_embedded: int = 0
+    n_reused: int = 0
+    size: Optional[int] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+class BulkItem(BaseModel):
+    index: int
+    source: str                       # nombre dentro del ZIP o URL
+    document_id: Optional[str] = None
+    job_id: Optional[str] = None
+    stage: str                        # etapa del trabajo, o "skipped"
+    progress: float = 0.0
+    n_chunks: int = 0
+    error: Optional[str] = None
+
+class BulkStatus(BaseModel):
+    id: str
+    kind: str                         # "archive" o "urls"
+    created_at: float
+    total: int
+    finished: bool
+    counts: Dict[str, int]            # elementos por etapa
+    items: List[BulkItem]
+
+class SessionTurn(BaseModel):
+    question: str
+    answer: str
+
+class SessionStatus(BaseModel):
+    id: str
+    document_id: str
+    turns: int
+    history: List[SessionTurn]        # turnos que siguen en la conversación
+    context_tokens: int
+    history_tokens: int
+    created_at: float
+    used_at: float
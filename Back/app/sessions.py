@@ -0,0 +1,232 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import SESSIONS_PATH, SESSION_MAX, SESSION_TTL
+from .context import estimate_tokens
+
+
+# ==========================================================
+#  Sesiones de chat
+#
+#  Una sesión es una conversación sobre un documento: el contexto del
+#  primer turno (va en el mensaje de sistema) y los turnos siguientes,
+#  cada uno con su pregunta, la respuesta y los chunks nuevos que trajo.
+#  El prompt de cada turno es el del turno anterior más su respuesta y la
+#  pregunta nueva, así que Ollama reutiliza lo ya evaluado (su caché de
+#  prompt) y solo hace prefill de lo nuevo (ver rag.prepare_turn).
+#
+#  Las sesiones se guardan en SQLite (compartido entre workers, como el
+#  catálogo): un turno que llega a otro worker sigue la misma
+#  conversación. Cada proceso conserva en memoria las que usó y las
+#  vuelve a leer si otro worker guardó un turno después (`rev`). Vencen
+#  a los `ttl` segundos sin turnos y, pasado el tope, se descartan las
+#  usadas hace más tiempo.
+# ==========================================================
+
+class SessionError(ValueError):
+    """La sesión existe pero es de otro documento."""
+
+
+class Session:
+    def __init__(self, session_id: str, doc_id: str, version):
+        self.id = session_id
+        self.doc_id = doc_id
+        self.version = version      # reindexar el documento invalida el contexto
+        self.context = None         # contexto del primer turno (prefijo estable)
+        self.context_positions = []
+        self.turns = []             # {"question", "prompt", "positions", "answer", "tokens"}
+        self.n_turns = 0            # turnos respondidos, incluidos los ya descartados
+        self.lock = asyncio.Lock()  # un turno a la vez: cada uno extiende el anterior
+        self.created_at = self.used_at = time.time()
+        self.rev = 0                # turnos guardados (ver SessionStore.get)
+
+    def history_tokens(self) -> int:
+        return sum(turn["tokens"] for turn in self.turns)
+
+    def commit(self, plan: dict, answer: str, tokens: int):
+        """Agrega el turno ya respondido (`plan` de rag.prepare_turn)."""
+        if plan["system"] is not None:
+            self.context = plan["system"]["context"]
+            self.context_positions = plan["system"]["positions"]
+        del self.turns[:plan["dropped"]]
+        self.turns.append(dict(plan["turn"], answer=answer, tokens=tokens))
+        self.n_turns += 1
+
+    def dump(self) -> str:
+        return json.dumps({
+            "context": self.context,
+            "context_positions": self.context_positions,
+            "turns": self.turns,
+            "n_turns": self.n_turns,
+        })
+
+    @classmethod
+    def load(cls, row) -> "Session":
+        session = cls(row["id"], row["doc_id"], row["version"])
+        data = json.loads(row["data"])
+        session.context = data["context"]
+        session.context_positions = data["context_positions"]
+        session.turns = data["turns"]
+        session.n_turns = data["n_turns"]
+        session.rev = row["rev"]
+        session.created_at, session.used_at = row["created_at"], row["used_at"]
+        return session
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "document_id": self.doc_id,
+            "turns": self.n_turns,
+            "history": [{"question": t["question"], "answer": t["answer"]} for t in self.turns],
+            "context_tokens": estimate_tokens(self.context or ""),
+            "history_tokens": self.history_tokens(),
+            "created_at": self.created_at,
+            "used_at": self.used_at,
+        }
+
+
+class SessionStore:
+    def __init__(self, path: str, max_sessions: int, ttl: float, memory_items: int = 256):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self._memory = OrderedDict()      # id -> Session, en orden de uso
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+        # acumulados de los turnos de este proceso (ver rag.finish_turn)
+        self.turns = 0
+        self.prefix_tokens = 0
+        self.prompt_tokens = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, version REAL, rev INTEGER NOT NULL,"
+            " data TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_used ON sessions(used_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_doc ON sessions(doc_id)")
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _row(self, session_id: str):
+        return self._db.execute(
+            "SELECT * FROM sessions WHERE id = ? AND used_at >= ?", (session_id, time.time() - self.ttl)
+        ).fetchone()
+
+    def _cached(self, row) -> Session:
+        """La copia en memoria si está al día; si no, la guardada."""
+        session = self._memory.get(row["id"])
+        if session is None or session.rev != row["rev"] or session.version != row["version"]:
+            session = Session.load(row)
+        self._remember(session)
+        return session
+
+    def _remember(self, session: Session):
+        self._memory[session.id] = session
+        self._memory.move_to_end(session.id)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, session_id: str, doc_id: str, version) -> Session:
+        """
+        Sesión `session_id`, creada si no existe o venció. Si el documento
+        se reindexó desde el turno anterior (`version` distinta), la
+        conversación empieza de nuevo: sus chunks ya no son los del índice.
+        """
+        with self._lock:
+            row = self._row(session_id)
+            if row is not None and row["doc_id"] != doc_id:
+                raise SessionError("La sesión pertenece a otro documento")
+            if row is not None and row["version"] == version:
+                return self._cached(row)
+
+            session = Session(session_id, doc_id, version)
+            self._write(session)
+            self._remember(session)
+            self.created += 1
+            self._trim()
+            return session
+
+    def find(self, session_id: str):
+        with self._lock:
+            row = self._row(session_id)
+            return self._cached(row) if row is not None else None
+
+    def save(self, session: Session):
+        """Guarda el turno recién agregado (ver Session.commit)."""
+        with self._lock:
+            session.rev += 1
+            session.used_at = time.time()
+            self._write(session)
+
+    def _write(self, session: Session):
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session.id, session.doc_id, session.version, session.rev, session.dump(),
+             session.created_at, session.used_at),
+        )
+        self._db.commit()
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            self._memory.pop(session_id, None)
+            deleted = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            self._db.commit()
+            return deleted > 0
+
+    def drop_document(self, doc_id: str):
+        with self._lock:
+            for session_id in [s.id for s in self._memory.values() if s.doc_id == doc_id]:
+                del self._memory[session_id]
+            self._db.execute("DELETE FROM sessions WHERE doc_id = ?", (doc_id,))
+            self._db.commit()
+
+    def record(self, prefix_tokens: int, prompt_tokens):
+        with self._lock:
+            self.turns += 1
+            self.prefix_tokens += prefix_tokens
+            self.prompt_tokens += prompt_tokens or 0
+
+    def _trim(self):
+        """Borra las vencidas y, pasado el tope, las usadas hace más tiempo."""
+        self.expired += self._db.execute(
+            "DELETE FROM sessions WHERE used_at < ?", (time.time() - self.ttl,)
+        ).rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if count > self.max_sessions:
+            self.evictions += self._db.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY used_at ASC LIMIT ?)",
+                (count - self.max_sessions,),
+            ).rowcount
+        self._db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "memory_items": len(self._memory),
+            "created": self.created,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "turns": self.turns,
+            "prefix_tokens": self.prefix_tokens,
+            "prompt_tokens": self.prompt_tokens,
+        }
+
+
+sessions = SessionStore(SESSIONS_PATH, SESSION_MAX, SESSION_TTL)
@@ -1,82 +1,382 @@
 import os
 import json
-import pickle
+import logging
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
 
 from .schemas import DocumentMetadata
-from .config import DOCS_DIR, INDEX_DIR
+from .config import (
+    DOCS_DIR, INDEX_DIR, LOCKS_DIR, CATALOG_PATH, INDEX_CACHE_MAX_BYTES, ANN_NPROBE, ANN_TRAIN_MIN, EMBEDDING_MODEL, CHUNKER,
+    ANN_DTYPE,
+    EMBED_STORAGE, EMBED_KEEP_FLOAT32,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD,
+)
+from .answer_cache import AnswerCache
+from .catalog import Catalog
+from .index_format import IndexWriter, open_index, migrate_pickle
+from .index_cache import IndexCache
+from .locks import FileLock, file_lock
+from . import metrics
+from .vector_index import IVFIndex
+
+log = logging.getLogger(__name__)
 
 DOCS_PATH = os.path.join(DOCS_DIR, "docs.json")
+USAGE_PATH = os.path.join(INDEX_DIR, "usage.json")
+
+
+TRASH_MARK = ".deleted-"
 
 
 class DocumentStore:
+    """
+    Catálogo, índices en disco y sus cachés. Con `uvicorn --workers N`
+    cada proceso tiene su DocumentStore: el catálogo (SQLite) es común, las
+    escrituras de un índice se serializan con un lock por documento y las
+    cachés en memoria se invalidan con `sync` cuando otro proceso cambia
+    un documento.
+    """
+
     def __init__(self):
-        self.docs = {}
-        if os.path.exists(DOCS_PATH):
-            try:
-                with open(DOCS_PATH, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    for doc_id, meta in data.items():
-                        self.docs[doc_id] = DocumentMetadata(**meta)
-            except Exception:
-                # si docs.json se corrompe, lo reseteamos
-                self.docs = {}
-                with open(DOCS_PATH, "w", encoding="utf-8") as f:
-                    json.dump({}, f)
-
-    def _save(self):
-        with open(DOCS_PATH, "w", encoding="utf-8") as f:
-            json.dump({k: v.model_dump() for k, v in self.docs.items()}, f, indent=2)
+        self.catalog = Catalog(CATALOG_PATH)
+        self._seen_change = self.catalog.last_change()
+        self._data_version = self.catalog.data_version()
+        self._sync_lock = threading.Lock()
+
+        self.index_cache = IndexCache(INDEX_CACHE_MAX_BYTES)
+        self.answer_cache = (
+            AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+            if ANSWER_CACHE_ENABLED else None
+        )
+        self.vector_index = self._new_vector_index()
+        self._vector_index_lock = threading.Lock()
+        self.usage = read_usage()     # doc_id -> {"at": última pregunta, "queries": preguntas}
+        self._usage_pending = {}      # preguntas de este worker sin guardar todavía
+        self._usage_dropped = set()   # documentos reindexados o borrados desde el último guardado
+
+        # migraciones de un solo uso: las hace el primer worker que arranca
+        with file_lock(os.path.join(LOCKS_DIR, "startup.lock")):
+            if os.path.exists(DOCS_PATH):
+                self.catalog.import_json(DOCS_PATH)
+            remove_trash()
+            self.migrate_legacy_indexes()
+
+    def _new_vector_index(self) -> IVFIndex:
+        return IVFIndex(
+            os.path.join(INDEX_DIR, "_global"), nprobe=ANN_NPROBE, train_min=ANN_TRAIN_MIN, dtype=ANN_DTYPE
+        )
+
+    def sync(self):
+        """
+        Aplica lo que cambiaron otros procesos desde la última llamada:
+        descarta sus índices de la caché y los actualiza en el índice
+        global. Si no hubo escrituras ajenas cuesta un PRAGMA.
+        """
+        version = self.catalog.data_version()
+        if version == self._data_version:
+            return
+
+        with self._sync_lock:
+            if version == self._data_version:
+                return
+            changed, self._seen_change = self.catalog.changes_since(self._seen_change)
+            self._data_version = version
+
+        if changed is None:
+            # demasiado atrasado para saber qué cambió: se descarta todo
+            self.index_cache.clear()
+            if self.answer_cache is not None:
+                self.answer_cache.clear()
+            with self._vector_index_lock:
+                self.vector_index = self._new_vector_index()
+            return
+
+        for doc_id in changed:
+            self.index_cache.invalidate(doc_id)
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate(doc_id)
+            if self.vector_index.loaded:
+                index = open_index(index_path(doc_id)) if self.get(doc_id) else None
+                if index is not None and len(index):
+                    self.vector_index.add(doc_id, index.vectors(), persist=False)
+                else:
+                    self.vector_index.remove(doc_id, persist=False)
 
     def add(self, metadata: DocumentMetadata):
-        self.docs[metadata.id] = metadata
-        self._save()
+        """
+        Registra el documento (o actualiza sus metadatos). Si un alta nueva
+        no llega al catálogo, se borran su texto e índice ya escritos para
+        no dejar archivos huérfanos.
+        """
+        existed = self.catalog.get(metadata.id) is not None
+        try:
+            self.catalog.put(metadata.model_dump())
+        except BaseException:
+            if not existed:
+                self.invalidate_index(metadata.id)
+                for path in document_paths(metadata.id):
+                    _remove_path(path)
+            raise
 
-    def list(self):
-        return list(self.docs.values())
+    def list(self, limit: int = None, offset: int = 0, query: str = None, order: str = "created"):
+        """(documentos, total) de una página del catálogo; sin `limit`, todos."""
+        rows, total = self.catalog.page(limit if limit is not None else -1, offset, query, order)
+        return [DocumentMetadata(**r) for r in rows], total
 
     def get(self, doc_id: str):
-        return self.docs.get(doc_id)
+        row = self.catalog.get(doc_id)
+        return DocumentMetadata(**row) if row is not None else None
+
+    def delete(self, doc_id: str) -> bool:
+        """
+        Borra metadatos, texto e índice como una sola operación: los
+        archivos se apartan con os.replace, se borra la fila y recién
+        entonces se eliminan; si falla el catálogo, vuelven a su lugar.
+        LockBusyError si otro proceso está escribiendo su índice.
+        """
+        with file_lock(doc_lock_path(doc_id), blocking=False):
+            self.invalidate_index(doc_id)
+
+            trashed = []
+            try:
+                for path in document_paths(doc_id):
+                    if os.path.exists(path):
+                        trash = f"{path}{TRASH_MARK}{uuid.uuid4().hex[:8]}"
+                        os.replace(path, trash)
+                        trashed.append((path, trash))
+                deleted = self.catalog.delete(doc_id)
+            except BaseException:
+                for path, trash in reversed(trashed):
+                    os.replace(trash, path)
+                raise
+
+        for _, trash in trashed:
+            _remove_path(trash)
+        return deleted or bool(trashed)
+
+    def begin_index(self, doc_id) -> IndexWriter:
+        """
+        Índice nuevo escrito de a partes; se publica con `commit_index`.
+        Toma el lock del documento hasta publicar o abortar: LockBusyError
+        si otro proceso ya lo está escribiendo.
+        """
+        lock = FileLock(doc_lock_path(doc_id)).acquire(blocking=False)
+        try:
+            return IndexWriter(
+                index_path(doc_id),
+                {"embedding_model": EMBEDDING_MODEL, "chunker": CHUNKER},
+                quantization=EMBED_STORAGE,
+                keep_float32=EMBED_KEEP_FLOAT32,
+                lock=lock,
+            )
+        except BaseException:
+            lock.release()
+            raise
+
+    def index_busy(self, doc_id) -> bool:
+        """¿Algún proceso está escribiendo el índice de este documento?"""
+        return FileLock(doc_lock_path(doc_id)).is_held_elsewhere()
+
+    def commit_index(self, doc_id, writer: IndexWriter):
+        try:
+            writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+        self.index_cache.invalidate(doc_id)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(doc_id)
+
+        # índice global: inserción incremental si ya está en memoria; si no,
+        # se descarta la asignación vieja y se completa al cargarlo
+        if self.vector_index.loaded:
+            index = open_index(index_path(doc_id))
+            self.vector_index.add(doc_id, index.vectors())
+        else:
+            self.vector_index.remove(doc_id)
 
     def save_index(self, doc_id, chunks, embeddings):
-        path = os.path.join(INDEX_DIR, f"{doc_id}.pkl")
-        with open(path, "wb") as f:
-            pickle.dump({"chunks": chunks, "embeddings": embeddings}, f)
+        writer = self.begin_index(doc_id)
+        try:
+            writer.append(chunks, embeddings)
+        except BaseException:
+            writer.abort()
+            raise
+        self.commit_index(doc_id, writer)
 
     def load_index(self, doc_id):
-        path = os.path.join(INDEX_DIR, f"{doc_id}.pkl")
-        if not os.path.exists(path):
-            return None
-        with open(path, "rb") as f:
-            return pickle.load(f)
+        self.sync()
+        return self._load_index(doc_id)
 
+    def record_query(self, doc_id, n: int = 1):
+        """
+        Cuenta `n` preguntas sobre el documento (ver preload). Lo llama el
+        camino de consulta: reindexar o migrar también cargan el índice.
+        """
+        now = time.time()
+        queries = self.usage.get(doc_id, {}).get("queries", 0)
+        self.usage[doc_id] = {"at": now, "queries": queries + n}
+        pending = self._usage_pending.get(doc_id, {}).get("queries", 0)
+        self._usage_pending[doc_id] = {"at": now, "queries": pending + n}
 
-def delete_document(doc_id: str) -> bool:
-    """
-    Elimina archivo .txt, índice .pkl y metadata del docs.json.
-    """
-    deleted_any = False
-
-    # borrar txt
-    doc_path = os.path.join(DOCS_DIR, f"{doc_id}.txt")
-    if os.path.exists(doc_path):
-        os.remove(doc_path)
-        deleted_any = True
-
-    # borrar índice
-    index_path = os.path.join(INDEX_DIR, f"{doc_id}.pkl")
-    if os.path.exists(index_path):
-        os.remove(index_path)
-        deleted_any = True
-
-    # borrar metadata del docs.json
-    if os.path.exists(DOCS_PATH):
-        with open(DOCS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        if doc_id in data:
-            del data[doc_id]
-            with open(DOCS_PATH, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
-            deleted_any = True
-
-    return deleted_any
+    def _load_index(self, doc_id):
+        cached = self.index_cache.get(doc_id)
+        if cached is not None:
+            return cached
+
+        legacy = legacy_index_path(doc_id)
+        if os.path.exists(legacy) and not os.path.isdir(index_path(doc_id)):
+            migrate_pickle(legacy, index_path(doc_id))
+
+        with metrics.timed("index_load"):
+            index = open_index(index_path(doc_id))
+            if index is None:
+                return None
+
+            if index.nbytes <= self.index_cache.max_bytes:
+                index = index.load_into_memory()
+                self.index_cache.put(doc_id, index)
+        return index
+
+    def invalidate_index(self, doc_id):
+        self.index_cache.invalidate(doc_id)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(doc_id)
+        self.vector_index.remove(doc_id)
+        self.usage.pop(doc_id, None)
+        self._usage_pending.pop(doc_id, None)
+        self._usage_dropped.add(doc_id)
+
+    def ensure_vector_index(self) -> IVFIndex:
+        """Carga el índice global la primera vez y agrega documentos que le falten."""
+        self.sync()
+        if self.vector_index.loaded:
+            return self.vector_index
+
+        with self._vector_index_lock:
+            if not self.vector_index.loaded:
+                self._load_vector_index()
+        return self.vector_index
+
+    def _load_vector_index(self):
+        def open_embeddings(doc_id):
+            index = open_index(index_path(doc_id))
+            return index.vectors() if index is not None else None
+
+        self.vector_index.load(open_embeddings)
+        for doc_id in self.catalog.ids():
+            if doc_id in self.vector_index:
+                continue
+            embeddings = open_embeddings(doc_id)
+            if embeddings is not None:
+                self.vector_index.add(doc_id, embeddings)
+
+    def preload(self, n: int) -> int:
+        """
+        Carga en caché los `n` documentos más consultados (a igual cantidad,
+        los usados más recientemente). Devuelve cuántos cargó.
+        """
+        usage = dict(self.usage)
+        ranked = sorted(usage, key=lambda d: (usage[d]["queries"], usage[d]["at"]), reverse=True)
+        loaded = 0
+        for doc_id in ranked:
+            if loaded >= n:
+                break
+            if self.get(doc_id) and self._load_index(doc_id) is not None:
+                loaded += 1
+        log.info("📦 Precargados %d índices en caché", loaded)
+        return loaded
+
+    def save_usage(self):
+        """
+        Suma al archivo las preguntas que contó este worker desde el último
+        guardado. Cada worker tiene su propio `usage`: escribirlo entero
+        pisaría lo que guardaron los demás al apagarse.
+        """
+        pending, self._usage_pending = self._usage_pending, {}
+        dropped, self._usage_dropped = self._usage_dropped, set()
+
+        with file_lock(os.path.join(LOCKS_DIR, "usage.lock")):
+            usage = read_usage()
+            for doc_id in dropped:
+                usage.pop(doc_id, None)
+            for doc_id, u in pending.items():
+                old = usage.get(doc_id, {"at": 0, "queries": 0})
+                usage[doc_id] = {"at": max(old["at"], u["at"]), "queries": old["queries"] + u["queries"]}
+
+            tmp = f"{USAGE_PATH}.tmp-{os.getpid()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(usage, f)
+            os.replace(tmp, USAGE_PATH)
+
+        self.usage = usage
+
+    def migrate_legacy_indexes(self):
+        """Migración única de los índices .pkl al formato memmap (v2)."""
+        for name in os.listdir(INDEX_DIR):
+            if not name.endswith(".pkl"):
+                continue
+            doc_id = name[:-len(".pkl")]
+            try:
+                self.load_index(doc_id)
+            except Exception as e:
+                log.error("❌ No se pudo migrar el índice %s: %s", name, e)
+
+
+def index_path(doc_id: str) -> str:
+    return os.path.join(INDEX_DIR, doc_id)
+
+
+def legacy_index_path(doc_id: str) -> str:
+    return os.path.join(INDEX_DIR, f"{doc_id}.pkl")
+
+
+def doc_lock_path(doc_id: str) -> str:
+    return os.path.join(LOCKS_DIR, f"{doc_id}.lock")
+
+
+def read_usage() -> dict:
+    """Contenido de usage.json: doc_id -> {"at": última pregunta, "queries": preguntas}."""
+    if not os.path.exists(USAGE_PATH):
+        return {}
+    try:
+        with open(USAGE_PATH, "r", encoding="utf-8") as f:
+            return {
+                # el formato anterior guardaba solo la fecha
+                doc_id: u if isinstance(u, dict) else {"at": u, "queries": 0}
+                for doc_id, u in json.load(f).items()
+            }
+    except Exception:
+        return {}
+
+
+def document_paths(doc_id: str) -> list[str]:
+    """Todo lo que ocupa un documento en disco: texto, índice v2 y .pkl legado."""
+    return [os.path.join(DOCS_DIR, f"{doc_id}.txt"), index_path(doc_id), legacy_index_path(doc_id)]
+
+
+def _remove_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_trash():
+    """Restos de borrados interrumpidos (archivos apartados con TRASH_MARK)."""
+    for directory in (DOCS_DIR, INDEX_DIR):
+        for name in os.listdir(directory):
+            if TRASH_MARK in name:
+                _remove_path(os.path.join(directory, name))
+
+
+def delete_document(doc_id: str, store: DocumentStore) -> bool:
+    """Elimina texto, índice y metadatos del documento (ver DocumentStore.delete)."""
+    return store.delete(doc_id)
@@ -1,8 +1,9 @@
 import io
-import PyPDF2
-import docx
-from odf.opendocument import load
-from odf import text
+
+
+# PyPDF2, python-docx y odfpy se importan recién al extraer un documento
+# de ese formato (en los procesos de extracción): un worker que solo
+# responde consultas arranca sin cargarlos.
 
 
 # ==========================================================
@@ -10,6 +11,8 @@ from odf import text
 # ==========================================================
 
 def extract_pdf(file_bytes: bytes) -> str:
+    import PyPDF2
+
     try:
         reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
     except Exception as e:
@@ -27,13 +30,43 @@ def extract_pdf(file_bytes: bytes) -> str:
     return clean_text(text)
 
 
+def count_pdf_pages(path: str) -> int:
+    import PyPDF2
+
+    try:
+        return len(PyPDF2.PdfReader(path).pages)
+    except Exception as e:
+        raise ValueError(f"PDF corrupto o no legible: {e}")
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> str:
+    """Texto crudo de las páginas [start, end) — una porción para el pool de procesos."""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(path)
+
+    content = []
+    for i in range(start, end):
+        try:
+            page_text = reader.pages[i].extract_text() or ""
+        except:
+            page_text = ""
+        content.append(page_text)
+
+    return "\n".join(content)
+
+
 # ==========================================================
 # DOCX — lectura directa desde memoria (rápido y estable)
 # ==========================================================
 
-def extract_docx(file_bytes: bytes) -> str:
+def extract_docx(file_bytes: bytes | str) -> str:
+    """Acepta los bytes del archivo o su ruta en disco."""
+    import docx
+
+    source = io.BytesIO(file_bytes) if isinstance(file_bytes, bytes) else file_bytes
     try:
-        doc = docx.Document(io.BytesIO(file_bytes))
+        doc = docx.Document(source)
     except Exception as e:
         raise ValueError(f"Error leyendo DOCX: {e}")
 
@@ -45,25 +78,36 @@ def extract_docx(file_bytes: bytes) -> str:
 # ODT — usa archivo temp (odfpy necesita ruta física)
 # ==========================================================
 
-def extract_odt(file_bytes: bytes) -> str:
+def extract_odt(file_bytes: bytes | str) -> str:
+    """Acepta los bytes del archivo o su ruta en disco (sin copia temporal)."""
+    import os
     import tempfile
+    from odf import text
+    from odf.opendocument import load
 
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".odt") as tmp:
-            tmp.write(file_bytes)
-            tmp.flush()
-            doc = load(tmp.name)
+        if isinstance(file_bytes, str):
+            doc = load(file_bytes)
+        else:
+            # delete=False: en Windows no se puede reabrir por nombre un temporal abierto
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".odt") as tmp:
+                tmp.write(file_bytes)
+            try:
+                doc = load(tmp.name)
+            finally:
+                os.remove(tmp.name)
     except Exception as e:
         raise ValueError(f"Error leyendo ODT: {e}")
 
+    # ojo: `text` es el módulo de odfpy, no usar ese nombre para el contenido
     paragraphs = doc.getElementsByType(text.P)
 
-    text = "\n".join(
+    content = "\n".join(
         p.firstChild.data if (p.firstChild and hasattr(p.firstChild, "data")) else ""
         for p in paragraphs
     )
 
-    return clean_text(text)
+    return clean_text(content)
 
 
 # ==========================================================
@@ -100,3 +144,20 @@ def extract_text(filename: str, file_bytes: bytes) -> str:
         return file_bytes.decode("utf-8", errors="ignore")
 
     raise ValueError("Formato no soportado. Solo PDF, DOCX, ODT y TXT.")
+
+
+def extract_text_file(filename: str, path: str) -> str:
+    """
+    Igual que extract_text, leyendo el archivo desde disco: DOCX y ODT se
+    abren directo desde la ruta, sin cargar antes todos los bytes.
+    """
+    fname = filename.lower().strip()
+
+    if fname.endswith(".docx"):
+        return extract_docx(path)
+
+    if fname.endswith(".odt"):
+        return extract_odt(path)
+
+    with open(path, "rb") as f:
+        return extract_text(filename, f.read())
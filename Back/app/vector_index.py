@@ -0,0 +1,468 @@
+import json
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from .index_format import normalize_rows
+from .locks import FileLock
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+#  Índice vectorial global (IVF sobre NumPy)
+#
+#  Todos los chunks de todos los documentos, agrupados en `nlist` listas
+#  invertidas alrededor de centroides (k-means esférico). Una búsqueda solo
+#  recorre las `nprobe` listas más cercanas a la pregunta, así que el costo
+#  crece con nprobe/nlist del corpus y no con el corpus entero.
+#
+#  En disco (<INDEX_DIR>/_global/):
+#      meta.json            nlist y tamaño con el que se entrenó
+#      centroids.npy        float32 (nlist, dim)
+#      assign/<doc_id>.npy  int32: lista asignada a cada chunk del documento
+#
+#  Los vectores no se duplican en disco: se leen del índice de cada documento.
+#  En memoria las listas los guardan en `dtype` (float16 por defecto: la
+#  mitad que otra copia float32 del corpus). Con varios workers cada
+#  proceso tiene su copia en memoria; las escrituras en disco se
+#  serializan con un lock de archivo (write.lock).
+#
+#  Reentrenar (k-means y reasignar todo) corre sin tomar el lock del
+#  índice: las búsquedas siguen sobre las listas viejas y al final se
+#  cambian por las nuevas. Los documentos borrados se sacan de las listas
+#  y sus códigos se renumeran cuando los muertos pasan de un cuarto.
+# ==========================================================
+
+ASSIGN_BLOCK = 4096
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype="int32")
+    for i in range(0, len(x), ASSIGN_BLOCK):
+        out[i:i + ASSIGN_BLOCK] = np.argmax(x[i:i + ASSIGN_BLOCK] @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """K-means esférico (similitud coseno) sobre filas normalizadas."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(x[order], starts[nonempty], axis=0)
+
+        # listas vacías: se re-siembran con puntos al azar
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            sums[empty] = x[rng.choice(len(x), size=len(empty), replace=False)]
+
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+
+class _InvertedList:
+    """Vectores de una lista, en bloques que se compactan al buscar."""
+
+    def __init__(self, dim: int, dtype: str = "float32"):
+        self.dim = dim
+        self._blocks = []
+        self.vectors = np.zeros((0, dim), dtype=dtype)
+        self.docs = np.zeros(0, dtype="int32")
+        self.chunks = np.zeros(0, dtype="int32")
+
+    def append(self, vectors, doc_code, chunk_ids):
+        docs = np.full(len(chunk_ids), doc_code, dtype="int32")
+        self._blocks.append((vectors, docs, chunk_ids.astype("int32")))
+
+    def compact(self, alive: np.ndarray = None):
+        if self._blocks:
+            self.vectors = np.concatenate([self.vectors] + [b[0] for b in self._blocks])
+            self.docs = np.concatenate([self.docs] + [b[1] for b in self._blocks])
+            self.chunks = np.concatenate([self.chunks] + [b[2] for b in self._blocks])
+            self._blocks = []
+
+        if alive is not None and len(self.docs):
+            keep = alive[self.docs]
+            if not keep.all():
+                self.vectors = self.vectors[keep]
+                self.docs = self.docs[keep]
+                self.chunks = self.chunks[keep]
+
+
+class IVFIndex:
+    """
+    Índice IVF global con inserción incremental (al indexar un documento)
+    y tombstones (al borrarlo). Se reentrena cuando el corpus crece
+    `retrain_factor` veces desde el último entrenamiento; mientras haya
+    menos de `train_min` vectores funciona como una sola lista (exacto).
+    """
+
+    def __init__(self, path: str, nprobe: int = 8, train_min: int = 4096, retrain_factor: float = 4.0,
+                 dtype: str = "float16"):
+        self.path = path
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.retrain_factor = retrain_factor
+        self.dtype = np.dtype(dtype)
+
+        self.centroids = None
+        self.n_trained = 0
+        self.lists = []
+        self.dim = None
+
+        self._codes = {}          # doc_id -> código entero
+        self._doc_ids = []        # código -> doc_id
+        self._alive = np.zeros(0, dtype=bool)
+        self._doc_vectors = {}    # doc_id -> cantidad de chunks vivos
+        self._dead = 0
+        self._training = False    # con un reentrenamiento en curso los códigos no se renumeran
+
+        self._lock = threading.RLock()
+        self._disk_lock = FileLock(os.path.join(path, "write.lock"))
+        self._disk_depth = 0
+        self.loaded = False
+
+    # ------------------------------------------------------
+    #  Persistencia
+    # ------------------------------------------------------
+
+    @contextmanager
+    def _writing(self):
+        """Lock entre procesos para escribir en disco (reentrante; con self._lock tomado)."""
+        if self._disk_depth == 0:
+            self._disk_lock.acquire()
+        self._disk_depth += 1
+        try:
+            yield
+        finally:
+            self._disk_depth -= 1
+            if self._disk_depth == 0:
+                self._disk_lock.release()
+
+    def _assign_path(self, doc_id: str) -> str:
+        return os.path.join(self.path, "assign", f"{doc_id}.npy")
+
+    def _save_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        if self.centroids is not None:
+            tmp = os.path.join(self.path, "centroids.tmp.npy")
+            np.save(tmp, self.centroids)
+            os.replace(tmp, os.path.join(self.path, "centroids.npy"))
+
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"nlist": len(self.lists), "n_trained": self.n_trained, "dim": self.dim}, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _save_assign(self, doc_id: str, assign: np.ndarray):
+        os.makedirs(os.path.join(self.path, "assign"), exist_ok=True)
+        tmp = self._assign_path(doc_id) + ".tmp.npy"
+        np.save(tmp, assign)
+        os.replace(tmp, self._assign_path(doc_id))
+
+    def load(self, open_embeddings):
+        """
+        Carga centroides y asignaciones. `open_embeddings(doc_id)` devuelve la
+        matriz normalizada de un documento (o None si ya no existe).
+        """
+        with self._lock:
+            meta_path = os.path.join(self.path, "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                self.n_trained = meta.get("n_trained", 0)
+                self.dim = meta.get("dim")
+
+                centroids_path = os.path.join(self.path, "centroids.npy")
+                if os.path.exists(centroids_path):
+                    self.centroids = np.load(centroids_path)
+
+            if self.dim is not None:
+                self._reset_lists()
+
+            assign_dir = os.path.join(self.path, "assign")
+            names = os.listdir(assign_dir) if os.path.isdir(assign_dir) else []
+            for name in names:
+                if not name.endswith(".npy") or name.endswith(".tmp.npy"):
+                    continue
+                doc_id = name[:-len(".npy")]
+                embeddings = open_embeddings(doc_id)
+                if embeddings is None:
+                    with self._writing():
+                        if os.path.exists(os.path.join(assign_dir, name)):
+                            os.remove(os.path.join(assign_dir, name))
+                    continue
+
+                assign = np.load(os.path.join(assign_dir, name))
+                stale = len(assign) != len(embeddings) or (len(assign) and assign.max() >= len(self.lists))
+                assign = self._insert(doc_id, np.asarray(embeddings, dtype="float32"), None if stale else assign)
+                if stale:
+                    with self._writing():
+                        self._save_assign(doc_id, assign)
+
+            self.loaded = True
+
+    # ------------------------------------------------------
+    #  Inserción / borrado
+    # ------------------------------------------------------
+
+    def _reset_lists(self):
+        nlist = len(self.centroids) if self.centroids is not None else 1
+        self.lists = [_InvertedList(self.dim, self.dtype) for _ in range(nlist)]
+
+    def _insert(self, doc_id, embeddings, assign=None):
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            self._reset_lists()
+
+        if self.centroids is None:
+            assign = np.zeros(len(embeddings), dtype="int32")
+        elif assign is None:
+            assign = _nearest(embeddings, self.centroids)
+
+        code = len(self._doc_ids)
+        self._codes[doc_id] = code
+        self._doc_ids.append(doc_id)
+        self._alive = np.append(self._alive, True)
+        self._doc_vectors[doc_id] = len(embeddings)
+
+        stored = embeddings.astype(self.dtype, copy=False)
+        chunk_ids = np.arange(len(embeddings), dtype="int32")
+        order = np.argsort(assign, kind="stable")
+        bounds = np.flatnonzero(np.diff(assign[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group):
+                self.lists[assign[group[0]]].append(stored[group], code, chunk_ids[group])
+
+        return assign
+
+    def add(self, doc_id: str, embeddings: np.ndarray, persist: bool = True):
+        """
+        Inserta (o reemplaza) los chunks de un documento. `embeddings`
+        normalizada. Sin `persist` solo cambia la copia en memoria: es para
+        reflejar lo que ya escribió en disco otro proceso.
+        """
+        embeddings = np.asarray(embeddings, dtype="float32")
+        if embeddings.size == 0:
+            return
+
+        with self._lock:
+            if doc_id in self._codes:
+                self._tombstone(doc_id)
+
+            assign = self._insert(doc_id, embeddings)
+            self._maybe_compact()
+            if not persist:
+                return
+            with self._writing():
+                self._save_assign(doc_id, assign)
+                if self.centroids is None:
+                    self._save_meta()
+            retrain = self._should_retrain()
+
+        # fuera del lock: las búsquedas no esperan al k-means
+        if retrain:
+            self.retrain()
+
+    def _tombstone(self, doc_id: str):
+        code = self._codes.pop(doc_id)
+        self._alive[code] = False
+        self._dead += self._doc_vectors.pop(doc_id, 0)
+
+    def remove(self, doc_id: str, persist: bool = True):
+        with self._lock:
+            if doc_id in self._codes:
+                self._tombstone(doc_id)
+            if persist and os.path.exists(self._assign_path(doc_id)):
+                with self._writing():
+                    os.remove(self._assign_path(doc_id))
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._training:
+            return
+        dead_codes = len(self._doc_ids) - len(self._codes)
+        if self._dead > 0.25 * max(1, self.size + self._dead) or dead_codes > max(64, len(self._codes)):
+            self._compact()
+
+    def _compact(self):
+        """Saca de las listas los chunks de documentos borrados y renumera los códigos."""
+        for lst in self.lists:
+            lst.compact(self._alive)
+
+        codes = np.flatnonzero(self._alive)
+        remap = np.full(len(self._alive), -1, dtype="int32")
+        remap[codes] = np.arange(len(codes), dtype="int32")
+        for lst in self.lists:
+            lst.docs = remap[lst.docs]
+
+        self._doc_ids = [self._doc_ids[code] for code in codes]
+        self._codes = {doc_id: code for code, doc_id in enumerate(self._doc_ids)}
+        self._alive = np.ones(len(codes), dtype=bool)
+        self._dead = 0
+
+    @property
+    def size(self) -> int:
+        return sum(self._doc_vectors.values())
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._codes
+
+    # ------------------------------------------------------
+    #  Entrenamiento
+    # ------------------------------------------------------
+
+    def _should_retrain(self) -> bool:
+        n = self.size
+        if n < self.train_min:
+            return False
+        return self.centroids is None or n >= self.retrain_factor * max(1, self.n_trained)
+
+    def _entries(self, since: int = 0):
+        """(vectores, códigos, chunks) de las listas, de los documentos con código >= `since`."""
+        vectors, docs, chunks = [], [], []
+        for lst in self.lists:
+            lst.compact()
+            keep = lst.docs >= since
+            vectors.append(lst.vectors[keep])
+            docs.append(lst.docs[keep])
+            chunks.append(lst.chunks[keep])
+        return np.concatenate(vectors), np.concatenate(docs), np.concatenate(chunks)
+
+    def retrain(self):
+        """
+        Entrena centroides nuevos y reasigna todos los chunks. Los documentos
+        que se agregan mientras tanto se reubican al cambiar las listas y los
+        que se borran quedan afuera.
+        """
+        with self._lock:
+            if self._training or not self.lists:
+                return
+            self._compact()
+            vectors, docs, chunks = self._entries()
+            n_codes = len(self._doc_ids)
+            self._training = True
+
+        try:
+            n = len(vectors)
+            nlist = max(1, min(4096, int(4 * math.sqrt(n))))
+            sample = vectors
+            if n > nlist * 64:
+                rng = np.random.default_rng(0)
+                sample = vectors[rng.choice(n, size=nlist * 64, replace=False)]
+
+            log.info("🧭 Entrenando índice global: %d vectores, %d listas", n, nlist)
+            centroids = kmeans(np.asarray(sample, dtype="float32"), nlist)
+            assign = _nearest(vectors, centroids)
+
+            with self._lock, self._writing():
+                self._install(centroids, n, vectors, docs, chunks, assign, n_codes)
+        finally:
+            self._training = False
+
+    def _install(self, centroids, n_trained, vectors, docs, chunks, assign, n_codes):
+        """Cambia las listas por las del reentrenamiento (con self._lock tomado)."""
+        late = self._entries(since=n_codes)
+        vectors = np.concatenate([vectors, late[0]])
+        docs = np.concatenate([docs, late[1]])
+        chunks = np.concatenate([chunks, late[2]])
+        assign = np.concatenate([assign, _nearest(late[0], centroids)])
+
+        keep = self._alive[docs]
+        vectors, docs, chunks, assign = vectors[keep], docs[keep], chunks[keep], assign[keep]
+
+        self.centroids = centroids
+        self.n_trained = n_trained
+        self._reset_lists()
+
+        order = np.lexsort((chunks, assign, docs))
+        vectors, docs, chunks, assign = vectors[order], docs[order], chunks[order], assign[order]
+        positions = np.arange(len(docs))
+
+        if len(docs):
+            # asignaciones por documento, para el disco
+            for idx in np.split(positions, np.flatnonzero(np.diff(docs)) + 1):
+                doc_id = self._doc_ids[docs[idx[0]]]
+                doc_assign = np.empty(self._doc_vectors[doc_id], dtype="int32")
+                doc_assign[chunks[idx]] = assign[idx]
+                self._save_assign(doc_id, doc_assign)
+
+            # tramos contiguos (documento, lista) a cada lista invertida
+            runs = np.flatnonzero((np.diff(docs) != 0) | (np.diff(assign) != 0)) + 1
+            for idx in np.split(positions, runs):
+                self.lists[assign[idx[0]]].append(vectors[idx], docs[idx[0]], chunks[idx])
+
+        self._compact()
+        self._save_meta()
+
+    # ------------------------------------------------------
+    #  Búsqueda
+    # ------------------------------------------------------
+
+    def search(self, q: np.ndarray, top_k: int, nprobe: int = None, doc_ids=None):
+        """
+        Devuelve [(doc_id, chunk_id, score)] de mayor a menor similitud.
+        `nprobe` = listas a recorrer (más = mejor recall, más latencia).
+        """
+        q = np.asarray(q, dtype="float32")
+        q = q / (np.linalg.norm(q) or 1.0)
+
+        with self._lock:
+            if not self.lists or self.size == 0:
+                return []
+
+            nprobe = max(1, min(nprobe or self.nprobe, len(self.lists)))
+            if self.centroids is None:
+                probe = [0]
+            else:
+                scores = self.centroids @ q
+                probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+            allowed = self._alive
+            if doc_ids is not None:
+                allowed = np.zeros_like(self._alive)
+                for doc_id in doc_ids:
+                    if doc_id in self._codes:
+                        allowed[self._codes[doc_id]] = True
+
+            all_scores, all_docs, all_chunks = [], [], []
+            for lst_id in probe:
+                lst = self.lists[lst_id]
+                lst.compact()
+                if not len(lst.docs):
+                    continue
+                keep = allowed[lst.docs]
+                if not keep.any():
+                    continue
+                all_scores.append((lst.vectors[keep] @ q))
+                all_docs.append(lst.docs[keep])
+                all_chunks.append(lst.chunks[keep])
+
+            # los códigos son de esta lista: _compact arma otra (y renumera),
+            # _insert solo agrega al final
+            names = self._doc_ids
+
+        if not all_scores:
+            return []
+
+        scores = np.concatenate(all_scores)
+        docs = np.concatenate(all_docs)
+        chunks = np.concatenate(all_chunks)
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(names[docs[i]], int(chunks[i]), float(scores[i])) for i in best]
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from .config import OLLAMA_BASE_URL, LLM_MODEL
+from .embeddings import RetryableEmbeddingError, engine
+from .http_client import get_ollama_client, ollama_payload
+from .scheduler import scheduler
+
+log = logging.getLogger(__name__)
+
+
+# ==========================================================
+#  Arranque en caliente
+#
+#  Ollama carga un modelo recién en la primera llamada que lo usa, así
+#  que después de reiniciar la primera pregunta pagaba la carga del
+#  modelo de embeddings y después la del LLM, una detrás de otra. Al
+#  arrancar, en segundo plano (el servidor ya acepta peticiones), se
+#  cargan los dos a la vez y se precargan los índices de
+#  los documentos más consultados. Mientras tanto /health responde con
+#  `ready: false`; si Ollama no contesta (red, 5xx, 429) se reintenta con
+#  backoff. Si rechaza la carga (4xx: modelo que no existe) reintentar no
+#  sirve: el paso queda en error y /health/ready lo informa.
+# ==========================================================
+
+RETRY_MAX = 30.0
+LOAD_TIMEOUT = 300.0    # cargar un modelo grande desde disco puede tardar
+MODEL_STEPS = ("llm", "embeddings")
+
+
+class RetryableWarmupError(RuntimeError):
+    """Ollama no disponible por ahora (red, 5xx, 429): se reintenta."""
+
+
+class Warmup:
+    def __init__(self):
+        self.steps = {}       # paso -> {"state", "seconds", "error", ...}
+        self._task = None
+        self._started = None
+        self._finished = None
+
+    @property
+    def ready(self) -> bool:
+        # si falla la precarga de índices solo se pierde la ventaja; sin
+        # un modelo no se puede responder
+        return all(step["state"] != "running" for step in self.steps.values()) and not self.errors
+
+    @property
+    def errors(self) -> dict:
+        """Pasos de modelos que fallaron sin remedio: paso -> error."""
+        return {
+            name: step["error"] for name, step in self.steps.items()
+            if name in MODEL_STEPS and step["state"] == "error"
+        }
+
+    def start(self, models: bool, load_indexes):
+        """
+        Lanza el arranque en caliente. `load_indexes()` (o None) corre en
+        un hilo y devuelve cuántos índices precargó.
+        """
+        steps = {}
+        if models:
+            steps["llm"] = self._retrying(self._load_llm)
+            steps["embeddings"] = self._retrying(self._load_embeddings)
+        if load_indexes is not None:
+            steps["indexes"] = asyncio.to_thread(load_indexes)
+
+        self.steps = {name: {"state": "running"} for name in steps}
+        self._started = time.perf_counter()
+        if steps:
+            self._task = asyncio.create_task(self._run(steps))
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self, steps: dict):
+        async def run(name, coro):
+            start = time.perf_counter()
+            try:
+                result = await coro
+            except Exception as e:
+                self.steps[name] = {"state": "error", "error": str(e)[:200]}
+                log.error("❌ Arranque en caliente (%s): %s", name, e)
+                return
+            self.steps[name] = {"state": "done", "seconds": round(time.perf_counter() - start, 2)}
+            if name == "indexes":
+                self.steps[name]["loaded"] = result
+
+        await asyncio.gather(*(run(name, coro) for name, coro in steps.items()))
+        self._finished = time.perf_counter()
+        log.info(
+            "🔥 Arranque en caliente en %.1fs: %s", self._finished - self._started,
+            ", ".join(f"{name} {step['state']}" for name, step in self.steps.items()),
+        )
+
+    async def _retrying(self, load):
+        delay = 1.0
+        while True:
+            try:
+                return await load()
+            except (RetryableWarmupError, RetryableEmbeddingError) as e:
+                log.warning("⚠ Ollama no disponible para precargar modelos (reintento en %.0fs): %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(RETRY_MAX, delay * 2)
+
+    async def _post(self, path: str, payload: dict):
+        try:
+            async with scheduler.slot("batch"):
+                res = await get_ollama_client().post(
+                    f"{OLLAMA_BASE_URL}{path}", json=payload, timeout=LOAD_TIMEOUT
+                )
+        except httpx.TransportError as e:
+            raise RetryableWarmupError(str(e) or type(e).__name__)
+        if res.status_code == 429 or res.status_code >= 500:
+            raise RetryableWarmupError(f"HTTP {res.status_code}: {res.text[:200]}")
+        if res.status_code != 200:
+            raise RuntimeError(f"HTTP {res.status_code}: {res.text[:200]}")
+
+    async def _load_llm(self):
+        # sin mensajes Ollama solo carga el modelo (done_reason "load")
+        await self._post("/api/chat", ollama_payload(model=LLM_MODEL, messages=[], stream=False))
+
+    async def _load_embeddings(self):
+        # el motor ya sabe caer a /api/embeddings en un Ollama viejo
+        async with scheduler.slot("batch"):
+            await engine.warm(get_ollama_client(), LOAD_TIMEOUT)
+
+    def stats(self) -> dict:
+        end = self._finished or time.perf_counter()
+        return {
+            "ready": self.ready,
+            "errors": self.errors,
+            "seconds": round(end - self._started, 2) if self._started is not None else None,
+            "steps": self.steps,
+        }
+
+
+warmup = Warmup()
@@ -0,0 +1,76 @@
+"""
+Caché semántica de respuestas: un conjunto chico de preguntas repetidas
+(como el tráfico real de los documentos de ayuda) contra /query.
+
+El Ollama falso devuelve vectores por hash del texto, así que aquí solo
+coinciden las repeticiones exactas o con otros espacios (el texto se
+normaliza antes de embeber); con un modelo real también
+coinciden las reformulaciones por encima de ANSWER_CACHE_THRESHOLD.
+Mide latencia, llamadas de chat y que un PUT invalide las respuestas.
+
+    python -m bench.bench_answer_cache --questions 30 --requests 300
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from bench.bench_reindex import make_pages, wait_job
+from bench.fake_ollama import create_app, run_in_thread
+
+
+def variant(question: str, rng: random.Random) -> str:
+    return rng.choice([question, f"  {question}  ", question.replace(" ", "  ")])
+
+
+def main(n_questions: int, n_requests: int, tokens_per_sec: float):
+    fake = create_app(tokens_per_sec=tokens_per_sec)
+    base_ollama, _ = run_in_thread(fake)
+    os.environ["OLLAMA_BASE_URL"] = base_ollama
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    from app.main import app   # después del chdir: data/ queda en el temporal
+
+    base, _ = run_in_thread(app)
+    client = httpx.Client(base_url=base, timeout=120)
+
+    job = client.post("/documents", files={"file": ("ayuda.txt", "\n".join(make_pages(50)).encode())}).json()
+    doc_id = wait_job(client, job)[0]["document_id"]
+
+    rng = random.Random(0)
+    questions = [f"¿cómo se pide la licencia número {i}?" for i in range(n_questions)]
+    times = {True: [], False: []}
+    chats = fake.state.chats
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        res = client.post("/query", json={"document_id": doc_id, "question": variant(rng.choice(questions), rng)}).json()
+        times[res["cached"]].append(time.perf_counter() - start)
+    chats = fake.state.chats - chats
+
+    print(f"{n_requests} consultas sobre {n_questions} preguntas distintas")
+    for cached, label in ((False, "generadas"), (True, "desde caché")):
+        t = times[cached]
+        if t:
+            print(f"  {label:<12} {len(t):>5} | p50 {np.percentile(t, 50) * 1000:8.1f}ms"
+                  f" | p99 {np.percentile(t, 99) * 1000:8.1f}ms")
+    print(f"  llamadas de chat: {chats}")
+
+    job = client.put(f"/documents/{doc_id}", files={"file": ("ayuda.txt", "\n".join(make_pages(50, seed=1)).encode())}).json()
+    wait_job(client, job)
+    res = client.post("/query", json={"document_id": doc_id, "question": questions[0]}).json()
+    print(f"  tras PUT: cached={res['cached']}")
+    print(f"  /health: {client.get('/health').json()['answer_cache']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=50)
+    args = parser.parse_args()
+    main(args.questions, args.requests, args.tokens_per_sec)
@@ -0,0 +1,152 @@
+"""
+Ingesta de un corpus de muchos documentos: uno por uno contra
+POST /documents (como un script que sube archivo por archivo, esperando
+cuando la cola está llena) frente a una sola llamada a
+POST /documents/bulk, con un ZIP o con una lista de URLs servidas por un
+servidor HTTP local.
+
+El Ollama falso corre en otro proceso; los documentos son TXT, PDF, DOCX
+y ODT alternados (ver fixtures.py). También mide cuánto tarda una subida
+suelta mientras corre un lote.
+
+    python -m bench.bench_bulk --docs 200 --words 1500
+"""
+import argparse
+import functools
+import http.server
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+import httpx
+
+from bench.bench_workers import start_process, wait_http
+from bench.fake_ollama import free_port, run_in_thread
+from bench.fixtures import make_document
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORMATS = ("txt", "pdf", "docx", "odt")
+
+
+def make_corpus(directory: str, n_docs: int, n_words: int) -> list[str]:
+    names = []
+    for i in range(n_docs):
+        name = f"doc{i:05d}.{FORMATS[i % len(FORMATS)]}"
+        make_document(os.path.join(directory, name), n_words, seed=i)
+        names.append(name)
+    return names
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(directory: str) -> str:
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def one_by_one(client: httpx.Client, directory: str, names: list[str]) -> tuple[float, int]:
+    start = time.perf_counter()
+    pending = []
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            data = f.read()
+        while True:
+            res = client.post("/documents", files={"file": (name, data)})
+            if res.status_code != 429:
+                break
+            time.sleep(0.05)    # cola llena: esperar a que se libere
+        pending.append(res.json()["id"])
+
+    errors = 0
+    for job_id in pending:
+        while (job := client.get(f"/jobs/{job_id}").json())["stage"] not in ("done", "error"):
+            time.sleep(0.05)
+        errors += job["stage"] == "error"
+    return time.perf_counter() - start, errors
+
+
+def wait_bulk(client: httpx.Client, status: dict) -> dict:
+    while not status["finished"]:
+        time.sleep(0.1)
+        status = client.get(f"/documents/bulk/{status['id']}").json()
+    return status
+
+
+def bulk_archive(client: httpx.Client, directory: str, names: list[str]) -> tuple[float, dict, float]:
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            archive.write(os.path.join(directory, name), f"corpus/{name}")
+    status = client.post("/documents/bulk", files={"archive": ("corpus.zip", buffer.getvalue())}).json()
+
+    # una subida suelta mientras corre el lote: no debería esperar detrás de él
+    single = time.perf_counter()
+    with open(os.path.join(directory, names[0]), "rb") as f:
+        job = client.post("/documents", files={"file": (names[0], f.read())}).json()
+    while client.get(f"/jobs/{job['id']}").json()["stage"] not in ("done", "error"):
+        time.sleep(0.05)
+    single = time.perf_counter() - single
+
+    status = wait_bulk(client, status)
+    return time.perf_counter() - start, status["counts"], single
+
+
+def bulk_urls(client: httpx.Client, base: str, names: list[str]) -> tuple[float, dict]:
+    start = time.perf_counter()
+    urls = "\n".join(f"{base}/{name}" for name in names)
+    status = client.post("/documents/bulk", data={"urls": urls}).json()
+    status = wait_bulk(client, status)
+    return time.perf_counter() - start, status["counts"]
+
+
+def main(n_docs: int, n_words: int):
+    port = free_port()
+    ollama = start_process(["bench.fake_ollama", "--port", str(port)], BACK_DIR, dict(os.environ))
+    try:
+        wait_http(f"http://127.0.0.1:{port}/docs")
+        os.environ.update(
+            OLLAMA_BASE_URL=f"http://127.0.0.1:{port}", EMBED_CACHE_ENABLED="0",
+            WARMUP_ENABLED="0", LOG_LEVEL="warning",
+        )
+        workdir = tempfile.mkdtemp()
+        os.chdir(workdir)
+        from app.main import app   # después del chdir: data/ queda en el temporal
+        from app.config import BULK_WORKERS, INGEST_WORKERS
+
+        base, _ = run_in_thread(app)
+        client = httpx.Client(base_url=base, timeout=600)
+
+        corpus = os.path.join(workdir, "corpus")
+        os.makedirs(corpus)
+        names = make_corpus(corpus, n_docs, n_words)
+        files_base = serve_directory(corpus)
+
+        print(f"{n_docs} documentos de {n_words} palabras | workers: {INGEST_WORKERS} sueltos, {BULK_WORKERS} de lotes")
+        seconds, errors = one_by_one(client, corpus, names)
+        print(f"  uno por uno       {seconds:7.2f}s  {n_docs / seconds:6.1f} docs/s  errores {errors}")
+        seconds, counts, single = bulk_archive(client, corpus, names)
+        print(f"  bulk (ZIP)        {seconds:7.2f}s  {n_docs / seconds:6.1f} docs/s  {counts}")
+        print(f"    subida suelta durante el lote: {single:.2f}s")
+        seconds, counts = bulk_urls(client, files_base, names)
+        print(f"  bulk (URLs)       {seconds:7.2f}s  {n_docs / seconds:6.1f} docs/s  {counts}")
+        print(f"  documentos en el catálogo: {client.get('/documents', params={'limit': 1}).json()['total']}")
+    finally:
+        ollama.terminate()
+        ollama.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=1500)
+    args = parser.parse_args()
+    main(args.docs, args.words)
@@ -0,0 +1,76 @@
+"""
+Armado del contexto: tokens de prompt con los chunks elegidos pegados
+tal cual contra el contexto empaquetado (chunks contiguos unidos sin el
+solape, tramos repetidos fuera), con los dos chunkers.
+
+El texto son secciones de 300 a 1200 palabras, cada una con su propio
+vocabulario (como los apartados de un manual); las preguntas son
+palabras de una sección y los chunks se eligen con BM25. Cuando una
+sección ocupa varios chunks, los vecinos que comparten el solape salen
+juntos, como pasa con las preguntas reales.
+
+    python -m bench.bench_context --sections 300 --questions 500 --top-k 4
+"""
+import argparse
+import random
+
+import numpy as np
+
+from app.context import SEPARATOR, estimate_tokens, pack_context
+from app.lexical import LexicalIndex, tokenize
+from app.rag import ChunkWindow, ContentChunkWindow
+from bench.fixtures import sentences
+
+
+def chunk_all(window, text: str) -> list[str]:
+    return window.feed(text) + window.finish()
+
+
+def make_sections(n_sections: int, rng: random.Random) -> tuple[str, list[list[str]]]:
+    filler = " ".join(sentences(n_sections * 1200, 0)).split()
+    parts, vocabularies, pos = [], [], 0
+    for s in range(n_sections):
+        vocabulary = [f"tema{s}x{j}" for j in range(12)]
+        n = rng.randint(300, 1200)
+        words = filler[pos:pos + n]
+        pos += n
+        # una de cada cinco palabras es propia de la sección
+        parts.append(" ".join(rng.choice(vocabulary) if rng.random() < 0.2 else w for w in words))
+        vocabularies.append(vocabulary)
+    return " ".join(parts), vocabularies
+
+
+def main(n_sections: int, n_questions: int, top_k: int, budget: int):
+    rng = random.Random(1)
+    text, vocabularies = make_sections(n_sections, rng)
+    questions = [" ".join(rng.sample(rng.choice(vocabularies), 4)) for _ in range(n_questions)]
+
+    print(f"{len(text.split())} palabras en {n_sections} secciones, {n_questions} preguntas,"
+          f" top_k={top_k}, presupuesto {budget} tokens")
+    print(f"{'chunker':>8} {'tal cual':>9} {'empaquetado':>12} {'ahorro':>8} {'tramos':>7} {'unidos':>7}")
+    for name, window in (("fixed", ChunkWindow(220, 40)), ("content", ContentChunkWindow(220, 40))):
+        chunks = chunk_all(window, text)
+        lexical = LexicalIndex.from_chunks(chunks)
+        raw, packed, segments, merged = [], [], [], 0
+        for q in questions:
+            ids = [int(i) for i in lexical.top(tokenize(q), top_k)]
+            selected = [chunks[i] for i in ids]
+            _, stats = pack_context(selected, budget, ids)
+            raw.append(estimate_tokens(SEPARATOR.join(selected)))
+            packed.append(stats["tokens"] + stats["tokens_dropped"])
+            segments.append(stats["segments"])
+            merged += stats["segments"] < len(selected)
+
+        saved = 1 - np.sum(packed) / np.sum(raw)
+        print(f"{name:>8} {np.mean(raw):>9.0f} {np.mean(packed):>12.0f} {saved:>7.1%}"
+              f" {np.mean(segments):>7.2f} {merged / n_questions:>6.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--budget", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.sections, args.questions, args.top_k, args.budget)
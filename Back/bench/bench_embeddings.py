@@ -0,0 +1,54 @@
+"""
+Chunks/segundo del motor de embeddings contra el Ollama falso.
+
+Compara el comportamiento anterior (un chunk por petición, en serie,
+/api/embeddings) con el motor por lotes concurrente.
+
+    python -m bench.bench_embeddings --chunks 600
+"""
+import argparse
+import asyncio
+import time
+
+from app.embeddings import EmbeddingEngine
+from bench.fake_ollama import create_app, run_in_thread
+
+
+def make_chunks(n: int) -> list[str]:
+    return [f"chunk {i} " + "palabra " * 200 for i in range(n)]
+
+
+async def measure(engine: EmbeddingEngine, chunks: list[str]) -> float:
+    start = time.perf_counter()
+    vectors = await engine.embed(chunks)
+    elapsed = time.perf_counter() - start
+    assert vectors.shape[0] == len(chunks)
+    return len(chunks) / elapsed
+
+
+async def main(n_chunks: int, batch_size: int, concurrency: int):
+    base_url, server = run_in_thread(create_app())
+    chunks = make_chunks(n_chunks)
+
+    sequential = EmbeddingEngine(base_url=base_url, batch_size=1, concurrency=1)
+    sequential.legacy = True
+    batched = EmbeddingEngine(base_url=base_url, batch_size=batch_size, concurrency=concurrency)
+
+    before = await measure(sequential, chunks)
+    after = await measure(batched, chunks)
+
+    print(f"chunks:                 {n_chunks}")
+    print(f"secuencial (1x1):       {before:8.1f} chunks/s")
+    print(f"lotes {batch_size}x{concurrency} en vuelo:    {after:8.1f} chunks/s")
+    print(f"mejora:                 {after / before:8.1f}x")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=600)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.chunks, args.batch_size, args.concurrency))
@@ -0,0 +1,66 @@
+"""
+Latencia del event loop mientras se extrae un PDF grande.
+
+Un "ticker" se despierta cada 10 ms y mide cuánto tarde llega; se compara
+la extracción directa en el loop (como antes) contra el pool de procesos.
+
+    python -m bench.bench_event_loop --pages 500
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from app.extraction import extract_file, shutdown
+from app.text_extractor import extract_text_file
+from bench.fixtures import make_pdf
+
+TICK = 0.01
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def measure(name: str, extract) -> None:
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    text = await extract()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await tick
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(f"{name:<22} extracción {elapsed:6.2f}s | {len(text):>9} chars | "
+          f"lag p99 {p99:8.1f} ms | lag máx {max(lags or [0]):8.1f} ms")
+
+
+async def main(pages: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "grande.pdf")
+        make_pdf(path, pages)
+
+        async def in_loop():
+            return extract_text_file("grande.pdf", path)
+
+        await measure("en el event loop", in_loop)
+        await measure("pool de procesos", lambda: extract_file("grande.pdf", path))
+
+    shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.pages))
@@ -0,0 +1,85 @@
+"""
+Embeddings cuantizados: memoria del índice en RAM, recall@k contra la
+búsqueda exacta en float32 y tiempo de recorrido por consulta, para
+float32 / float16 / int8, con y sin reordenar la lista corta en float32.
+
+Embeddings sintéticos agrupados (centros + ruido), parecidos a los de un
+modelo real: muchos vecinos casi empatados, que es donde la cuantización
+cambia el orden. Las consultas son chunks perturbados.
+
+    python -m bench.bench_quantization --chunks 100000 --dim 768
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app import rag
+from app.index_format import open_index, normalize_rows, write_index
+from app.rag import rank_chunks
+
+CONFIGS = (
+    ("float32", "float32", False),
+    ("float16", "float16", False),
+    ("float16+rescore", "float16", True),
+    ("int8", "int8", False),
+    ("int8+rescore", "int8", True),
+)
+
+
+def make_embeddings(n, dim, n_clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    labels = rng.integers(0, n_clusters, n)
+    return normalize_rows(centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype("float32"))
+
+
+def main(n_chunks, dim, n_queries, top_k):
+    embeddings = make_embeddings(n_chunks, dim, max(8, n_chunks // 500))
+    rng = np.random.default_rng(1)
+    targets = rng.integers(0, n_chunks, n_queries)
+    queries = normalize_rows(embeddings[targets] + 0.02 * rng.standard_normal((n_queries, dim)).astype("float32"))
+    chunks = [f"chunk {i}" for i in range(n_chunks)]
+
+    exact = [set(np.argsort(-(embeddings @ q))[:top_k].tolist()) for q in queries]
+
+    print(f"{n_chunks} chunks, dim {dim}, {n_queries} consultas, top_k={top_k}, "
+          f"reordenando top_k x {rag.RESCORE_FACTOR}")
+    print(f"{'modo':<17} {'RAM MB':>8} {'ahorro':>7} {f'recall@{top_k}':>10} "
+          f"{'scan ms':>8} {'ms/consulta':>12}")
+
+    base_mb = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, mode, rescore in CONFIGS:
+            path = os.path.join(tmp, label)
+            write_index(path, chunks, embeddings, quantization=mode, keep_float32=rescore)
+            index = open_index(path).load_into_memory()
+            mb = index.nbytes / 1024 / 1024
+            base_mb = base_mb or mb
+
+            start = time.perf_counter()
+            for q in queries:
+                index.scores(q)
+            scan_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+            recall = []
+            start = time.perf_counter()
+            for q, truth in zip(queries, exact):
+                ids = rank_chunks(index, q, "", top_k, "dense")
+                recall.append(len(truth & set(ids.tolist())) / top_k)
+            ms = (time.perf_counter() - start) * 1000 / n_queries
+
+            print(f"{label:<17} {mb:>8.1f} {1 - mb / base_mb:>7.0%} {np.mean(recall):>10.3f} "
+                  f"{scan_ms:>8.2f} {ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+    main(args.chunks, args.dim, args.queries, args.top_k)
@@ -0,0 +1,80 @@
+"""
+Reindexado incremental: se sube un documento largo, se editan unas pocas
+"páginas" y se actualiza con PUT /documents/{id}. Compara cuántos chunks
+se vuelven a embeber y cuánto tarda contra la indexación completa.
+
+Corre el backend y el Ollama falso en hilos, con la caché de embeddings
+desactivada para que la reutilización medida sea solo la del índice.
+
+    python -m bench.bench_reindex --pages 400 --edited 3
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import httpx
+
+from bench.fake_ollama import create_app, run_in_thread
+from bench.fixtures import sentences
+
+WORDS_PER_PAGE = 450
+
+
+def make_pages(n_pages: int, seed: int = 0) -> list[str]:
+    lines = sentences(n_pages * WORDS_PER_PAGE, seed)
+    per_page = len(lines) // n_pages
+    return [" ".join(lines[i * per_page:(i + 1) * per_page]) for i in range(n_pages)]
+
+
+def wait_job(client: httpx.Client, job: dict) -> tuple[dict, float]:
+    start = time.perf_counter()
+    while job["stage"] not in ("done", "error"):
+        time.sleep(0.05)
+        job = client.get(f"/jobs/{job['id']}").json()
+    return job, time.perf_counter() - start
+
+
+def main(n_pages: int, edited: int, item_latency: float):
+    base_ollama, _ = run_in_thread(create_app(item_latency=item_latency))
+    os.environ["OLLAMA_BASE_URL"] = base_ollama
+    os.environ["EMBED_CACHE_ENABLED"] = "0"
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    from app.main import app   # después del chdir: data/ queda en el temporal
+
+    base, _ = run_in_thread(app)
+    time.sleep(1)
+    client = httpx.Client(base_url=base, timeout=60)
+
+    pages = make_pages(n_pages)
+    job = client.post("/documents", files={"file": ("politica.txt", "\n".join(pages).encode())}).json()
+    job, full_s = wait_job(client, job)
+    doc_id = job["document_id"]
+
+    rng = random.Random(1)
+    for p in rng.sample(range(n_pages), edited):
+        words = pages[p].split()
+        # un párrafo reescrito y otro insertado en cada página editada
+        words[100:160] = sentences(60, seed=p + 100)[0].split() * 5
+        words[300:300] = " ".join(sentences(80, seed=p + 200)).split()
+        pages[p] = " ".join(words)
+
+    job = client.put(f"/documents/{doc_id}", files={"file": ("politica.txt", "\n".join(pages).encode())}).json()
+    job, update_s = wait_job(client, job)
+
+    print(f"documento: {n_pages} páginas, {edited} editadas")
+    print(f"indexación completa:    {full_s:6.2f}s")
+    print(f"actualización (PUT):    {update_s:6.2f}s | {job['n_chunks']} chunks, "
+          f"{job['n_embedded']} embebidos, {job['n_reused']} reutilizados")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--edited", type=int, default=3)
+    parser.add_argument("--item-latency", type=float, default=0.01)
+    args = parser.parse_args()
+    main(args.pages, args.edited, args.item_latency)
@@ -0,0 +1,125 @@
+"""
+Calidad y latencia de la recuperación por documento: dense vs hybrid
+(BM25 + coseno con RRF) vs prefilter (BM25 elige candidatos).
+
+Corpus sintético: cada chunk tiene un tema y algunos llevan un código de
+pieza / artículo único. Los "embeddings" son la suma de vectores por
+palabra, con peso bajo para los códigos (como un modelo real, que casi no
+distingue "REF-4821-B" de "REF-4812-B"). Dos tipos de consulta:
+  tema    -> palabras tomadas del chunk buscado
+  código  -> el código exacto más un par de palabras del tema
+
+    python -m bench.bench_retrieval --chunks 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from app.index_format import open_index, normalize_rows, write_index
+from app.rag import rank_chunks
+
+SYLLABLES = "ba be bi bo bu ca ce ci co cu da de di do du fa fe fi la le li lo lu ma me mi mo mu na ne ni no pa pe pi po pu ra re ri ro ru sa se si so su ta te ti to tu va ve vi".split()
+CODE_WEIGHT = 0.05
+
+
+def make_words(rng, n):
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class ToyEmbedder:
+    def __init__(self, dim, seed=0):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+        self.vectors = {}
+
+    def _vec(self, word):
+        v = self.vectors.get(word)
+        if v is None:
+            v = self.vectors[word] = self.rng.standard_normal(self.dim).astype("float32")
+        return v
+
+    def embed(self, text):
+        acc = np.zeros(self.dim, dtype="float32")
+        for word in text.split():
+            weight = CODE_WEIGHT if any(c.isdigit() for c in word) else 1.0
+            acc += weight * self._vec(word.lower().strip(".,;:¿?"))
+        return acc
+
+
+def make_corpus(n_chunks, dim, seed=0):
+    rng = random.Random(seed)
+    vocab = make_words(rng, 4000)
+    common, topic_words = vocab[:400], vocab[400:]
+    n_topics = max(4, n_chunks // 200)
+    topics = [rng.sample(topic_words, 40) for _ in range(n_topics)]
+
+    chunks, codes = [], {}
+    for i in range(n_chunks):
+        topic = topics[i % n_topics]
+        words = [rng.choice(topic) if rng.random() < 0.6 else rng.choice(common) for _ in range(150)]
+        if rng.random() < 0.3:
+            code = f"REF-{rng.randint(1000, 9999)}-{rng.choice('ABCDEFGH')}"
+            if code not in codes:
+                codes[code] = i
+                words.insert(rng.randint(0, len(words)), code)
+        chunks.append(" ".join(words))
+    return chunks, codes
+
+
+def make_queries(chunks, codes, n, seed=0):
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(n // 2):
+        target = rng.randrange(len(chunks))
+        words = [w for w in chunks[target].split() if not w.startswith("REF-")]
+        queries.append(("tema", " ".join(rng.sample(words, 10)), target))
+    for code in rng.sample(sorted(codes), min(n // 2, len(codes))):
+        target = codes[code]
+        words = [w for w in chunks[target].split() if not w.startswith("REF-")]
+        queries.append(("código", f"¿Qué dice la pieza {code} sobre {' '.join(rng.sample(words, 2))}?", target))
+    return queries
+
+
+def main(n_chunks, dim, n_queries, top_k):
+    chunks, codes = make_corpus(n_chunks, dim)
+    embedder = ToyEmbedder(dim)
+    embeddings = normalize_rows(np.stack([embedder.embed(c) for c in chunks]))
+    queries = make_queries(chunks, codes, n_queries)
+    q_embs = [embedder.embed(q) for _, q, _ in queries]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "doc")
+        write_index(path, chunks, embeddings)
+        index = open_index(path).load_into_memory()
+        index.lexical.scores([])   # vocabulario armado antes de medir
+
+        print(f"{n_chunks} chunks, dim {dim}, {len(queries)} consultas, top_k={top_k}")
+        print(f"{'modo':<10} {'hit@k tema':>11} {'hit@k código':>13} {'MRR':>6} {'ms/consulta':>12}")
+        for mode in ("dense", "hybrid", "prefilter"):
+            hits = {"tema": [], "código": []}
+            rr = []
+            start = time.perf_counter()
+            for (kind, question, target), q_emb in zip(queries, q_embs):
+                ids = list(rank_chunks(index, q_emb, question, top_k, mode))
+                hits[kind].append(target in ids)
+                rr.append(1.0 / (ids.index(target) + 1) if target in ids else 0.0)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            print(f"{mode:<10} {np.mean(hits['tema']):>11.3f} {np.mean(hits['código']):>13.3f} "
+                  f"{np.mean(rr):>6.3f} {ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+    main(args.chunks, args.dim, args.queries, args.top_k)
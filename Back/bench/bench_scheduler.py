@@ -0,0 +1,93 @@
+"""
+Planificador de llamadas a Ollama bajo carga.
+
+Corre el backend y el Ollama falso en hilos y mide tres cosas:
+  - ráfaga: muchas preguntas distintas a la vez contra un chat lento;
+    las que no entran en la cola reciben 429 + Retry-After enseguida en
+    vez de esperar hasta el timeout
+  - prioridad: latencia de /query mientras se indexa un documento grande
+    (los embeddings de ingesta ceden el cupo a las preguntas)
+  - deduplicación: la misma pregunta repetida a la vez genera una sola
+    llamada de chat
+
+    python -m bench.bench_scheduler --burst 200 --pages 400
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from bench.bench_reindex import make_pages, wait_job
+from bench.fake_ollama import create_app, run_in_thread
+
+
+async def fire(base: str, doc_id: str, questions: list[str]) -> list[tuple[int, float, str]]:
+    """(status, segundos, Retry-After) de cada pregunta, todas a la vez."""
+    limits = httpx.Limits(max_connections=len(questions))
+    async with httpx.AsyncClient(base_url=base, timeout=300, limits=limits) as client:
+        async def one(q):
+            start = time.perf_counter()
+            res = await client.post("/query", json={"document_id": doc_id, "question": q})
+            return res.status_code, time.perf_counter() - start, res.headers.get("retry-after", "")
+        return await asyncio.gather(*(one(q) for q in questions))
+
+
+def summary(results) -> str:
+    ok = [s for status, s, _ in results if status == 200]
+    busy = [(s, r) for status, s, r in results if status == 429]
+    other = len(results) - len(ok) - len(busy)
+    line = f"200: {len(ok):>4}"
+    if ok:
+        line += f" (p50 {np.percentile(ok, 50):.2f}s, p99 {np.percentile(ok, 99):.2f}s)"
+    line += f" | 429: {len(busy):>4}"
+    if busy:
+        line += (f" (respuesta en p99 {np.percentile([s for s, _ in busy], 99) * 1000:.0f}ms,"
+                 f" Retry-After {min(r for _, r in busy)}-{max(r for _, r in busy)}s)")
+    return line + f" | otros: {other}"
+
+
+def main(burst: int, pages: int, tokens_per_sec: float):
+    fake = create_app(tokens_per_sec=tokens_per_sec, item_latency=0.02)
+    base_ollama, _ = run_in_thread(fake)
+    os.environ["OLLAMA_BASE_URL"] = base_ollama
+    os.environ["EMBED_CACHE_ENABLED"] = "0"
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    from app.main import app   # después del chdir: data/ queda en el temporal
+    from app.scheduler import scheduler
+
+    base, _ = run_in_thread(app)
+    client = httpx.Client(base_url=base, timeout=300)
+
+    job = client.post("/documents", files={"file": ("politica.txt", "\n".join(make_pages(20)).encode())}).json()
+    doc_id = wait_job(client, job)[0]["document_id"]
+    print(f"cupo: {scheduler.concurrency} en vuelo, cola interactiva: {scheduler.max_waiting['interactive']}")
+
+    results = asyncio.run(fire(base, doc_id, [f"pregunta {i} sobre la política" for i in range(burst)]))
+    print(f"ráfaga de {burst}:        {summary(results)}")
+
+    idle = asyncio.run(fire(base, doc_id, [f"sin carga {i}" for i in range(4)]))
+    job = client.post("/documents", files={"file": ("grande.txt", "\n".join(make_pages(pages, seed=1)).encode())}).json()
+    time.sleep(0.5)
+    during = asyncio.run(fire(base, doc_id, [f"durante la ingesta {i}" for i in range(4)]))
+    job, ingest_s = wait_job(client, job)
+    print(f"/query sin carga:      {summary(idle)}")
+    print(f"/query con ingesta:    {summary(during)} | ingesta de {job['n_chunks']} chunks en {ingest_s:.1f}s")
+
+    chats = fake.state.chats
+    same = asyncio.run(fire(base, doc_id, ["¿cuál es la política de devoluciones?"] * 20))
+    print(f"20 preguntas iguales:  {summary(same)} | llamadas de chat: {fake.state.chats - chats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=40)
+    args = parser.parse_args()
+    main(args.burst, args.pages, args.tokens_per_sec)
@@ -0,0 +1,133 @@
+"""
+Conversaciones de varios turnos sobre un documento: cada pregunta como
+consulta suelta (/query/stream sin sesión) frente a turnos de una sesión
+(con session_id), donde el prompt de cada turno extiende el anterior.
+
+El Ollama falso corre en otro proceso, cobra el prefill del prompt
+(--prefill, palabras por segundo) y guarda lo ya evaluado por slot, así
+que solo cobra lo que no comparte con un prompt anterior. El documento
+son secciones con vocabulario propio (ver bench_context.py); cada
+conversación vuelve sobre unas pocas secciones, como las repreguntas.
+Por turno se mide la latencia, los tokens de prompt que tuvo que
+evaluar Ollama y, con sesión, el prefijo reutilizable y los chunks que ya
+estaban en la conversación.
+
+    python -m bench.bench_sessions --conversations 8 --turns 8 --prefill 400
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from bench.bench_reindex import wait_job
+from bench.bench_workers import start_process, wait_http
+from bench.fake_ollama import free_port, run_in_thread
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def ask(client: httpx.Client, payload: dict) -> dict:
+    """Un turno por /query/stream: devuelve el evento done y la latencia."""
+    start = time.perf_counter()
+    event, done = None, None
+    with client.stream("POST", "/query/stream", json=payload) as res:
+        for line in res.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise RuntimeError(data["detail"])
+                done = data
+    done["latency"] = time.perf_counter() - start
+    return done
+
+
+def conversations(vocabularies: list[list[str]], n: int, turns: int, rng: random.Random) -> list[list[str]]:
+    result = []
+    for _ in range(n):
+        topics = rng.sample(vocabularies, 3)
+        result.append([" ".join(rng.sample(rng.choice(topics), 4)) for _ in range(turns)])
+    return result
+
+
+def run(client: httpx.Client, doc_id: str, convs: list[list[str]], top_k: int, with_session: bool) -> list[list[dict]]:
+    results = []
+    for c, questions in enumerate(convs):
+        session_id = f"bench-{c}" if with_session else None
+        turns = []
+        for question in questions:
+            payload = {"document_id": doc_id, "question": question, "top_k": top_k}
+            if session_id:
+                payload["session_id"] = session_id
+            turns.append(ask(client, payload))
+        results.append(turns)
+    return results
+
+
+def report(name: str, results: list[list[dict]]):
+    n_turns = len(results[0])
+    print(f"  {name}")
+    print(f"    {'turno':>5} {'latencia':>9} {'prompt evaluado':>16} {'prefijo reutil.':>16} {'chunks ya vistos':>17}")
+    for t in range(n_turns):
+        turns = [conv[t] for conv in results]
+        latency = np.mean([x["latency"] for x in turns]) * 1000
+        evaluated = np.mean([x["prompt_tokens"] or 0 for x in turns])
+        line = f"    {t + 1:>5} {latency:>7.0f}ms {evaluated:>16.0f}"
+        if "session" in turns[0]:
+            prefix = np.mean([x["session"]["prefix_tokens"] for x in turns])
+            reused = np.mean([x["session"]["reused_chunks"] for x in turns])
+            line += f" {prefix:>16.0f} {reused:>17.1f}"
+        print(line)
+    latencies = [x["latency"] for conv in results for x in conv[1:]]
+    print(f"    repreguntas: latencia media {np.mean(latencies) * 1000:.0f}ms,"
+          f" p95 {np.percentile(latencies, 95) * 1000:.0f}ms")
+
+
+def main(n_conversations: int, n_turns: int, prefill: float, top_k: int):
+    port = free_port()
+    env = dict(os.environ, FAKE_OLLAMA_PREFILL_PER_SEC=str(prefill), FAKE_OLLAMA_PARALLEL="1")
+    ollama = start_process(["bench.fake_ollama", "--port", str(port)], BACK_DIR, env)
+    try:
+        wait_http(f"http://127.0.0.1:{port}/docs")
+        os.environ.update(
+            OLLAMA_BASE_URL=f"http://127.0.0.1:{port}", ANSWER_CACHE_ENABLED="0",
+            WARMUP_ENABLED="0", LOG_LEVEL="warning",
+        )
+        os.chdir(tempfile.mkdtemp())
+        # después del chdir y del entorno: data/ queda en el temporal
+        from app.main import app
+        from bench.bench_context import make_sections
+
+        base, _ = run_in_thread(app)
+        client = httpx.Client(base_url=base, timeout=600)
+
+        rng = random.Random(1)
+        text, vocabularies = make_sections(200, rng)
+        job = client.post("/documents", files={"file": ("manual.txt", text.encode())}).json()
+        job, _ = wait_job(client, job)
+        convs = conversations(vocabularies, n_conversations, n_turns, rng)
+
+        print(f"{n_conversations} conversaciones de {n_turns} turnos, top_k={top_k},"
+              f" prefill {prefill:.0f} palabras/s")
+        report("sin sesión", run(client, job["document_id"], convs, top_k, False))
+        report("con sesión", run(client, job["document_id"], convs, top_k, True))
+        print(f"  sesiones: {client.get('/health').json()['sessions']}")
+    finally:
+        ollama.terminate()
+        ollama.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--prefill", type=float, default=400)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+    main(args.conversations, args.turns, args.prefill, args.top_k)
@@ -0,0 +1,145 @@
+"""
+Arranque en frío: cuánto tarda la primera respuesta después de reiniciar
+el backend, con y sin arranque en caliente (app/warmup.py).
+
+El Ollama falso simula la carga de cada modelo en su primera llamada
+(--load-time, de a un modelo por vez como Ollama) y se reinicia en cada
+corrida para que los modelos estén fríos. Sobre un directorio de datos
+con un documento ya consultado, mide para cada configuración:
+  - vivo:  desde lanzar el proceso hasta que /health responde
+  - listo: hasta que /health informa ready
+  - primera respuesta: /query enviada apenas responde /health, o cuando
+    llega el primer usuario unos segundos después, con el desglose por
+    etapa (carga del índice, embeddings, LLM)
+
+    python -m bench.bench_startup --load-time 3 --pages 2000
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import httpx
+
+from bench.bench_reindex import make_pages, wait_job
+from bench.bench_workers import start_process, wait_http
+from bench.fake_ollama import free_port
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "sin warm-up": {"WARMUP_ENABLED": "0", "INDEX_CACHE_PRELOAD": "0"},
+    "warm-up": {"WARMUP_ENABLED": "1", "INDEX_CACHE_PRELOAD": "4"},
+}
+
+
+def start_ollama(load_time: float):
+    port = free_port()
+    env = dict(os.environ, FAKE_OLLAMA_LOAD_TIME=str(load_time), FAKE_OLLAMA_TOKENS_PER_SEC="200")
+    proc = start_process(["bench.fake_ollama", "--port", str(port)], BACK_DIR, env)
+    url = f"http://127.0.0.1:{port}"
+    wait_http(f"{url}/docs")
+    return proc, url
+
+
+def start_backend(workdir: str, ollama_url: str, extra: dict):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=BACK_DIR, OLLAMA_BASE_URL=ollama_url, **extra)
+    proc = start_process(
+        ["uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], workdir, env
+    )
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def stop(proc):
+    proc.terminate()
+    proc.wait(timeout=30)
+
+
+def wait_until(check, timeout: float = 120) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if check():
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError("timeout")
+
+
+def prepare(workdir: str, pages: int) -> str:
+    """Sube un documento y lo consulta (queda entre los más consultados)."""
+    ollama, ollama_url = start_ollama(0)
+    server, base = start_backend(workdir, ollama_url, {"WARMUP_ENABLED": "0"})
+    try:
+        wait_http(f"{base}/health")
+        client = httpx.Client(base_url=base, timeout=120)
+        job = client.post("/documents", files={"file": ("politica.txt", "\n".join(make_pages(pages)).encode())}).json()
+        job, _ = wait_job(client, job)
+        for i in range(3):
+            client.post("/query", json={"document_id": job["document_id"], "question": f"pregunta {i}"})
+    finally:
+        stop(server)     # al cerrar guarda el uso de los documentos
+        stop(ollama)
+    return job["document_id"]
+
+
+def run(workdir: str, doc_id: str, extra: dict, load_time: float, arrival: float) -> dict:
+    ollama, ollama_url = start_ollama(load_time)
+    start = time.perf_counter()
+    server, base = start_backend(
+        workdir, ollama_url, dict(extra, ANSWER_CACHE_ENABLED="0", EMBED_CACHE_ENABLED="0")
+    )
+    try:
+        live = wait_until(lambda: httpx.get(f"{base}/health", timeout=1).status_code == 200)
+        ready = []
+        poller = threading.Thread(target=lambda: ready.append(
+            wait_until(lambda: httpx.get(f"{base}/health", timeout=1).json()["ready"])
+        ))
+        poller.start()
+        time.sleep(arrival)
+
+        sent = time.perf_counter()
+        res = httpx.post(f"{base}/query", timeout=300, json={
+            "document_id": doc_id, "question": "¿qué dice la política de control?", "timings": True,
+        }).json()
+        answered = time.perf_counter()
+        poller.join()
+    finally:
+        stop(server)
+        stop(ollama)
+
+    return {
+        "live": live - start,
+        "ready": ready[0] - start,
+        "first_answer": answered - sent,
+        "cold_to_answer": answered - start,
+        "timings": res.get("timings") or {},
+    }
+
+
+def main(load_time: float, pages: int, arrival: float):
+    workdir = tempfile.mkdtemp()
+    doc_id = prepare(workdir, pages)
+
+    print(f"carga por modelo: {load_time:.1f}s | documento de {pages} páginas")
+    print(f"{'config':<12} {'llega a los':>11} {'vivo':>7} {'listo':>7} {'1ª respuesta':>13}"
+          f" {'desde arranque':>15}   desglose (ms)")
+    for name, extra in CONFIGS.items():
+        for delay in (0.0, arrival):
+            r = run(workdir, doc_id, extra, load_time, delay)
+            t = r["timings"]
+            detail = " ".join(f"{k} {t[k]:.0f}" for k in ("index_load", "embed", "llm_total") if k in t)
+            print(f"{name:<12} {delay:>10.1f}s {r['live']:>6.2f}s {r['ready']:>6.2f}s"
+                  f" {r['first_answer']:>12.2f}s {r['cold_to_answer']:>14.2f}s   {detail}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--load-time", type=float, default=3)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--arrival", type=float, default=10, help="segundos hasta la primera pregunta")
+    args = parser.parse_args()
+    main(args.load_time, args.pages, args.arrival)
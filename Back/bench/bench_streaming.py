@@ -0,0 +1,109 @@
+"""
+Memoria pico al indexar un documento grande: texto completo en memoria
+(extract_file + build_index) contra el pipeline en streaming
+(iter_extract + build_index_stream). Cada modo corre en un proceso
+aparte para que el RSS máximo de uno no contamine al otro.
+
+    python -m bench.bench_streaming --words 3000000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.index_format import IndexWriter, open_index, write_index
+from bench.fake_ollama import create_app, run_in_thread
+from bench.fixtures import make_pdf, make_txt
+
+
+class TempStore:
+    """Lo mínimo de DocumentStore que usa build_index, en un directorio temporal."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def begin_index(self, doc_id):
+        return IndexWriter(os.path.join(self.root, doc_id))
+
+    def commit_index(self, doc_id, writer):
+        writer.finish()
+
+    def save_index(self, doc_id, chunks, embeddings):
+        write_index(os.path.join(self.root, doc_id), chunks, embeddings)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_mode(mode: str, filename: str, path: str, root: str):
+    from app import embeddings, extraction
+    from app.rag import build_index, build_index_stream
+
+    base_url, server = run_in_thread(create_app(request_latency=0.0, item_latency=0.0))
+    embeddings.engine.base_url = base_url
+    embeddings.engine.cache = None
+    store = TempStore(root)
+
+    start = time.perf_counter()
+    if mode == "whole":
+        text = await extraction.extract_file(filename, path)
+        n = await build_index("doc", text, store)
+    else:
+        async def pieces():
+            async for text, _ in extraction.iter_extract(filename, path):
+                yield text
+        n = await build_index_stream("doc", pieces(), store)
+    elapsed = time.perf_counter() - start
+
+    assert len(open_index(os.path.join(root, "doc"))) == n
+    extraction.shutdown()
+    server.should_exit = True
+    print(f"{n} {elapsed:.3f} {peak_rss_mb():.1f}")
+
+
+def child(mode: str, filename: str, path: str) -> tuple[int, float, float]:
+    with tempfile.TemporaryDirectory() as root:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.bench_streaming", "--child", mode, filename, path, root],
+            check=True, capture_output=True, text=True,
+        ).stdout.splitlines()[-1].split()
+    return int(out[0]), float(out[1]), float(out[2])
+
+
+def main(words: int, pages: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        docs = []
+        if words:
+            path = os.path.join(tmp, "grande.txt")
+            make_txt(path, words)
+            docs.append(("grande.txt", path))
+        if pages:
+            path = os.path.join(tmp, "grande.pdf")
+            make_pdf(path, pages)
+            docs.append(("grande.pdf", path))
+
+        for filename, path in docs:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            print(f"{filename} ({size_mb:.1f} MB)")
+            for mode, label in (("whole", "texto completo"), ("stream", "streaming")):
+                n, elapsed, rss = child(mode, filename, path)
+                print(f"  {label:<16} {n:>7} chunks | {elapsed:6.2f}s | RSS pico {rss:7.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--words", type=int, default=3_000_000)
+    parser.add_argument("--pages", type=int, default=0)
+    parser.add_argument("--child", nargs=4, metavar=("MODE", "FILENAME", "PATH", "ROOT"))
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_mode(*args.child))
+    else:
+        main(args.words, args.pages)
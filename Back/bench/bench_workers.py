@@ -0,0 +1,153 @@
+"""
+Throughput de consultas con `uvicorn --workers N` y consistencia entre
+workers.
+
+Para cada N levanta el backend en un directorio de datos nuevo (con el
+Ollama falso en otro proceso), sube un documento grande y mide:
+  - consultas /query por segundo con C clientes concurrentes
+  - visibilidad: documentos recién subidos consultados enseguida, que
+    caen en workers distintos (cualquier 404 es un error)
+  - invalidación: tras un PUT, ningún worker sigue respondiendo con el
+    índice viejo
+
+El trabajo por consulta es sobre todo CPU (recorrer el índice), así que
+el throughput escala hasta la cantidad de núcleos libres.
+
+    python -m bench.bench_workers --workers 1 2 4 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.bench_reindex import make_pages, wait_job
+from bench.fake_ollama import free_port
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_process(args, cwd, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", *args], cwd=cwd, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_http(url: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"No respondió: {url}")
+
+
+async def load(base: str, doc_id: str, concurrency: int, duration: float) -> tuple[int, int]:
+    done = errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+        async def user(n):
+            nonlocal done, errors
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                res = await client.post("/query", json={
+                    "document_id": doc_id, "question": f"consulta {n}-{i} sobre la política", "top_k": 4,
+                })
+                if res.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+    return done, errors
+
+
+def check_consistency(client: httpx.Client, n_docs: int = 10) -> tuple[int, int]:
+    """(404 tras subir, respuestas viejas tras un PUT) sobre varias peticiones."""
+    missing = 0
+    for i in range(n_docs):
+        job = client.post("/documents", files={"file": (f"nuevo{i}.txt", (f"documento nuevo {i} " * 200).encode())}).json()
+        job, _ = wait_job(client, job)
+        for _ in range(8):
+            res = client.post("/query", json={"document_id": job["document_id"], "question": "nuevo"})
+            missing += res.status_code == 404
+
+    doc_id = job["document_id"]
+    for _ in range(8):   # el índice viejo queda en la caché de cada worker
+        client.post("/query", json={"document_id": doc_id, "question": "nuevo"})
+    job = client.put(f"/documents/{doc_id}", files={"file": ("nuevo.txt", ("texto reemplazado " * 200).encode())}).json()
+    wait_job(client, job)
+
+    stale = 0
+    for _ in range(16):
+        res = client.post("/query", json={"document_id": doc_id, "question": "reemplazado"}).json()
+        stale += any("nuevo" in s for s in res["sources"])
+    return missing, stale
+
+
+def run(n_workers: int, ollama_url: str, pages: int, concurrency: int, duration: float):
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        env = dict(os.environ, PYTHONPATH=BACK_DIR, OLLAMA_BASE_URL=ollama_url, INDEX_CACHE_PRELOAD="0")
+        server = start_process(
+            ["uvicorn", "app.main:app", "--port", str(port), "--workers", str(n_workers), "--log-level", "warning"],
+            workdir, env,
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            wait_http(f"{base}/health")
+            # sin keep-alive: cada petición abre conexión y puede caer en otro worker
+            client = httpx.Client(base_url=base, timeout=120, limits=httpx.Limits(max_keepalive_connections=0))
+            job = client.post("/documents", files={"file": ("politica.txt", "\n".join(make_pages(pages)).encode())}).json()
+            job, _ = wait_job(client, job)
+
+            asyncio.run(load(base, job["document_id"], concurrency, 2))   # calentamiento
+            done, errors = asyncio.run(load(base, job["document_id"], concurrency, duration))
+            missing, stale = check_consistency(client)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    return job["n_chunks"], done / duration, errors, missing, stale
+
+
+def main(workers: list[int], pages: int, concurrency: int, duration: float):
+    port = free_port()
+    env = dict(
+        os.environ,
+        FAKE_OLLAMA_REQUEST_LATENCY="0", FAKE_OLLAMA_ITEM_LATENCY="0",
+        FAKE_OLLAMA_TOKENS_PER_SEC="100000", FAKE_OLLAMA_PARALLEL="256", FAKE_OLLAMA_DIM="768",
+    )
+    ollama = start_process(["bench.fake_ollama", "--port", str(port)], BACK_DIR, env)
+    ollama_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_http(f"{ollama_url}/docs")
+        print(f"núcleos: {os.cpu_count()} | {concurrency} clientes | {duration:.0f}s por corrida")
+        print(f"{'workers':>7} {'chunks':>7} {'consultas/s':>12} {'errores':>8} {'404 tras subir':>15} {'viejas tras PUT':>16}")
+        for n in workers:
+            n_chunks, qps, errors, missing, stale = run(n, ollama_url, pages, concurrency, duration)
+            print(f"{n:>7} {n_chunks:>7} {qps:>12.1f} {errors:>8} {missing:>15} {stale:>16}")
+    finally:
+        ollama.terminate()
+        ollama.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pages", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    main(args.workers, args.pages, args.concurrency, args.duration)
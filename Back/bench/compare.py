@@ -0,0 +1,63 @@
+"""
+Compara dos resultados de bench/suite.py: cada métrica numérica del
+nuevo contra el viejo, con la variación en porcentaje. Las filas se
+emparejan por formato y tamaño (ingesta) o por concurrencia (consultas).
+
+    python -m bench.compare viejo.json nuevo.json [--threshold 10]
+
+Los cambios que empeoran más que --threshold por ciento se marcan con "!".
+"""
+import argparse
+import json
+
+# más alto es mejor; el resto (tiempos, lag, memoria) mejor más bajo
+HIGHER_IS_BETTER = {"chunks_per_s", "mb_per_s", "qps"}
+SKIP = {"words", "bytes", "concurrency", "n_chunks", "requests"}
+
+
+def _key(section: str, row: dict) -> tuple:
+    if section == "ingestion":
+        return row["format"], row["words"]
+    return (row["concurrency"],)
+
+
+def _rows(results: dict, section: str) -> dict:
+    return {_key(section, row): row for row in results.get(section, [])}
+
+
+def compare(old: dict, new: dict, threshold: float) -> int:
+    worse = 0
+    for section in ("ingestion", "query"):
+        old_rows, new_rows = _rows(old, section), _rows(new, section)
+        print(f"\n{section}:")
+        for key in sorted(old_rows.keys() & new_rows.keys()):
+            label = " ".join(str(k) for k in key)
+            for metric, before in old_rows[key].items():
+                after = new_rows[key].get(metric)
+                if metric in SKIP or not isinstance(before, (int, float)) or not isinstance(after, (int, float)):
+                    continue
+                change = (after - before) / before * 100 if before else 0.0
+                regression = -change if metric in HIGHER_IS_BETTER else change
+                flag = "!" if regression > threshold else " "
+                worse += flag == "!"
+                print(f" {flag} {label:<14} {metric:<14} {before:>10} -> {after:<10} ({change:+6.1f}%)")
+        for key in sorted(old_rows.keys() ^ new_rows.keys()):
+            print(f"   {' '.join(str(k) for k in key):<14} solo en {'el viejo' if key in old_rows else 'el nuevo'}")
+    return worse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10)
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old['meta'].get('commit')} ({old['meta'].get('time')}) -> "
+          f"{new['meta'].get('commit')} ({new['meta'].get('time')})")
+    worse = compare(old, new, args.threshold)
+    print(f"\n{worse} métricas empeoraron más de {args.threshold:g}%")
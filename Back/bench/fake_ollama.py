@@ -0,0 +1,180 @@
+"""
+Servidor falso de Ollama para benchmarks locales.
+
+Devuelve vectores deterministas (derivados del hash del texto) y simula
+latencia por petición y por texto, con un número limitado de peticiones
+procesándose a la vez (como OLLAMA_NUM_PARALLEL). Con LOAD_TIME, la
+primera petición a cada modelo espera además su carga, y un chat sin
+mensajes solo carga el modelo (como Ollama). Con PREFILL_PER_SEC el chat
+paga además el prefill del prompt, salvo el prefijo que comparta con uno
+de los últimos prompts (uno por slot, como la caché de Ollama); en ese
+caso prompt_eval_count cuenta solo lo evaluado.
+
+Uso directo:
+    python -m bench.fake_ollama --port 11435
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+REQUEST_LATENCY = float(os.getenv("FAKE_OLLAMA_REQUEST_LATENCY", "0.02"))
+ITEM_LATENCY = float(os.getenv("FAKE_OLLAMA_ITEM_LATENCY", "0.002"))
+PARALLEL = int(os.getenv("FAKE_OLLAMA_PARALLEL", "4"))
+DIM = int(os.getenv("FAKE_OLLAMA_DIM", "1024"))
+TOKENS_PER_SEC = float(os.getenv("FAKE_OLLAMA_TOKENS_PER_SEC", "50"))
+ANSWER_TOKENS = int(os.getenv("FAKE_OLLAMA_ANSWER_TOKENS", "40"))
+LOAD_TIME = float(os.getenv("FAKE_OLLAMA_LOAD_TIME", "0"))
+PREFILL_PER_SEC = float(os.getenv("FAKE_OLLAMA_PREFILL_PER_SEC", "0"))
+
+
+def fake_vector(text: str, dim: int = DIM) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype("float32").tolist()
+
+
+def create_app(
+    request_latency: float = REQUEST_LATENCY,
+    item_latency: float = ITEM_LATENCY,
+    parallel: int = PARALLEL,
+    dim: int = DIM,
+    tokens_per_sec: float = TOKENS_PER_SEC,
+    answer_tokens: int = ANSWER_TOKENS,
+    load_time: float = LOAD_TIME,
+    prefill_per_sec: float = PREFILL_PER_SEC,
+) -> FastAPI:
+    app = FastAPI(title="Fake Ollama")
+    app.state.requests = 0
+    app.state.chat_cancelled = 0
+    app.state.chats = 0
+    app.state.loaded = {}      # modelo -> keep_alive con que se cargó
+    app.state.prompt_cache = []  # últimos prompts evaluados (palabras), uno por slot
+    slots = asyncio.Semaphore(parallel)
+    loading = asyncio.Lock()   # un modelo a la vez, como Ollama
+
+    async def load(body: dict):
+        model = body.get("model")
+        async with loading:
+            if model not in app.state.loaded:
+                await asyncio.sleep(load_time)
+            app.state.loaded[model] = body.get("keep_alive")
+
+    async def work(n_items: int):
+        app.state.requests += 1
+        async with slots:
+            await asyncio.sleep(request_latency + item_latency * n_items)
+
+    @app.post("/api/embeddings")
+    async def embeddings(req: Request):
+        body = await req.json()
+        await load(body)
+        await work(1)
+        return {"embedding": fake_vector(body.get("prompt", ""), dim)}
+
+    @app.post("/api/embed")
+    async def embed(req: Request):
+        body = await req.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await load(body)
+        await work(len(inputs))
+        return {"model": body.get("model"), "embeddings": [fake_vector(t, dim) for t in inputs]}
+
+    @app.post("/api/chat")
+    async def chat(req: Request):
+        body = await req.json()
+        await load(body)
+        if not body.get("messages"):
+            return {"model": body.get("model"), "message": {"role": "assistant", "content": ""},
+                    "done": True, "done_reason": "load"}
+        app.state.chats += 1
+        prompt = []
+        for m in body.get("messages", []):
+            prompt += [f"<{m.get('role')}>"] + m.get("content", "").split()
+        prompt_tokens = len(prompt)
+        tokens = [f"tok{i} " for i in range(answer_tokens)]
+        await work(0)
+
+        if prefill_per_sec > 0:
+            cache = app.state.prompt_cache
+            best, shared = None, 0
+            for i, cached in enumerate(cache):
+                n = 0
+                for a, b in zip(cached, prompt):
+                    if a != b:
+                        break
+                    n += 1
+                if n > shared:
+                    best, shared = i, n
+            if best is not None:
+                cache.pop(best)
+            # la respuesta también queda evaluada en el slot
+            cache.append(prompt + ["<assistant>"] + "".join(tokens).split())
+            del cache[:-parallel]
+            prompt_tokens -= min(shared, prompt_tokens - 1)   # siempre evalúa al menos uno
+            await asyncio.sleep(prompt_tokens / prefill_per_sec)
+
+        if not body.get("stream", True):
+            await asyncio.sleep(answer_tokens / tokens_per_sec)
+            return {
+                "model": body.get("model"),
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": answer_tokens,
+            }
+
+        async def lines():
+            try:
+                for tok in tokens:
+                    await asyncio.sleep(1 / tokens_per_sec)
+                    yield json.dumps({"message": {"role": "assistant", "content": tok}, "done": False}) + "\n"
+                yield json.dumps({
+                    "message": {"role": "assistant", "content": ""},
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": answer_tokens,
+                }) + "\n"
+            except asyncio.CancelledError:
+                app.state.chat_cancelled += 1
+                raise
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_in_thread(app: FastAPI, port: int | None = None) -> tuple[str, uvicorn.Server]:
+    """Levanta `app` en un hilo aparte y devuelve (base_url, server)."""
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    return f"http://127.0.0.1:{port}", server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11435)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,147 @@
+"""
+Documentos sintéticos para benchmarks. PDF, DOCX y ODT se escriben a mano
+(el PDF en texto plano con Helvetica; DOCX y ODT con el XML mínimo dentro
+del zip) para no depender de ninguna librería de generación.
+"""
+import os
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "documento sistema usuario proceso manual política calidad servicio cliente "
+    "registro informe sección artículo norma control acceso seguridad datos red "
+    "equipo soporte versión módulo configuración referencia pieza modelo revisión"
+).split()
+
+
+def sentences(n_words: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    return [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, n_words, 12)]
+
+
+def _pdf_escape(line: str) -> str:
+    line = line.encode("latin-1", errors="replace").decode("latin-1")
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path: str, n_pages: int, lines_per_page: int = 45, seed: int = 0):
+    lines = sentences(n_pages * lines_per_page * 12, seed)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")
+    pages = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    kids = []
+    for p in range(n_pages):
+        page_lines = lines[p * lines_per_page:(p + 1) * lines_per_page]
+        text = "\n".join(f"({_pdf_escape(l)}) Tj T*" for l in page_lines)
+        stream = f"BT /F1 9 Tf 40 800 Td 11 TL\n{text}\nET".encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages, font, content)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages
+    objects[pages - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for i, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (i, body))
+
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for off in offsets:
+            f.write(b"%010d 00000 n \n" % off)
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1, catalog, xref
+        ))
+
+
+def make_txt(path: str, n_words: int, seed: int = 0):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(sentences(n_words, seed)))
+
+
+def _paragraphs(n_words: int, seed: int, per_paragraph: int = 8) -> list[str]:
+    lines = sentences(n_words, seed)
+    return [" ".join(lines[i:i + per_paragraph]) for i in range(0, len(lines), per_paragraph)]
+
+
+def make_docx(path: str, n_words: int, seed: int = 0):
+    body = "".join(
+        f"<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>" for p in _paragraphs(n_words, seed)
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType='
+            '"application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>"
+        ))
+        z.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="word/document.xml" Type='
+            '"http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            "</Relationships>"
+        ))
+        z.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>"
+        ))
+
+
+def make_odt(path: str, n_words: int, seed: int = 0):
+    body = "".join(f"<text:p>{escape(p)}</text:p>" for p in _paragraphs(n_words, seed))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        # el mimetype va primero y sin comprimir
+        z.writestr("mimetype", "application/vnd.oasis.opendocument.text", zipfile.ZIP_STORED)
+        z.writestr("META-INF/manifest.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0"'
+            ' manifest:version="1.2">'
+            '<manifest:file-entry manifest:full-path="/"'
+            ' manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            "</manifest:manifest>"
+        ))
+        z.writestr("content.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+            ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2">'
+            f"<office:body><office:text>{body}</office:text></office:body></office:document-content>"
+        ))
+
+
+# palabras por página del PDF generado (45 líneas de 12 palabras)
+PDF_WORDS_PER_PAGE = 45 * 12
+
+
+def make_document(path: str, n_words: int, seed: int = 0):
+    """Documento de unas `n_words` palabras en el formato que indica la extensión."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        make_pdf(path, max(1, n_words // PDF_WORDS_PER_PAGE), seed=seed)
+    elif ext == ".docx":
+        make_docx(path, n_words, seed)
+    elif ext == ".odt":
+        make_odt(path, n_words, seed)
+    else:
+        make_txt(path, n_words, seed)
@@ -0,0 +1,290 @@
+"""
+Suite de benchmarks de punta a punta, con resultados en JSON para
+comparar corridas (ver bench/compare.py).
+
+El backend corre en este proceso (en un hilo con su propio event loop,
+donde se mide el lag) y el Ollama falso en otro proceso, con latencias y
+velocidad de tokens configurables. Escenarios:
+  ingestion -> TXT / PDF / DOCX / ODT de tamaño creciente por la API:
+               segundos, chunks/s, MB/s, lag del loop y RSS pico
+  query     -> /query con N clientes concurrentes durante D segundos:
+               consultas/s, latencia p50/p95/p99, errores, lag y RSS
+
+Las cachés de embeddings y de respuestas se desactivan para medir el
+pipeline completo en cada petición.
+
+    python -m bench.suite --out results.json
+    python -m bench.suite --quick --out results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+
+from bench.bench_reindex import wait_job
+from bench.bench_workers import start_process, wait_http
+from bench.fake_ollama import free_port
+from bench.fixtures import make_document
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORMATS = ("txt", "pdf", "docx", "odt")
+SIZES = (5_000, 50_000, 200_000)
+QUICK_SIZES = (2_000, 20_000)
+CONCURRENCY = (1, 8, 32)
+TICK = 0.01
+
+
+# ==========================================================
+#  Medición: lag del event loop y memoria
+# ==========================================================
+
+class LagProbe:
+    """Un ticker en el loop del backend: cuánto tarde se despierta cada TICK."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.lags = []
+        self._running = False
+        self._future = None
+
+    async def _tick(self):
+        while self._running:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            self.lags.append((time.perf_counter() - start - TICK) * 1000)
+
+    def __enter__(self):
+        self.lags, self._running = [], True
+        self._future = asyncio.run_coroutine_threadsafe(self._tick(), self.loop)
+        return self
+
+    def __exit__(self, *exc):
+        self._running = False
+        self._future.result(timeout=5)
+
+    def summary(self) -> dict:
+        lags = self.lags or [0.0]
+        return {"lag_p99_ms": round(float(np.percentile(lags, 99)), 2), "lag_max_ms": round(max(lags), 2)}
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class RssSampler:
+    """RSS máximo de este proceso durante el bloque (muestreo cada 50 ms)."""
+
+    def __enter__(self):
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(0.05):
+            self.peak = max(self.peak, rss_mb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def serve_in_thread(app) -> tuple[str, asyncio.AbstractEventLoop]:
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", loop
+
+
+# ==========================================================
+#  Escenarios
+# ==========================================================
+
+def run_ingestion(client: httpx.Client, loop, workdir: str, sizes) -> tuple[list[dict], str]:
+    rows, biggest = [], (0, None)
+    for fmt in FORMATS:
+        for n_words in sizes:
+            path = os.path.join(workdir, f"fixture_{n_words}.{fmt}")
+            make_document(path, n_words, seed=n_words)
+            size = os.path.getsize(path)
+
+            with LagProbe(loop) as lag, RssSampler() as rss, open(path, "rb") as f:
+                start = time.perf_counter()
+                job = client.post("/documents", files={"file": (os.path.basename(path), f)}).json()
+                job, _ = wait_job(client, job)
+                elapsed = time.perf_counter() - start
+            os.remove(path)
+
+            row = {
+                "format": fmt, "words": n_words, "bytes": size, "stage": job["stage"],
+                "n_chunks": job.get("n_chunks", 0), "seconds": round(elapsed, 3),
+                "chunks_per_s": round(job.get("n_chunks", 0) / elapsed, 1),
+                "mb_per_s": round(size / 1e6 / elapsed, 3),
+                "peak_rss_mb": round(rss.peak, 1), **lag.summary(),
+            }
+            if job["stage"] != "done":
+                row["error"] = job.get("error")
+            rows.append(row)
+            print(f"  ingest {fmt:<4} {n_words:>7} palabras: {row['seconds']:7.2f}s"
+                  f" | {row['chunks_per_s']:7.1f} chunks/s | lag p99 {row['lag_p99_ms']:6.1f}ms"
+                  f" | RSS {row['peak_rss_mb']:6.0f}MB {row.get('error') or ''}")
+
+            if job["stage"] == "done" and fmt == "txt" and n_words > biggest[0]:
+                biggest = (n_words, job["document_id"])
+    return rows, biggest[1]
+
+
+async def query_load(base: str, doc_id: str, concurrency: int, duration: float) -> dict:
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as client:
+        async def user(n):
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                start = time.perf_counter()
+                res = await client.post("/query", json={
+                    "document_id": doc_id, "question": f"consulta {n}-{i} sobre la política de control",
+                })
+                if res.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies or [0.0]) * 1000
+    return {
+        "concurrency": concurrency, "seconds": round(elapsed, 2), "requests": sum(statuses.values()),
+        "qps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "errors": {str(k): v for k, v in statuses.items() if k != 200},
+    }
+
+
+def run_queries(base: str, loop, doc_id: str, levels, duration: float) -> list[dict]:
+    rows = []
+    asyncio.run(query_load(base, doc_id, 2, 1))    # calentamiento
+    for concurrency in levels:
+        with LagProbe(loop) as lag, RssSampler() as rss:
+            row = asyncio.run(query_load(base, doc_id, concurrency, duration))
+        row.update(peak_rss_mb=round(rss.peak, 1), **lag.summary())
+        rows.append(row)
+        print(f"  query c={concurrency:<3} {row['qps']:7.2f} q/s | p50 {row['p50_ms']:7.1f}ms"
+              f" p95 {row['p95_ms']:7.1f}ms p99 {row['p99_ms']:7.1f}ms | lag p99 {row['lag_p99_ms']:6.1f}ms"
+              f" | errores {row['errors'] or 0}")
+    return rows
+
+
+# ==========================================================
+#  Corrida
+# ==========================================================
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACK_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(args):
+    fake_env = dict(
+        os.environ,
+        FAKE_OLLAMA_REQUEST_LATENCY=str(args.request_latency), FAKE_OLLAMA_ITEM_LATENCY=str(args.item_latency),
+        FAKE_OLLAMA_TOKENS_PER_SEC=str(args.tokens_per_sec), FAKE_OLLAMA_ANSWER_TOKENS=str(args.answer_tokens),
+        FAKE_OLLAMA_PARALLEL=str(args.parallel), FAKE_OLLAMA_DIM=str(args.dim),
+    )
+    port = free_port()
+    ollama = start_process(["bench.fake_ollama", "--port", str(port)], BACK_DIR, fake_env)
+    out = os.path.abspath(args.out)
+
+    try:
+        wait_http(f"http://127.0.0.1:{port}/docs")
+        os.environ.update(
+            OLLAMA_BASE_URL=f"http://127.0.0.1:{port}", EMBED_CACHE_ENABLED="0",
+            ANSWER_CACHE_ENABLED="0", LOG_LEVEL="warning",
+        )
+        workdir = tempfile.mkdtemp()
+        os.chdir(workdir)
+        from app.main import app   # después del chdir: data/ queda en el temporal
+        from app import config
+
+        base, loop = serve_in_thread(app)
+        client = httpx.Client(base_url=base, timeout=600)
+
+        results = {
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+                "python": platform.python_version(), "platform": platform.platform(),
+                "cpus": os.cpu_count(), "quick": args.quick,
+                "fake_ollama": {
+                    "request_latency": args.request_latency, "item_latency": args.item_latency,
+                    "tokens_per_sec": args.tokens_per_sec, "answer_tokens": args.answer_tokens,
+                    "parallel": args.parallel, "dim": args.dim,
+                },
+                "config": {k: getattr(config, k) for k in (
+                    "CHUNKER", "RETRIEVAL_MODE", "EMBED_STORAGE", "EMBED_BATCH_SIZE", "EMBED_CONCURRENCY",
+                    "OLLAMA_CONCURRENCY", "INGEST_WORKERS", "EXTRACT_WORKERS", "LLM_NUM_CTX",
+                )},
+            },
+        }
+
+        print("ingesta:")
+        results["ingestion"], doc_id = run_ingestion(
+            client, loop, workdir, QUICK_SIZES if args.quick else SIZES
+        )
+        print("consultas:")
+        results["query"] = run_queries(
+            base, loop, doc_id, CONCURRENCY, 3 if args.quick else args.duration
+        )
+        results["meta"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        results["meta"]["peak_rss_children_mb"] = round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+        )
+    finally:
+        ollama.terminate()
+        ollama.wait(timeout=30)
+
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"resultados: {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--quick", action="store_true", help="documentos chicos y 3 s por nivel de carga")
+    parser.add_argument("--duration", type=float, default=10, help="segundos por nivel de concurrencia")
+    parser.add_argument("--request-latency", type=float, default=0.02)
+    parser.add_argument("--item-latency", type=float, default=0.002)
+    parser.add_argument("--tokens-per-sec", type=float, default=200)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=1024)
+    main(parser.parse_args())
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_ollama import create_app, run_in_thread
+
+# app.config lee el entorno y crea data/ (relativo al cwd) al importarse:
+# todo esto tiene que pasar antes de que un test importe app
+OLLAMA_URL, _ = run_in_thread(create_app(request_latency=0, item_latency=0, tokens_per_sec=2000, dim=64))
+os.chdir(tempfile.mkdtemp(prefix="rag-tests-"))
+os.environ.update(
+    OLLAMA_BASE_URL=OLLAMA_URL,
+    EXTRACT_WORKERS="1",
+    WARMUP_ENABLED="0",
+    INDEX_CACHE_PRELOAD="0",
+    ANSWER_CACHE_ENABLED="0",
+    LOG_LEVEL="warning",
+)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
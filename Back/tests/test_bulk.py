@@ -0,0 +1,57 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from app import bulk
+from app.config import UPLOADS_DIR
+from app.ingest import PayloadTooLargeError
+
+
+def make_zip(path, files: dict):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+
+
+def test_declared_size_is_checked_before_extracting(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk, "BULK_UNPACKED_MAX_BYTES", 10_000)
+    path = tmp_path / "lote.zip"
+    # se comprime a casi nada; descomprimido pasa del tope
+    make_zip(path, {"a.txt": b"a" * 6000, "b.txt": b"b" * 6000, "c.bin": b"x" * 50_000})
+
+    before = set(os.listdir(UPLOADS_DIR))
+    with pytest.raises(PayloadTooLargeError):
+        bulk.unpack_archive(str(path))
+    assert set(os.listdir(UPLOADS_DIR)) == before
+
+
+def test_unsupported_members_do_not_count(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk, "BULK_UNPACKED_MAX_BYTES", 10_000)
+    path = tmp_path / "lote.zip"
+    make_zip(path, {"a.txt": b"a" * 6000, "c.bin": b"x" * 50_000})
+
+    items = bulk.unpack_archive(str(path))
+    assert "error" in items[1] and os.path.getsize(items[0]["path"]) == 6000
+    os.remove(items[0]["path"])
+
+
+def test_written_bytes_are_checked_too(tmp_path):
+    # el tamaño declarado puede mentir: lo escrito también cuenta
+    path = tmp_path / "lote.zip"
+    make_zip(path, {"a.txt": b"a" * 6000})
+    target = str(tmp_path / "a.txt")
+    with zipfile.ZipFile(path) as z, pytest.raises(PayloadTooLargeError):
+        bulk._extract_member(z, z.infolist()[0], target, 5000)
+    assert not os.path.exists(target)
+
+
+def test_bulk_endpoint_answers_413(client, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_UNPACKED_MAX_BYTES", 10_000)
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("a.txt", b"a" * 20_000)
+
+    res = client.post("/documents/bulk", files={"archive": ("lote.zip", data.getvalue())})
+    assert res.status_code == 413
@@ -0,0 +1,47 @@
+import numpy as np
+
+from app import embedding_cache
+from app.embedding_cache import EmbeddingCache
+
+
+def updates(cache: EmbeddingCache) -> list:
+    statements = []
+    cache._db.set_trace_callback(lambda sql: statements.append(sql) if sql.startswith("UPDATE") else None)
+    return statements
+
+
+def last_used(cache: EmbeddingCache, text: str) -> float:
+    return cache._db.execute("SELECT last_used FROM embeddings WHERE key = ?", (cache.key(text),)).fetchone()[0]
+
+
+def test_hits_do_not_write_on_every_lookup(monkeypatch, tmp_path):
+    monkeypatch.setattr(embedding_cache, "TOUCH_FLUSH_ITEMS", 40)
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), "modelo", 1 << 30, memory_items=10)
+    texts = [f"texto {i}" for i in range(40)]
+    cache.put_many(texts, np.ones((40, 4), dtype="float32"))
+    before = last_used(cache, "texto 0")
+
+    statements = updates(cache)
+    cache._touched_at = float("inf")    # sin volcado por tiempo
+    for _ in range(20):
+        assert len(cache.get_many(texts[:20])) == 20
+    assert statements == []
+    assert last_used(cache, "texto 0") == before
+
+    # al juntar TOUCH_FLUSH_ITEMS claves se vuelcan todas juntas
+    cache.get_many(texts[20:])
+    assert len(statements) == 40 and not cache._touched   # una fila por clave, en un solo executemany
+    assert last_used(cache, "texto 0") > before
+
+
+def test_pending_uses_go_out_with_the_next_write(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), "modelo", 1 << 30)
+    cache.put_many(["viejo"], np.ones((1, 4), dtype="float32"))
+    before = last_used(cache, "viejo")
+
+    cache._touched_at = float("inf")
+    cache.get_many(["viejo"])
+    assert last_used(cache, "viejo") == before
+
+    cache.put_many(["nuevo"], np.ones((1, 4), dtype="float32"))
+    assert last_used(cache, "viejo") > before
@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app import http_client
+from app.embeddings import EmbeddingEngine
+from bench.fake_ollama import fake_vector, run_in_thread
+
+
+def embed(engine: EmbeddingEngine, texts: list[str]) -> np.ndarray:
+    async def main():
+        try:
+            return await engine.embed(texts)
+        finally:
+            await http_client.aclose()   # el cliente es de este loop
+
+    return asyncio.run(main())
+
+
+def test_batches_keep_order_and_zero_empty_texts():
+    engine = EmbeddingEngine(base_url=os.environ["OLLAMA_BASE_URL"], batch_size=3, concurrency=2)
+    texts = ["uno", "", "dos", "uno", "tres", "cuatro  ", "cinco", "seis"]
+    out = embed(engine, texts)
+
+    assert out.shape == (len(texts), 64)
+    assert not out[1].any()
+    for i, text in enumerate(texts):
+        if text:
+            np.testing.assert_allclose(out[i], fake_vector(text.strip(), 64), rtol=1e-6)
+
+
+def flaky_ollama(failures: int, status: int):
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/api/embed")
+    async def embed(req: Request):
+        app.state.calls += 1
+        body = await req.json()
+        if app.state.calls <= failures:
+            return JSONResponse({"error": "model 'x' not found" if status < 500 else "busy"}, status_code=status)
+        return {"embeddings": [[1.0, 0.0] for _ in body["input"]]}
+
+    return app
+
+
+def test_transient_errors_are_retried():
+    app = flaky_ollama(failures=2, status=503)
+    base, server = run_in_thread(app)
+    try:
+        engine = EmbeddingEngine(base_url=base, max_retries=3, backoff=0.001)
+        assert embed(engine, ["hola"]).tolist() == [[1.0, 0.0]]
+        assert app.state.calls == 3
+    finally:
+        server.should_exit = True
+
+
+def test_client_errors_are_not_retried():
+    app = flaky_ollama(failures=1, status=404)
+    base, server = run_in_thread(app)
+    try:
+        engine = EmbeddingEngine(base_url=base, max_retries=3, backoff=0.001)
+        with pytest.raises(RuntimeError, match="not found"):
+            embed(engine, ["hola"])
+        assert app.state.calls == 1 and not engine.legacy
+    finally:
+        server.should_exit = True
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from app import extraction
+from app.jobs import JobQueue
+
+
+def fake_extract(filename, path):
+    # corre en el pool de procesos: el "slow" no termina antes del timeout
+    if "slow" in filename:
+        time.sleep(60)
+    return f"texto de {filename}"
+
+
+def test_timeout_only_fails_its_own_document(monkeypatch, tmp_path):
+    monkeypatch.setattr(extraction, "extract_text_file", fake_extract)
+
+    async def extract(job, queue):
+        timeout = 1 if "slow" in job["filename"] else 30
+        job["text"] = await extraction.extract_file(job["filename"], job["path"], timeout)
+
+    async def main():
+        queue = JobQueue(str(tmp_path / "jobs"), extract, workers=2)
+        queue.start()
+        try:
+            # con un solo proceso, el normal queda en cola detrás del lento
+            slow = queue.submit(document_id="a", filename="slow.docx", path="a")
+            normal = queue.submit(document_id="b", filename="normal.docx", path="b")
+            while slow["stage"] not in ("done", "error") or normal["stage"] not in ("done", "error"):
+                await asyncio.sleep(0.05)
+            workers_alive = all(not t.done() for t in queue._tasks)
+
+            after = queue.submit(document_id="c", filename="after.docx", path="c")
+            while after["stage"] not in ("done", "error"):
+                await asyncio.sleep(0.05)
+            return slow, normal, after, workers_alive
+        finally:
+            await queue.stop()
+            extraction.shutdown()
+
+    slow, normal, after, workers_alive = asyncio.run(main())
+    assert slow["stage"] == "error" and "límite" in slow["error"]
+    assert normal["stage"] == "done" and normal["text"] == "texto de normal.docx"
+    assert after["stage"] == "done"
+    assert workers_alive
+
+
+def test_cancelled_future_is_a_job_error(tmp_path):
+    async def handler(job, queue):
+        # un futuro que cancela otro (como un pool que se cierra)
+        fut = asyncio.get_running_loop().create_future()
+        asyncio.get_running_loop().call_soon(fut.cancel)
+        await fut
+
+    async def main():
+        queue = JobQueue(str(tmp_path / "jobs"), handler, workers=1)
+        queue.start()
+        try:
+            jobs = [queue.submit(document_id=str(i), filename="x.txt", path="x") for i in range(2)]
+            while any(j["stage"] not in ("done", "error") for j in jobs):
+                await asyncio.sleep(0.01)
+            return jobs, all(not t.done() for t in queue._tasks)
+        finally:
+            await queue.stop()
+
+    jobs, workers_alive = asyncio.run(main())
+    assert [j["stage"] for j in jobs] == ["error", "error"]
+    assert workers_alive
@@ -0,0 +1,25 @@
+from app.index_cache import IndexCache
+
+
+class Growing:
+    """Como un DocumentIndex cuyo índice léxico se arma al primer uso."""
+
+    def __init__(self, nbytes: int):
+        self.nbytes = nbytes
+
+
+def test_bytes_do_not_drift_when_entries_grow():
+    cache = IndexCache(1000)
+    a, b = Growing(400), Growing(400)
+    cache.put("a", a)
+    cache.put("b", b)
+
+    a.nbytes = b.nbytes = 900   # lexical / hashes armados después de entrar
+    cache.invalidate("a")
+    assert cache.stats()["bytes"] == 400
+
+    cache.put("c", Growing(500))
+    assert cache.stats()["bytes"] == 900 and "b" in cache
+
+    cache.put("d", Growing(300))    # pasa del tope: sale "b" con lo que se contó
+    assert "b" not in cache and cache.stats()["bytes"] == 800
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from app import index_format
+from app.index_format import normalize_rows, open_index, read_manifest, write_index
+
+
+def write(path: str, word: str):
+    chunks = [f"{word} {i}" for i in range(5)]
+    embeddings = normalize_rows(np.random.default_rng(len(word)).standard_normal((5, 8)))
+    return write_index(path, chunks, embeddings)
+
+
+def test_previous_generation_survives_one_commit(tmp_path):
+    path = str(tmp_path / "doc")
+    first = write(path, "uno")
+    second = write(path, "dos")
+
+    # un lector que leyó el manifest viejo todavía encuentra sus archivos
+    for name in first["files"].values():
+        assert os.path.exists(os.path.join(path, name))
+    assert open_index(path).chunk(0) == "dos 0"
+
+    write(path, "tres")
+    assert not any(os.path.exists(os.path.join(path, n)) for n in first["files"].values())
+    assert all(os.path.exists(os.path.join(path, n)) for n in second["files"].values())
+
+
+def test_open_index_rereads_a_stale_manifest(monkeypatch, tmp_path):
+    path = str(tmp_path / "doc")
+    stale = write(path, "uno")
+    write(path, "dos")
+    write(path, "tres")     # los archivos de "uno" ya no están
+
+    calls = []
+
+    def racing_read(index_dir):
+        calls.append(index_dir)
+        return stale if len(calls) == 1 else read_manifest(index_dir)
+
+    monkeypatch.setattr(index_format, "read_manifest", racing_read)
+    assert open_index(path).chunk(0) == "tres 0"
+    assert len(calls) == 2
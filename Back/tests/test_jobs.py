@@ -0,0 +1,43 @@
+import json
+import os
+import time
+
+from app.jobs import JobQueue
+
+
+def finished(client, job: dict) -> dict:
+    while job["stage"] not in ("done", "error"):
+        time.sleep(0.02)
+        job = client.get(f"/jobs/{job['id']}").json()
+    return job
+
+
+def test_upload_is_removed_when_job_ends(client):
+    from app.main import jobs
+
+    ok = finished(client, client.post("/documents", files={"file": ("bien.txt", b"texto " * 200)}).json())
+    broken = finished(client, client.post("/documents", files={"file": ("roto.pdf", b"no es un pdf")}).json())
+
+    assert (ok["stage"], broken["stage"]) == ("done", "error")
+    for job in (ok, broken):
+        path = jobs.get(job["id"])["path"]
+        assert not os.path.exists(path)
+
+
+def write_job(jobs_dir: str, job_id: str, stage: str, age: float):
+    path = os.path.join(jobs_dir, f"{job_id}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"id": job_id, "stage": stage}, f)
+    then = time.time() - age
+    os.utime(path, (then, then))
+
+
+def test_prune_keeps_recent_and_unfinished(tmp_path):
+    queue = JobQueue(str(tmp_path), None, retention=3600)
+    write_job(queue.jobs_dir, "viejo-ok", "done", 7200)
+    write_job(queue.jobs_dir, "viejo-error", "error", 7200)
+    write_job(queue.jobs_dir, "viejo-sin-terminar", "embedding", 7200)
+    write_job(queue.jobs_dir, "reciente", "done", 60)
+
+    assert queue.prune() == 2
+    assert sorted(os.listdir(queue.jobs_dir)) == ["reciente.json", "viejo-sin-terminar.json"]
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import Scheduler
+
+
+async def started(coro):
+    task = asyncio.ensure_future(coro)
+    await asyncio.sleep(0)
+    return task
+
+
+def test_cancelled_waiter_already_skipped_by_release():
+    async def main():
+        scheduler = Scheduler(1, {})
+        await scheduler.acquire("interactive")
+        waiter = await started(scheduler.acquire("interactive"))
+
+        # cancelación y release en el mismo ciclo: release() saca el futuro
+        # cancelado antes de que la tarea corra su except
+        waiter.cancel()
+        scheduler.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert scheduler.active == 0 and scheduler.waiting() == 0
+        await asyncio.wait_for(scheduler.acquire("batch"), 1)
+        assert scheduler.active == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_after_grant_passes_the_slot_on():
+    async def main():
+        scheduler = Scheduler(1, {})
+        await scheduler.acquire("interactive")
+        first = await started(scheduler.acquire("interactive"))
+        second = await started(scheduler.acquire("ingest"))
+
+        scheduler.release()     # el cupo es de `first`...
+        first.cancel()          # ...que se cancela antes de usarlo
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        await asyncio.wait_for(second, 1)
+        assert scheduler.active == 1 and scheduler.waiting() == 0
+
+    asyncio.run(main())
+
+
+def test_waiter_cancelled_while_queued():
+    async def main():
+        scheduler = Scheduler(1, {})
+        await scheduler.acquire("interactive")
+        waiter = await started(scheduler.acquire("batch"))
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert scheduler.waiting() == 0
+        scheduler.release()
+        assert scheduler.active == 0
+
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+import time
+
+from app.sessions import SessionStore
+
+
+def wait_job(client, job: dict) -> dict:
+    while job["stage"] not in ("done", "error"):
+        time.sleep(0.02)
+        job = client.get(f"/jobs/{job['id']}").json()
+    assert job["stage"] == "done", job
+    return job
+
+
+def upload(client, text: str, doc_id: str = None) -> str:
+    files = {"file": ("doc.txt", text.encode())}
+    if doc_id is None:
+        job = client.post("/documents", files=files).json()
+    else:
+        job = client.put(f"/documents/{doc_id}", files=files).json()
+    return wait_job(client, job)["document_id"]
+
+
+def ask(client, doc_id: str, session_id: str, question: str) -> dict:
+    res = client.post("/query", json={"document_id": doc_id, "question": question, "session_id": session_id})
+    assert res.status_code == 200, res.text
+    return res.json()["session"]
+
+
+def test_turns_accumulate(client):
+    doc_id = upload(client, "manzana " * 300 + "pera " * 300)
+    assert ask(client, doc_id, "acumula", "manzana")["turn"] == 1
+    turn = ask(client, doc_id, "acumula", "manzana")
+    assert turn["turn"] == 2 and turn["history_turns"] == 1 and turn["prefix_tokens"] > 0
+
+    status = client.get("/sessions/acumula").json()
+    assert [t["question"] for t in status["history"]] == ["manzana", "manzana"]
+
+
+def test_reindex_resets_session(client):
+    doc_id = upload(client, "texto viejo " * 400)
+    ask(client, doc_id, "reindex", "viejo")
+    ask(client, doc_id, "reindex", "viejo")
+    old_context = client.get("/sessions/reindex").json()["context_tokens"]
+    assert old_context > 0
+
+    upload(client, "contenido nuevo distinto " * 50, doc_id)
+    turn = ask(client, doc_id, "reindex", "nuevo")
+    assert turn["turn"] == 1 and turn["history_turns"] == 0
+
+    status = client.get("/sessions/reindex").json()
+    assert [t["question"] for t in status["history"]] == ["nuevo"]
+    assert status["context_tokens"] < old_context
+
+
+def test_session_of_other_document_conflicts(client):
+    a = upload(client, "uno " * 100)
+    b = upload(client, "dos " * 100)
+    ask(client, a, "conflicto", "uno")
+    res = client.post("/query", json={"document_id": b, "question": "dos", "session_id": "conflicto"})
+    assert res.status_code == 409
+
+
+def test_sessions_are_shared_between_workers(tmp_path):
+    # dos procesos = dos SessionStore sobre el mismo archivo
+    path = str(tmp_path / "sessions.sqlite")
+    first, second = SessionStore(path, 10, 3600), SessionStore(path, 10, 3600)
+
+    session = first.get("s", "doc", 1.0)
+    session.commit({"system": {"context": "ctx", "positions": [0]}, "dropped": 0,
+                    "turn": {"question": "q1", "prompt": "Pregunta: q1", "positions": []}}, "a1", 10)
+    first.save(session)
+
+    other = second.get("s", "doc", 1.0)
+    assert other.n_turns == 1 and other.context == "ctx"
+    other.commit({"system": None, "dropped": 0,
+                  "turn": {"question": "q2", "prompt": "Pregunta: q2", "positions": [3]}}, "a2", 10)
+    second.save(other)
+
+    # el primero ve el turno que guardó el otro
+    again = first.get("s", "doc", 1.0)
+    assert [t["question"] for t in again.turns] == ["q1", "q2"]
+
+
+def test_session_limits(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.sqlite"), 2, 3600)
+    for i in range(3):
+        store.get(f"s{i}", "doc", None)
+    assert len(store) == 2 and store.find("s0") is None and store.evictions == 1
+
+    expiring = SessionStore(str(tmp_path / "other.sqlite"), 10, 0)
+    expiring.get("s", "doc", None)
+    assert expiring.find("s") is None
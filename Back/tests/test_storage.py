@@ -0,0 +1,48 @@
+import time
+
+
+def ingest(client, text: str, doc_id: str = None) -> str:
+    files = {"file": ("doc.txt", text.encode())}
+    job = (client.put(f"/documents/{doc_id}", files=files) if doc_id else client.post("/documents", files=files)).json()
+    while job["stage"] not in ("done", "error"):
+        time.sleep(0.02)
+        job = client.get(f"/jobs/{job['id']}").json()
+    assert job["stage"] == "done", job
+    return job["document_id"]
+
+
+def test_usage_counts_questions_not_index_loads(client):
+    from app.main import store
+
+    doc_id = ingest(client, "uva " * 300)
+    ingest(client, "uva pasa " * 300, doc_id)     # reindexar carga el índice anterior
+    assert doc_id not in store.usage
+
+    assert client.post("/query", json={"document_id": doc_id, "question": "uva"}).status_code == 200
+    assert store.usage[doc_id]["queries"] == 1
+
+    batch = {"queries": [{"document_id": doc_id, "question": "uva"}] * 3, "generate": False}
+    assert len(client.post("/query/batch", json=batch).text.splitlines()) == 3
+    assert store.usage[doc_id]["queries"] == 4
+
+
+def test_save_usage_adds_counts_from_every_worker(client):
+    from app.main import store
+    from app.storage import DocumentStore, read_usage
+
+    store.save_usage()
+    before = read_usage().get("compartido", {}).get("queries", 0)
+
+    other = DocumentStore()       # otro worker con su propio `usage`
+    other.record_query("compartido", 2)
+    store.record_query("compartido", 3)
+    other.save_usage()
+    store.save_usage()
+    assert read_usage()["compartido"]["queries"] == before + 5
+
+    store.save_usage()            # guardar de nuevo no vuelve a sumar lo ya guardado
+    assert read_usage()["compartido"]["queries"] == before + 5
+
+    store.invalidate_index("compartido")
+    store.save_usage()
+    assert "compartido" not in read_usage()
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+from app.text_extractor import extract_odt
+from bench.fixtures import make_odt
+
+
+def test_odt_from_path_and_bytes(tmp_path):
+    path = str(tmp_path / "doc.odt")
+    make_odt(path, 300)
+
+    from_path = extract_odt(path)
+    assert len(from_path.split()) >= 250
+
+    before = set(os.listdir(tempfile.gettempdir()))
+    with open(path, "rb") as f:
+        assert extract_odt(f.read()) == from_path
+    # la copia temporal para odfpy no queda en disco
+    assert not [n for n in set(os.listdir(tempfile.gettempdir())) - before if n.endswith(".odt")]
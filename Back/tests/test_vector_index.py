@@ -0,0 +1,110 @@
+import sys
+import threading
+
+import numpy as np
+
+from app import vector_index
+from app.index_format import normalize_rows
+from app.vector_index import IVFIndex
+
+
+def vectors(n: int, seed: int, dim: int = 16) -> np.ndarray:
+    return normalize_rows(np.random.default_rng(seed).standard_normal((n, dim)).astype("float32"))
+
+
+def test_search_during_retrain_and_changes_meanwhile(monkeypatch, tmp_path):
+    index = IVFIndex(str(tmp_path), train_min=100, retrain_factor=1e9)
+    for i in range(4):
+        index.add(f"doc{i}", vectors(50, i))
+
+    training, release = threading.Event(), threading.Event()
+    kmeans = vector_index.kmeans
+
+    def slow_kmeans(x, k):
+        training.set()
+        release.wait(10)
+        return kmeans(x, k)
+
+    monkeypatch.setattr(vector_index, "kmeans", slow_kmeans)
+    worker = threading.Thread(target=index.retrain)
+    worker.start()
+    assert training.wait(10)
+
+    # con el k-means en curso el índice sigue atendiendo
+    late = vectors(30, 99)
+    index.add("tarde", late)
+    index.remove("doc0")
+    assert index.search(late[3], 1)[0][:2] == ("tarde", 3)
+
+    release.set()
+    worker.join(10)
+    assert index.centroids is not None and len(index.lists) > 1
+    hits = index.search(late[3], 1, nprobe=len(index.lists))
+    assert hits[0][:2] == ("tarde", 3)
+    assert "doc0" not in index and index.size == 180
+    assert all(doc_id != "doc0" for doc_id, _, _ in index.search(vectors(50, 0)[0], 10, nprobe=len(index.lists)))
+
+    # la asignación en disco refleja el entrenamiento nuevo
+    reloaded = IVFIndex(str(tmp_path))
+    docs = {"doc1": vectors(50, 1), "doc2": vectors(50, 2), "doc3": vectors(50, 3), "tarde": late}
+    reloaded.load(docs.get)
+    assert len(reloaded.lists) == len(index.lists) and reloaded.size == 180
+
+
+def test_reindexing_does_not_grow_codes(tmp_path):
+    index = IVFIndex(str(tmp_path), train_min=10 ** 6)
+    for i in range(500):
+        index.add("doc", vectors(8, i), persist=False)
+        index.add(f"otro{i % 3}", vectors(8, 1000 + i), persist=False)
+
+    assert index.size == 32
+    assert len(index._doc_ids) < 200 and len(index._alive) == len(index._doc_ids)
+    assert sum(len(lst.docs) + sum(len(b[1]) for b in lst._blocks) for lst in index.lists) < 1000
+    query = vectors(8, 499)[2]
+    assert index.search(query, 1)[0][:2] == ("doc", 2)
+
+
+def test_lists_use_configured_dtype(tmp_path):
+    index = IVFIndex(str(tmp_path), dtype="float16")
+    data = vectors(20, 7)
+    index.add("doc", data)
+    hit = index.search(data[5], 1)[0]
+    assert hit[:2] == ("doc", 5) and abs(hit[2] - 1.0) < 1e-2
+    index.lists[0].compact()
+    assert index.lists[0].vectors.dtype == np.float16
+
+
+def test_search_while_documents_are_removed_and_compacted(tmp_path):
+    interval = sys.getswitchinterval()
+    index = IVFIndex(str(tmp_path), train_min=10 ** 6)
+    keep = vectors(20, 1)
+    index.add("fijo", keep, persist=False)
+    stop, errors = threading.Event(), []
+
+    def churn():
+        # reindexar "fijo" le da un código nuevo; cada baja deja más de un
+        # cuarto muerto, así que compacta y renumera
+        i = 0
+        while not stop.is_set():
+            index.add(f"tmp{i}", vectors(200, 100 + i % 50), persist=False)
+            index.add("fijo", keep, persist=False)
+            index.remove(f"tmp{i}", persist=False)
+            i += 1
+
+    sys.setswitchinterval(1e-6)
+    worker = threading.Thread(target=churn)
+    worker.start()
+    try:
+        for _ in range(3000):
+            try:
+                hit = index.search(keep[0], 1)[0]
+            except Exception as e:     # IndexError con el código ya renumerado
+                errors.append(e)
+                continue
+            if hit[:2] != ("fijo", 0):
+                errors.append(hit)
+    finally:
+        stop.set()
+        worker.join(10)
+        sys.setswitchinterval(interval)
+    assert errors == []
@@ -0,0 +1,80 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app import http_client, warmup as warmup_module
+from app.embeddings import engine
+from app.warmup import Warmup
+from bench.fake_ollama import run_in_thread
+
+
+def old_ollama(model_missing: bool = False):
+    """Ollama sin /api/embed (404 de ruta), o con /api/embed y sin el modelo."""
+    app = FastAPI()
+    app.state.calls = []
+
+    @app.post("/api/chat")
+    async def chat():
+        return {"done": True, "done_reason": "load"}
+
+    @app.post("/api/embed")
+    async def embed():
+        app.state.calls.append("embed")
+        if model_missing:
+            return JSONResponse({"error": "model 'nomic-embed-text' not found"}, status_code=404)
+        return PlainTextResponse("404 page not found", status_code=404)
+
+    @app.post("/api/embeddings")
+    async def embeddings():
+        app.state.calls.append("embeddings")
+        return {"embedding": [0.1, 0.2, 0.3]}
+
+    return app
+
+
+def run_warmup(monkeypatch, app) -> Warmup:
+    base, server = run_in_thread(app)
+    monkeypatch.setattr(warmup_module, "OLLAMA_BASE_URL", base)
+    monkeypatch.setattr(engine, "base_url", base)
+    monkeypatch.setattr(engine, "legacy", False)
+
+    async def main():
+        warm = Warmup()
+        warm.start(models=True, load_indexes=None)
+        try:
+            await asyncio.wait_for(warm._task, 10)
+        finally:
+            await http_client.aclose()   # el cliente es de este loop
+        return warm
+
+    try:
+        return asyncio.run(main())
+    finally:
+        server.should_exit = True
+
+
+def test_falls_back_to_legacy_embeddings(monkeypatch):
+    app = old_ollama()
+    warm = run_warmup(monkeypatch, app)
+
+    assert warm.ready and warm.errors == {}
+    assert app.state.calls == ["embed", "embeddings"]
+    assert engine.legacy
+
+
+def test_missing_model_is_an_error_without_retries(monkeypatch):
+    app = old_ollama(model_missing=True)
+    warm = run_warmup(monkeypatch, app)
+
+    assert not warm.ready
+    assert warm.steps["llm"]["state"] == "done"
+    assert "not found" in warm.errors["embeddings"]
+    assert app.state.calls == ["embed"]
+
+
+def test_keep_alive_is_only_sent_when_configured(monkeypatch):
+    assert "keep_alive" not in http_client.ollama_payload(model="m")
+
+    monkeypatch.setattr(http_client, "OLLAMA_KEEP_ALIVE", "30m")
+    assert http_client.ollama_payload(model="m")["keep_alive"] == "30m"
@@ -3,7 +3,7 @@ import { HelpCircle, X, Send } from 'lucide-react';
 import { Button } from './ui/button';
 import { Textarea } from './ui/textarea';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
-import { fetchDocuments, queryDocument } from '../utils/api';
+import { fetchDocuments, queryDocument, newSessionId, endSession } from '../utils/api';
 
 interface Document {
   id: string;
@@ -28,6 +28,7 @@ export default function FloatingChat() {
   const [selectedDocId, setSelectedDocId] = useState<string>('');
   const [question, setQuestion] = useState('');
   const [messages, setMessages] = useState<Message[]>([]);
+  const [sessionId, setSessionId] = useState(newSessionId);
   const [loading, setLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
@@ -69,7 +70,7 @@ export default function FloatingChat() {
     setLoading(true);
 
     try {
-      const data: QueryResponse = await queryDocument(selectedDocId, sentQuestion);
+      const data: QueryResponse = await queryDocument(selectedDocId, sentQuestion, sessionId);
 
       const assistantMsg: Message = {
         type: 'assistant',
@@ -91,6 +92,15 @@ export default function FloatingChat() {
     }
   };
 
+  // otro documento: conversación nueva (la sesión es de un solo documento)
+  const handleDocumentChange = (docId: string) => {
+    if (docId === selectedDocId) return;
+    if (selectedDocId) endSession(sessionId);
+    setSessionId(newSessionId());
+    setMessages([]);
+    setSelectedDocId(docId);
+  };
+
   const handleKeyPress = (e: React.KeyboardEvent) => {
     if (e.key === "Enter" && !e.shiftKey) {
       e.preventDefault();
@@ -135,7 +145,7 @@ export default function FloatingChat() {
               Documento:
             </label>
 
-            <Select value={selectedDocId} onValueChange={setSelectedDocId}>
+            <Select value={selectedDocId} onValueChange={handleDocumentChange}>
               <SelectTrigger className="dark:bg-gray-800/50 dark:border-cyan-500/50 dark:text-cyan-100">
                 <SelectValue placeholder="Selecciona..." />
               </SelectTrigger>
@@ -4,7 +4,7 @@ import { Button } from '../ui/button';
 import { Textarea } from '../ui/textarea';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '../ui/select';
 import { Card, CardContent, CardHeader, CardTitle } from '../ui/card';
-import { fetchDocuments, queryDocument } from '../../utils/api';
+import { fetchDocuments, queryDocument, newSessionId, endSession } from '../../utils/api';
 
 interface Document {
   id: string;
@@ -28,6 +28,7 @@ export default function ChatPage() {
   const [selectedDocId, setSelectedDocId] = useState<string>('');
   const [question, setQuestion] = useState('');
   const [messages, setMessages] = useState<Message[]>([]);
+  const [sessionId, setSessionId] = useState(newSessionId);
   const [loading, setLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
@@ -64,7 +65,7 @@ export default function ChatPage() {
     setLoading(true);
 
     try {
-const data = await queryDocument(selectedDocId, currentQuestion);
+const data = await queryDocument(selectedDocId, currentQuestion, sessionId);
 
 
       const assistantMessage: Message = {
@@ -85,6 +86,15 @@ const data = await queryDocument(selectedDocId, currentQuestion);
     }
   };
 
+  // otro documento: conversación nueva (la sesión es de un solo documento)
+  const handleDocumentChange = (docId: string) => {
+    if (docId === selectedDocId) return;
+    if (selectedDocId) endSession(sessionId);
+    setSessionId(newSessionId());
+    setMessages([]);
+    setSelectedDocId(docId);
+  };
+
   const handleKeyPress = (e: React.KeyboardEvent) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -100,7 +110,7 @@ const data = await queryDocument(selectedDocId, currentQuestion);
             Documento a consultar:
           </label>
 
-          <Select value={selectedDocId} onValueChange={setSelectedDocId}>
+          <Select value={selectedDocId} onValueChange={handleDocumentChange}>
             <SelectTrigger className="dark:bg-gray-800/50 dark:border-cyan-500/50 dark:text-cyan-100 hover:border-cyan-400 transition-all">
               <SelectValue placeholder="-- Selecciona un documento --" />
             </SelectTrigger>
@@ -47,11 +47,17 @@ export async function fetchDocuments() {
 
   if (!available) return MOCK_DOCUMENTS;
 
-  const res = await fetch(`${API_BASE}/documents`);
-  const data = await res.json();
-
-  // El backend devuelve { documents: [...] }
-  return data.documents || [];
+  // El backend pagina: { documents: [...], total, limit, offset }
+  const documents = [];
+  const limit = 1000;
+  for (let offset = 0; ; offset += limit) {
+    const res = await fetch(`${API_BASE}/documents?limit=${limit}&offset=${offset}`);
+    const data = await res.json();
+    const page = data.documents || [];
+    documents.push(...page);
+    if (page.length < limit || documents.length >= (data.total ?? 0)) break;
+  }
+  return documents;
 }
 
 // ---------- UPLOAD DOCUMENT ----------
@@ -75,13 +81,51 @@ export async function uploadDocument(file: File) {
     body: form,
   });
 
+  if (res.status === 429) throw new Error("Servidor ocupado, reintenta en unos segundos");
   if (!res.ok) throw new Error("Error al subir documento");
 
+  // La ingesta corre en segundo plano: esperamos a que el trabajo termine
+  const job = await waitForJob((await res.json()).id);
+
+  return {
+    id: job.document_id,
+    filename: job.filename,
+    size: job.size ?? 0,
+    n_chunks: job.n_chunks,
+  };
+}
+
+// ---------- INGEST JOBS ----------
+export async function fetchJob(jobId: string) {
+  const res = await fetch(`${API_BASE}/jobs/${jobId}`);
+  if (!res.ok) throw new Error(`Error consultando trabajo (${res.status})`);
   return res.json();
 }
 
+export async function waitForJob(jobId: string, intervalMs = 1000) {
+  while (true) {
+    const job = await fetchJob(jobId);
+    if (job.stage === "done") return job;
+    if (job.stage === "error") throw new Error(job.error || "Error procesando documento");
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+}
+
+// ---------- CHAT SESSIONS ----------
+// Con session_id el backend guarda la conversación: cada pregunta ve las
+// anteriores y Ollama reutiliza el prompt ya evaluado. Una sesión por
+// documento: al cambiar de documento se empieza otra.
+export function newSessionId() {
+  return crypto.randomUUID();
+}
+
+export async function endSession(sessionId: string) {
+  // si ya venció o no existe, no importa
+  await fetch(`${API_BASE}/sessions/${sessionId}`, { method: "DELETE" }).catch(() => null);
+}
+
 // ---------- QUERY DOCUMENT ----------
-export async function queryDocument(id: string, question: string) {
+export async function queryDocument(id: string, question: string, sessionId?: string) {
   console.log("➡️ queryDocument() ejecutado");
   console.log("  - ID:", id);
   console.log("  - Pregunta:", question);
@@ -89,7 +133,7 @@ export async function queryDocument(id: string, question: string) {
   const response = await fetch(`${API_BASE}/query`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ document_id: id, question }),
+    body: JSON.stringify({ document_id: id, question, session_id: sessionId }),
   });
 
   console.log("⬅️ Respuesta HTTP completa:", response);